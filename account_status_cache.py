@@ -0,0 +1,166 @@
+import sqlite3
+import time
+
+## how long each account status is trusted before it is fetched again:
+## a tosViolation is almost never lifted, but open accounts can be closed at any time
+ACCOUNT_STATUS_TTL_SECONDS = {
+    "tosViolation": 365 * 24 * 60 * 60,
+    "closed": 30 * 24 * 60 * 60,
+    "open": 7 * 24 * 60 * 60,
+    "not found": 24 * 60 * 60,
+}
+
+## the least recently used players are evicted above this many players
+MAX_CACHE_SIZE = 10_000_000
+
+## how long a process waits for another process to release its lock on the cache
+BUSY_TIMEOUT_SECONDS = 60
+
+## sqlite limits the number of parameters in a single query
+QUERY_BATCH_SIZE = 500
+
+
+class AccountStatusCache:
+    """
+    The AccountStatusCache class stores account statuses in a SQLite file that persists between runs, with methods:
+    .get_account_statuses to get the account statuses of players that have not expired
+    .set_account_statuses to store newly fetched account statuses
+    .evict to remove the least recently used players above max_size players
+
+    Each player is stored with the status, the time it was fetched and the time it was last used.
+    Players are matched case-insensitively, like lichess user ids. The database uses write-ahead logging
+    and a busy timeout, so several fitting processes can share the same cache file.
+    """
+
+    def __init__(
+        self,
+        cache_path: str,
+        ttl_seconds: dict = None,
+        max_size: int = MAX_CACHE_SIZE,
+    ):
+        self._ttl_seconds = dict(
+            ACCOUNT_STATUS_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        )
+        self._max_size = max_size
+        ## the model fetches account statuses in a background thread, one thread at a time
+        self._connection = sqlite3.connect(
+            cache_path,
+            timeout=BUSY_TIMEOUT_SECONDS,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_SECONDS * 1000}")
+        ## the number of players is kept in a one-row table by triggers, so it is updated in the same transaction
+        ## as every write, by every process sharing the file, and reading it does not count the players
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS account_statuses (
+                    player_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    used_at REAL NOT NULL
+                )"""
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS account_statuses_used_at ON account_statuses (used_at)"
+            )
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS account_statuses_size (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    size INTEGER NOT NULL
+                )"""
+            )
+            ## a cache file written before the size was kept is counted once
+            self._connection.execute(
+                "INSERT OR IGNORE INTO account_statuses_size (id, size) "
+                "SELECT 0, COUNT(*) FROM account_statuses"
+            )
+            self._connection.execute(
+                """CREATE TRIGGER IF NOT EXISTS account_statuses_insert AFTER INSERT ON account_statuses
+                BEGIN UPDATE account_statuses_size SET size = size + 1; END"""
+            )
+            self._connection.execute(
+                """CREATE TRIGGER IF NOT EXISTS account_statuses_delete AFTER DELETE ON account_statuses
+                BEGIN UPDATE account_statuses_size SET size = size - 1; END"""
+            )
+
+    def __len__(self):
+        return self._connection.execute(
+            "SELECT size FROM account_statuses_size"
+        ).fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def get_account_statuses(self, players) -> dict:
+        """Returns the account statuses of the players that are stored and have not expired,
+        keyed by the player names passed, and marks them as used.
+        """
+        player_ids = {}
+        for player in players:
+            player_ids.setdefault(player.lower(), []).append(player)
+
+        now = time.time()
+        account_statuses, used_player_ids = {}, []
+        unique_player_ids = list(player_ids)
+        for batch_start in range(0, len(unique_player_ids), QUERY_BATCH_SIZE):
+            batch_player_ids = unique_player_ids[
+                batch_start : batch_start + QUERY_BATCH_SIZE
+            ]
+            rows = self._connection.execute(
+                "SELECT player_id, status, fetched_at FROM account_statuses "
+                f"WHERE player_id IN ({','.join('?' * len(batch_player_ids))})",
+                batch_player_ids,
+            ).fetchall()
+            for player_id, status, fetched_at in rows:
+                if now - fetched_at > self._ttl_seconds.get(status, 0):
+                    continue
+                used_player_ids.append((now, player_id))
+                for player in player_ids[player_id]:
+                    account_statuses[player] = status
+
+        if not used_player_ids:
+            return account_statuses
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.executemany(
+                "UPDATE account_statuses SET used_at = ? WHERE player_id = ?",
+                used_player_ids,
+            )
+        return account_statuses
+
+    def set_account_statuses(self, account_statuses: dict) -> None:
+        """Stores account statuses keyed by player that were just fetched,
+        then evicts the least recently used players above max_size players in the same transaction.
+        """
+        now = time.time()
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.executemany(
+                "INSERT INTO account_statuses (player_id, status, fetched_at, used_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (player_id) DO UPDATE SET "
+                "status = excluded.status, fetched_at = excluded.fetched_at, used_at = excluded.used_at",
+                [
+                    (player.lower(), status, now, now)
+                    for player, status in account_statuses.items()
+                ],
+            )
+            self._delete_least_recently_used()
+
+    def evict(self) -> None:
+        """Removes the least recently used players above max_size players."""
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._delete_least_recently_used()
+
+    def _delete_least_recently_used(self) -> None:
+        ## called under the write lock, so no other process can add players between reading the size and deleting
+        number_of_players = len(self) - self._max_size
+        if number_of_players > 0:
+            self._connection.execute(
+                "DELETE FROM account_statuses WHERE player_id IN ("
+                "SELECT player_id FROM account_statuses ORDER BY used_at LIMIT ?)",
+                (number_of_players,),
+            )
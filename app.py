@@ -1,31 +1,180 @@
 """
-A sample Hello World server.
+A batch scoring server for the player anomaly detection model.
 """
 
+import argparse
+from collections import deque
 import os
+import time
+import numpy as np
+import pandas as pd
+from flask import Flask, jsonify, request
 
-from flask import Flask, render_template
+from model import NUMBER_OF_RATING_BINS, RATING_BIN_SIZE, PlayerAnomalyDetectionModel
+from player_account_handler import PlayerAccountHandler
+from player_data_io import read_player_features
 
-from model import AnomalyDetectionModel
+## columns of the player features that are needed to score a player
+SCORING_COLUMNS = ["player", "time_control", "mean_perf_diff", "rating_bin"]
 
-# pylint: disable=C0103
-app = Flask(__name__)
+## the latency metrics are calculated over this many of the most recent requests
+LATENCY_WINDOW_SIZE = 10000
 
 
-@app.route("/")
-def hello():
-    """Return a friendly HTTP greeting."""
-    message = "It's running!"
+def score_player_features(
+    model: PlayerAnomalyDetectionModel, player_features: pd.DataFrame
+) -> pd.DataFrame:
+    """Returns is_anomaly, threshold and margin = mean_perf_diff - threshold for each row of player_features,
+    which are missing for rows that cannot be scored (unknown players, time controls or rating bins).
+    """
+    ## rows with a missing or out of range rating bin are not scored, like unknown time controls,
+    ## so that one bad row does not fail the whole batch
+    rating_bins = pd.to_numeric(player_features["rating_bin"], errors="coerce")
+    is_scorable = (
+        player_features["mean_perf_diff"].notna()
+        & (rating_bins >= 0)
+        & (rating_bins < NUMBER_OF_RATING_BINS * RATING_BIN_SIZE)
+    )
+    predictions = model.predict(
+        player_features[is_scorable].assign(rating_bin=rating_bins[is_scorable])
+    )
+    scores = pd.DataFrame(
+        {
+            "player": player_features["player"],
+            "time_control": player_features["time_control"],
+            "is_anomaly": predictions["is_anomaly"],
+            "threshold": pd.Series(
+                model.get_thresholds(predictions), index=predictions.index
+            ),
+        },
+        index=player_features.index,
+    )
+    scores["margin"] = player_features["mean_perf_diff"] - scores["threshold"]
+    return scores
 
-    """Get Cloud Run environment variables."""
-    service = os.environ.get("K_SERVICE", "Unknown service")
-    revision = os.environ.get("K_REVISION", "Unknown revision")
 
-    return render_template(
-        "index.html", message=message, Service=service, Revision=revision
-    )
+def get_columns(scores: pd.DataFrame) -> dict:
+    """Returns the columns of scores as json serializable lists, with None for missing values."""
+    return {
+        column: [
+            None if is_missing else value
+            for value, is_missing in zip(
+                scores[column].tolist(), scores[column].isna().tolist()
+            )
+        ]
+        for column in scores.columns
+    }
+
+
+def create_app(model_file_path, player_features_file_path=None) -> Flask:
+    """Returns the scoring app, which loads the model and the player features once when it is created.
+
+    POST /score with {"players": [{"player": ..., "time_control": ...}, ...]} scores players from the player features,
+    and with {"features": [{"player": ..., "time_control": ..., "mean_perf_diff": ..., "rating_bin": ...}, ...]}
+    scores the feature rows passed. Both return {"predictions": {"player": [...], "time_control": [...],
+    "is_anomaly": [...], "threshold": [...], "margin": [...]}} with one entry per row in the order of the request,
+    as columns are much faster to encode than one object per row.
+    GET /metrics returns the number of requests and rows scored, and the latency percentiles of recent requests.
+    """
+    app = Flask(__name__)
+
+    ## account statuses are not needed to score players
+    model = PlayerAnomalyDetectionModel(PlayerAccountHandler())
+    model.load_model(model_file_path)
+
+    ## the player features are indexed by a single "{player} {time_control}" key,
+    ## which is faster to look up than a MultiIndex (player names cannot contain spaces)
+    player_features = None
+    if player_features_file_path is not None:
+        player_features = read_player_features(
+            player_features_file_path, columns=SCORING_COLUMNS
+        ).astype({"player": str, "time_control": str})
+        player_features.index = pd.Index(
+            player_features["player"] + " " + player_features["time_control"]
+        )
+        player_features = player_features[["mean_perf_diff", "rating_bin"]]
+
+    latencies = deque(maxlen=LATENCY_WINDOW_SIZE)
+    counters = {"number_of_requests": 0, "number_of_rows": 0}
+
+    @app.route("/")
+    def hello():
+        """Return a friendly HTTP greeting."""
+        message = "It's running!"
+
+        """Get Cloud Run environment variables."""
+        service = os.environ.get("K_SERVICE", "Unknown service")
+        revision = os.environ.get("K_REVISION", "Unknown revision")
+
+        return jsonify(message=message, Service=service, Revision=revision)
+
+    @app.route("/score", methods=["POST"])
+    def score():
+        start_time = time.perf_counter()
+        body = request.get_json(silent=True) or {}
+        if "features" in body:
+            rows = pd.DataFrame(body["features"], columns=SCORING_COLUMNS)
+        elif "players" in body:
+            if player_features is None:
+                return jsonify(error="No player features were loaded"), 400
+            rows = pd.DataFrame(body["players"], columns=["player", "time_control"])
+            rows = rows.join(
+                player_features.reindex(
+                    rows["player"] + " " + rows["time_control"]
+                ).reset_index(drop=True)
+            )
+        else:
+            return jsonify(error='The request must contain "players" or "features"'), 400
+
+        try:
+            scores = score_player_features(model, rows)
+        except (ValueError, TypeError) as e:
+            return jsonify(error=str(e)), 400
+        response = jsonify(predictions=get_columns(scores))
+
+        latency = time.perf_counter() - start_time
+        latencies.append(latency)
+        counters["number_of_requests"] += 1
+        counters["number_of_rows"] += len(rows)
+        response.headers["X-Latency-Ms"] = f"{latency * 1000:.3f}"
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        latencies_ms = np.array(latencies) * 1000
+        percentiles = (
+            np.percentile(latencies_ms, [50, 90, 99]).tolist()
+            if len(latencies_ms)
+            else [None] * 3
+        )
+        return jsonify(
+            **counters,
+            p50_latency_ms=percentiles[0],
+            p90_latency_ms=percentiles[1],
+            p99_latency_ms=percentiles[2],
+        )
+
+    return app
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the batch scoring server")
+    parser.add_argument(
+        "--model-file-path",
+        type=str,
+        default=os.environ.get("MODEL_FILE_PATH"),
+        help="Path to a model saved with PlayerAnomalyDetectionModel.save_model",
+    )
+    parser.add_argument(
+        "--player-features-file-path",
+        type=str,
+        default=os.environ.get("PLAYER_FEATURES_FILE_PATH"),
+        help="Path to the CSV (or parquet) file containing player features",
+    )
+    args = parser.parse_args()
+    if args.model_file_path is None:
+        parser.error("--model-file-path or MODEL_FILE_PATH must be set")
+
+    app = create_app(args.model_file_path, args.player_features_file_path)
     server_port = os.environ.get("PORT", "8080")
     app.run(debug=False, port=server_port, host="0.0.0.0")
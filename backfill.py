@@ -0,0 +1,189 @@
+"""
+Downloads and preprocesses every month of the lichess open database in a range of months.
+The next months are downloaded in background threads while the current month is parsed,
+so the download of month N+1 overlaps the parsing of month N.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import os
+import threading
+
+from download_and_preprocess import (
+    LICHESS_DATABASE_URL,
+    download_data,
+    get_database_file_name,
+    get_sha256sums,
+    preprocess_data,
+)
+from pipeline import get_output_file_paths
+from pipeline_metrics import PipelineMetrics, get_default_metrics_file_path
+from player_data_io import FILE_FORMATS
+
+
+def get_months(start_month: str, end_month: str) -> list:
+    """Returns the (year, month) of every month from start_month to end_month, both given as YYYY-MM."""
+    start = datetime.strptime(start_month, "%Y-%m")
+    end = datetime.strptime(end_month, "%Y-%m")
+    if end < start:
+        raise ValueError(f"The end month {end_month} is before the start month {start_month}")
+    return [
+        (year_month // 12, year_month % 12 + 1)
+        for year_month in range(
+            start.year * 12 + start.month - 1, end.year * 12 + end.month
+        )
+    ]
+
+
+def backfill(
+    start_month: str,
+    end_month: str,
+    max_concurrent_downloads=1,
+    output_format="csv",
+    remove_raw_files=False,
+    generate_exploratory_plots=False,
+    database_url=LICHESS_DATABASE_URL,
+    verify_checksums=True,
+    write_metrics=True,
+    min_games_prefilter=False,
+) -> list:
+    """Downloads and preprocesses every month from start_month to end_month, and returns the file names
+    of the months it preprocessed.
+    At most max_concurrent_downloads months are downloaded at once, and at most that many months are
+    downloaded ahead of the month being parsed, so the disk holds at most max_concurrent_downloads + 1
+    raw files. Months are parsed one at a time in order. If a download or a month fails, the pending
+    downloads are cancelled, the running downloads stop after their current block, and the exception
+    is raised without waiting for them; months whose player features were saved
+    are skipped when the backfill is run again, and a partial download is resumed.
+    """
+    ## months whose player features are saved were backfilled by an earlier run
+    months = [
+        (year, month)
+        for year, month in get_months(start_month, end_month)
+        if not os.path.exists(
+            get_output_file_paths(get_database_file_name(year, month), output_format)[1]
+        )
+    ]
+    if not months:
+        return []
+    sha256sums = get_sha256sums(database_url) if verify_checksums else None
+    all_metrics = [
+        PipelineMetrics(
+            get_default_metrics_file_path(
+                f"download_and_preprocess_{year}-{str(month).zfill(2)}"
+            )
+            if write_metrics
+            else None,
+            emit_interval_seconds=60,
+        )
+        for year, month in months
+    ]
+
+    cancelled = threading.Event()
+
+    def download_month(i):
+        year, month = months[i]
+        return download_data(
+            year,
+            month,
+            "lichess-open-database",
+            all_metrics[i],
+            database_url=database_url,
+            sha256sums=sha256sums,
+            verify_checksum=verify_checksums,
+            cancelled=cancelled,
+        )
+
+    filenames = []
+    ## not a with block, whose exit would wait for the running downloads when a month fails
+    executor = ThreadPoolExecutor(max_workers=max_concurrent_downloads)
+    downloads = []
+    try:
+        for i in range(len(months)):
+            ## keep max_concurrent_downloads months downloading ahead of the month being parsed
+            while len(downloads) < min(i + 1 + max_concurrent_downloads, len(months)):
+                downloads.append(executor.submit(download_month, len(downloads)))
+            filename = downloads[i].result()
+            preprocess_data(
+                filename,
+                remove_raw_files,
+                output_format,
+                all_metrics[i],
+                generate_exploratory_plots=generate_exploratory_plots,
+                min_games_prefilter=min_games_prefilter,
+            )
+            filenames.append(filename)
+    except BaseException:
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    return filenames
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download and preprocess a range of months of Lichess data"
+    )
+    parser.add_argument("START_MONTH", type=str, help="First month to backfill, as YYYY-MM")
+    parser.add_argument("END_MONTH", type=str, help="Last month to backfill, as YYYY-MM")
+    parser.add_argument(
+        "--max-concurrent-downloads",
+        type=int,
+        default=1,
+        help="Number of months downloaded at once, ahead of the month being parsed",
+    )
+    parser.add_argument(
+        "--generate-exploratory-plots",
+        action="store_true",
+        help="Generate exploratory plots",
+    )
+    parser.add_argument(
+        "--remove-raw-files",
+        action="store_true",
+        help="Remove raw files after preprocessing",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        default="csv",
+        choices=FILE_FORMATS,
+        help="Format of the raw features and player features files",
+    )
+    parser.add_argument(
+        "--min-games-prefilter",
+        action="store_true",
+        help="Count the games of each player first, and only keep the games of players who can reach MIN_GAMES",
+    )
+    parser.add_argument(
+        "--database-url",
+        type=str,
+        default=LICHESS_DATABASE_URL,
+        help="URL of the directory holding the .pgn.zst files and sha256sums.txt",
+    )
+    parser.add_argument(
+        "--no-verify-checksums",
+        action="store_true",
+        help="Do not check the downloaded files against the published sha256 checksums",
+    )
+    args = parser.parse_args()
+    if args.max_concurrent_downloads < 1:
+        parser.error("--max-concurrent-downloads must be at least 1")
+
+    backfill(
+        args.START_MONTH,
+        args.END_MONTH,
+        max_concurrent_downloads=args.max_concurrent_downloads,
+        output_format=args.output_format,
+        remove_raw_files=args.remove_raw_files,
+        generate_exploratory_plots=args.generate_exploratory_plots,
+        database_url=args.database_url,
+        verify_checksums=not args.no_verify_checksums,
+        min_games_prefilter=args.min_games_prefilter,
+    )
+
+
+if __name__ == "__main__":
+    main()
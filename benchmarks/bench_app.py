@@ -0,0 +1,87 @@
+"""Load tests the batch scoring server locally with a synthetic model and player features table.
+
+Usage: PYTHONPATH=. python3 benchmarks/bench_app.py --number-of-players 1000000 --batch-size 5000 --number-of-requests 200
+"""
+
+import argparse
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+import requests
+from werkzeug.serving import make_server
+
+from app import create_app
+from enums import TimeControl
+from model import PlayerAnomalyDetectionModel
+from player_account_handler import PlayerAccountHandler
+from player_data_io import write_player_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batch scoring server")
+    parser.add_argument("--number-of-players", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--number-of-requests", type=int, default=200)
+    args = parser.parse_args()
+
+    random_generator = np.random.default_rng(0)
+    player_features = pd.DataFrame(
+        {
+            "player": [f"player{i}" for i in range(args.number_of_players)],
+            "time_control": random_generator.choice(
+                TimeControl.ALL.value, args.number_of_players
+            ),
+            "mean_perf_diff": random_generator.normal(0.0, 0.1, args.number_of_players),
+            "mean_rating": random_generator.uniform(
+                800, 2800, args.number_of_players
+            ),
+        }
+    )
+    player_features["rating_bin"] = (
+        player_features["mean_rating"] // 100 * 100
+    ).astype(int)
+
+    with tempfile.TemporaryDirectory() as folder:
+        model = PlayerAnomalyDetectionModel(PlayerAccountHandler())
+        model.is_fitted = True
+        model_file_path = model.save_model("model", folder)
+        player_features_file_path = f"{folder}/player_features.parquet"
+        write_player_features(
+            player_features.set_index(["player", "time_control"]),
+            player_features_file_path,
+        )
+
+        start_time = time.perf_counter()
+        app = create_app(model_file_path, player_features_file_path)
+        print(f"Started the app in {time.perf_counter() - start_time:.2f}s")
+
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}"
+
+        session = requests.Session()
+        latencies = []
+        for _ in range(args.number_of_requests):
+            batch = player_features.sample(
+                args.batch_size, random_state=random_generator.integers(2**31)
+            )
+            body = {"players": batch[["player", "time_control"]].to_dict(orient="records")}
+            start_time = time.perf_counter()
+            response = session.post(f"{url}/score", json=body)
+            latencies.append(time.perf_counter() - start_time)
+            response.raise_for_status()
+
+        latencies_ms = np.array(latencies) * 1000
+        print(
+            f"Client: {args.batch_size} players per request, "
+            f"p50 {np.percentile(latencies_ms, 50):.1f} ms, p99 {np.percentile(latencies_ms, 99):.1f} ms, "
+            f"{args.batch_size * len(latencies) / sum(latencies):.0f} players/s"
+        )
+        print(f"Server: {session.get(f'{url}/metrics').json()}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
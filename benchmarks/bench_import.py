@@ -0,0 +1,76 @@
+"""Measures the cold import time and peak memory of the scoring entry point, each in a fresh python process.
+Scoring (import model, create the model and predict) should not import plotting or progress bar modules.
+
+Usage: PYTHONPATH=. python3 benchmarks/bench_import.py --number-of-runs 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+## each statement is timed in a fresh process, after the python interpreter has started
+ENTRY_POINTS = {
+    "python": "pass",
+    "model": "import model",
+    "scoring": """
+import pandas as pd
+from model import PlayerAnomalyDetectionModel
+from player_account_handler import PlayerAccountHandler
+model = PlayerAnomalyDetectionModel(PlayerAccountHandler())
+model.predict(pd.DataFrame({"player": ["player1"], "time_control": ["blitz"], "mean_perf_diff": [0.2], "rating_bin": [1500]}))
+""",
+    "model_plots": "import model_plots",
+}
+
+## modules that the scoring entry point should not import
+PLOTTING_MODULES = ["plotly", "tqdm", "lichess"]
+
+MEASURE_TEMPLATE = """
+import json, resource, sys, time
+start_time = time.perf_counter()
+exec({statement!r})
+seconds = time.perf_counter() - start_time
+print(json.dumps({{
+    "seconds": seconds,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "plotting_modules": [module for module in {plotting_modules!r} if module in sys.modules],
+}}))
+"""
+
+
+def measure_entry_point(statement: str) -> dict:
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            MEASURE_TEMPLATE.format(
+                statement=statement, plotting_modules=PLOTTING_MODULES
+            ),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold import time and memory")
+    parser.add_argument("--number-of-runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, statement in ENTRY_POINTS.items():
+        measurements = [measure_entry_point(statement) for _ in range(args.number_of_runs)]
+        print(
+            f"{name:>12}: median {np.median([m['seconds'] for m in measurements]) * 1000:7.1f} ms, "
+            f"max rss {max(m['max_rss_mb'] for m in measurements):6.1f} MB, "
+            f"plotting modules imported: {measurements[0]['plotting_modules'] or 'none'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
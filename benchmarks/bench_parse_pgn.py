@@ -0,0 +1,48 @@
+"""Compares games/sec of the header-only scanner against chess.pgn.read_game on a pgn file.
+
+Usage: PYTHONPATH=. python3 benchmarks/bench_parse_pgn.py lichess_downloaded_games/<file>.pgn
+"""
+
+import argparse
+import time
+
+from pandas.testing import assert_frame_equal
+
+from parse_pgn import parse_games
+from player_info_accumulator import PlayerInfoAccumulator
+
+
+def time_parse_games(pgn_file_path, headers_only):
+    """Returns (all_player_info, number of games read, seconds elapsed) for one pass over the file."""
+    all_player_info = PlayerInfoAccumulator()
+    start = time.perf_counter()
+    with open(pgn_file_path, "rb") as pgn:
+        number_of_games_parsed = parse_games(pgn, all_player_info, headers_only)
+    return all_player_info, number_of_games_parsed, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark header-only pgn parsing against chess.pgn.read_game"
+    )
+    parser.add_argument("PGN_FILE_PATH", type=str, help="Path to the PGN file")
+    args = parser.parse_args()
+
+    results = {}
+    for headers_only in [False, True]:
+        all_player_info, number_of_games, seconds = time_parse_games(
+            args.PGN_FILE_PATH, headers_only
+        )
+        results[headers_only] = all_player_info
+        name = "headers only" if headers_only else "read_game"
+        print(
+            f"{name:>12}: {number_of_games} games in {seconds:.2f}s "
+            f"({number_of_games / seconds:,.0f} games/sec)"
+        )
+
+    assert_frame_equal(results[False].to_frame(), results[True].to_frame())
+    print("all_player_info is identical for both parsers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Measures single player lookups in a player feature store of a year of synthetic monthly player features files.
+
+Usage: PYTHONPATH=. python3 benchmarks/bench_player_feature_store.py --number-of-players 500000
+"""
+
+import argparse
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from enums import TimeControl
+from player_data_io import write_player_features
+from player_feature_store import PlayerFeatureStore, add_player_features_partition
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the player feature store")
+    parser.add_argument("--number-of-players", type=int, default=500000)
+    parser.add_argument("--number-of-months", type=int, default=12)
+    parser.add_argument("--number-of-lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    random_generator = np.random.default_rng(0)
+    number_of_players = args.number_of_players
+    with tempfile.TemporaryDirectory() as folder:
+        for month in range(1, args.number_of_months + 1):
+            mean_ratings = random_generator.uniform(800, 2800, number_of_players)
+            player_features = pd.DataFrame(
+                {
+                    "player": [
+                        f"Player{i}"
+                        for i in random_generator.choice(
+                            2 * number_of_players, number_of_players, replace=False
+                        )
+                    ],
+                    "time_control": random_generator.choice(
+                        TimeControl.ALL.value, number_of_players
+                    ),
+                    "number_of_games": random_generator.integers(30, 500, number_of_players),
+                    "mean_perf_diff": random_generator.normal(0.0, 0.1, number_of_players),
+                    "mean_rating": mean_ratings,
+                    "rating_bin": (mean_ratings // 100 * 100).astype(int),
+                }
+            ).set_index(["player", "time_control"])
+            file_path = f"{folder}/lichess_db_standard_rated_2015-{month:02d}_player_features.parquet"
+            write_player_features(player_features, file_path)
+
+            start_time = time.perf_counter()
+            add_player_features_partition(file_path, f"{folder}/store")
+            print(f"Added month {month} in {time.perf_counter() - start_time:.2f}s")
+
+        player_feature_store = PlayerFeatureStore(f"{folder}/store")
+        partition_names = player_feature_store.partition_names
+        players = [
+            f"player{i}"
+            for i in random_generator.integers(2 * number_of_players, size=args.number_of_lookups)
+        ]
+        for name, get_player_features in [
+            (
+                "one month",
+                lambda player: player_feature_store.get_player_features(
+                    player, partition_names[-1:]
+                ),
+            ),
+            (f"{len(partition_names)} months", player_feature_store.get_player_features),
+        ]:
+            get_player_features(players[0])
+            start_time = time.perf_counter()
+            for player in players:
+                get_player_features(player)
+            print(
+                f"Lookup in {name}: {(time.perf_counter() - start_time) / len(players) * 1000:.3f} ms per player"
+            )
+
+
+if __name__ == "__main__":
+    main()
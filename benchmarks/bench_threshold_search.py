@@ -0,0 +1,95 @@
+"""Compares the exact vectorized threshold search against the previous 0.01 step grid search on one large rating bin.
+
+Usage: PYTHONPATH=. python3 benchmarks/bench_threshold_search.py --number-of-players 100000
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from model import search_thresholds
+
+
+def grid_search_thresholds(train_rating_bin_df, account_statuses, account_status_score_map):
+    """Returns (best threshold, best metric) of the previous grid search from 0.15 in 0.01 steps,
+    which re-filters the DataFrame and rebuilds the lists of flagged players and scores at each step.
+    """
+    train_threshold, delta_th = 0.15, 0.01
+    best_threshold, best_train_metric = train_threshold, 0.00
+    while True:
+        all_flagged_players = train_rating_bin_df[
+            train_rating_bin_df["mean_perf_diff"] > train_threshold
+        ]["player"].tolist()
+        number_of_flagged_players = len(all_flagged_players)
+        if number_of_flagged_players == 0:
+            break
+        train_predictions = [account_statuses.get(player) for player in all_flagged_players]
+        train_scores = [account_status_score_map.get(status) for status in train_predictions]
+        train_accuracy = sum(train_scores) / len(train_predictions)
+        train_metric = np.log(number_of_flagged_players + 1) * train_accuracy
+        if train_metric > best_train_metric:
+            best_train_metric = train_metric
+            best_threshold = train_threshold
+        train_threshold += delta_th
+    return best_threshold, best_train_metric
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the model threshold search")
+    parser.add_argument("--number-of-players", type=int, default=100000)
+    args = parser.parse_args()
+
+    random_generator = np.random.default_rng(0)
+    train_rating_bin_df = pd.DataFrame(
+        {
+            "player": [f"player{i}" for i in range(args.number_of_players)],
+            "mean_perf_diff": random_generator.normal(0.0, 0.1, args.number_of_players),
+        }
+    )
+    account_statuses = dict(
+        zip(
+            train_rating_bin_df["player"],
+            random_generator.choice(
+                ["open", "closed", "tosViolation"],
+                args.number_of_players,
+                p=[0.98, 0.01, 0.01],
+            ),
+        )
+    )
+    for player in train_rating_bin_df.loc[
+        train_rating_bin_df["mean_perf_diff"] > 0.3, "player"
+    ]:
+        account_statuses[player] = "tosViolation"
+    account_status_score_map = {"open": 0, "tosViolation": 1, "closed": 0.75}
+
+    start = time.perf_counter()
+    grid_threshold, grid_metric = grid_search_thresholds(
+        train_rating_bin_df, account_statuses, account_status_score_map
+    )
+    grid_seconds = time.perf_counter() - start
+
+    scores = (
+        train_rating_bin_df["player"]
+        .map(account_statuses)
+        .map(account_status_score_map)
+        .to_numpy(dtype=float)
+    )
+    mean_perf_diffs = train_rating_bin_df["mean_perf_diff"].to_numpy()
+    start = time.perf_counter()
+    threshold_curve = search_thresholds(mean_perf_diffs, scores, min_threshold=0.10)
+    best_index = threshold_curve["metric"].to_numpy().argmax()
+    exact_seconds = time.perf_counter() - start
+
+    print(
+        f"grid search:  threshold {grid_threshold:.4f}, metric {grid_metric:.4f} in {grid_seconds * 1000:.1f} ms"
+    )
+    print(
+        f"exact search: threshold {threshold_curve['threshold'].iloc[best_index]:.4f}, "
+        f"metric {threshold_curve['metric'].iloc[best_index]:.4f} in {exact_seconds * 1000:.1f} ms "
+        f"({len(threshold_curve)} thresholds evaluated)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Times each stage of the pipeline on a synthetic pgn file: parse_pgn, make_player_features,
+PlayerAnomalyDetectionModel.fit (with account statuses from a stub instead of the lichess api) and predict.
+
+Each stage runs in a fresh python process, so the peak memory reported is that of the stage alone,
+and reads the output of the previous stage from disk like the command line scripts do.
+The results are saved to benchmarks/results/<commit>.json, and --compare-to prints the change
+from the results of another commit.
+
+Usage: PYTHONPATH=. python3 benchmarks/run_benchmarks.py --number-of-games 200000 --compare-to benchmarks/results/<commit>.json
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import zlib
+
+from benchmarks.synthetic_pgn import write_synthetic_pgn
+from enums import Folders
+from player_account_handler import PlayerAccountHandler
+
+DEFAULT_RESULTS_FOLDER = "benchmarks/results"
+
+## proportions of players given each account status by the stub account handler
+STUB_ACCOUNT_STATUS_PROPORTIONS = {"tosViolation": 0.05, "closed": 0.05}
+
+
+class StubPlayerAccountHandler(PlayerAccountHandler):
+    """
+    The StubPlayerAccountHandler class assigns each player a fixed account status based on a hash of their name,
+    so that the model can be fit without making requests to the lichess api.
+    """
+
+    def update_player_account_statuses(self, players, print_progress=True) -> None:
+        for player in players:
+            fraction = zlib.crc32(str(player).encode()) / 2**32
+            status = "open"
+            for account_status, proportion in STUB_ACCOUNT_STATUS_PROPORTIONS.items():
+                if fraction < proportion:
+                    status = account_status
+                    break
+                fraction -= proportion
+            self._account_statuses[player] = status
+
+
+def get_peak_rss_mb() -> float:
+    """Returns the peak resident memory of this process and its finished child processes in MB."""
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    ) / 1024
+
+
+def run_parse_pgn(pgn_file_path, headers_only, n_jobs, output_format) -> dict:
+    from parse_pgn import parse_pgn
+    from player_data_io import read_raw_games
+
+    start_time, start_cpu_time = time.perf_counter(), time.process_time()
+    parse_pgn(pgn_file_path, headers_only, n_jobs, output_format)
+    seconds, cpu_seconds = time.perf_counter() - start_time, time.process_time() - start_cpu_time
+
+    base_file_name = os.path.basename(pgn_file_path).split(".")[0]
+    raw_games_file_path = os.path.abspath(
+        f"{Folders.LICHESS_PLAYER_DATA.value}/{base_file_name}.{output_format}"
+    )
+    return {
+        "seconds": seconds,
+        "cpu_seconds": cpu_seconds,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "output_rows": len(read_raw_games(raw_games_file_path, columns=["player"])),
+        "output_file_path": raw_games_file_path,
+    }
+
+
+def run_make_player_features(raw_games_file_path, output_format) -> dict:
+    from make_player_features import make_player_features
+    from player_data_io import read_player_features
+
+    start_time, start_cpu_time = time.perf_counter(), time.process_time()
+    make_player_features(raw_games_file_path, output_format)
+    seconds, cpu_seconds = time.perf_counter() - start_time, time.process_time() - start_cpu_time
+
+    base_file_name = os.path.basename(raw_games_file_path).split(".")[0]
+    player_features_file_path = os.path.abspath(
+        f"{Folders.LICHESS_PLAYER_DATA.value}/{base_file_name}_player_features.{output_format}"
+    )
+    return {
+        "seconds": seconds,
+        "cpu_seconds": cpu_seconds,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "output_rows": len(read_player_features(player_features_file_path)),
+        "output_file_path": player_features_file_path,
+    }
+
+
+def run_fit(player_features_file_path, n_jobs) -> dict:
+    from model import PlayerAnomalyDetectionModel
+    from player_data_io import read_player_features
+
+    train_data = read_player_features(player_features_file_path).reset_index()
+    model = PlayerAnomalyDetectionModel(StubPlayerAccountHandler())
+    start_time, start_cpu_time = time.perf_counter(), time.process_time()
+    model.fit(train_data, generate_plots=False, n_jobs=n_jobs)
+    seconds, cpu_seconds = time.perf_counter() - start_time, time.process_time() - start_cpu_time
+    return {
+        "seconds": seconds,
+        "cpu_seconds": cpu_seconds,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "output_file_path": os.path.abspath(
+            model.save_model(saved_models_folder=Folders.SAVED_MODELS.value)
+        ),
+    }
+
+
+def run_predict(model_file_path, player_features_file_path) -> dict:
+    from model import PlayerAnomalyDetectionModel
+    from player_data_io import read_player_features
+
+    test_data = read_player_features(player_features_file_path).reset_index()
+    model = PlayerAnomalyDetectionModel(StubPlayerAccountHandler())
+    model.load_model(model_file_path)
+    start_time, start_cpu_time = time.perf_counter(), time.process_time()
+    predictions = model.predict(test_data)
+    seconds, cpu_seconds = time.perf_counter() - start_time, time.process_time() - start_cpu_time
+    return {
+        "seconds": seconds,
+        "cpu_seconds": cpu_seconds,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "number_of_anomalies": int(predictions["is_anomaly"].sum()),
+    }
+
+
+def run_stage(function, *args) -> dict:
+    """Runs function(*args) in a fresh python process started in the current folder."""
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return executor.submit(function, *args).result()
+
+
+def get_commit() -> str:
+    """Returns the current git commit, with a -dirty suffix if there are uncommitted changes."""
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+    ).stdout.strip()
+    is_dirty = subprocess.run(
+        ["git", "status", "--porcelain", "--untracked-files=no"],
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+    return f"{commit or 'unknown'}{'-dirty' if is_dirty else ''}"
+
+
+def run_benchmarks(
+    number_of_games: int, seed: int = 0, headers_only=True, n_jobs=1, output_format="parquet"
+) -> dict:
+    """Runs every stage on a synthetic pgn file of number_of_games games in a temporary folder,
+    and returns the time, rate and peak memory of each stage.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        pgn_file_path = f"{folder}/synthetic.pgn"
+        write_synthetic_pgn(pgn_file_path, number_of_games, seed=seed)
+        pgn_file_size_mb = os.path.getsize(pgn_file_path) / 2**20
+
+        ## the stages write to lichess_player_data and saved_models relative to the working folder
+        working_folder = os.getcwd()
+        os.chdir(folder)
+        os.mkdir(Folders.SAVED_MODELS.value)
+        try:
+            stages = {}
+            stages["parse_pgn"] = run_stage(
+                run_parse_pgn, pgn_file_path, headers_only, n_jobs, output_format
+            )
+            stages["parse_pgn"]["games"] = number_of_games
+            stages["parse_pgn"]["games_per_second"] = (
+                number_of_games / stages["parse_pgn"]["seconds"]
+            )
+            stages["parse_pgn"]["mb_per_second"] = (
+                pgn_file_size_mb / stages["parse_pgn"]["seconds"]
+            )
+
+            stages["make_player_features"] = run_stage(
+                run_make_player_features,
+                stages["parse_pgn"]["output_file_path"],
+                output_format,
+            )
+            stages["make_player_features"]["rows"] = stages["parse_pgn"]["output_rows"]
+
+            player_features_file_path = stages["make_player_features"]["output_file_path"]
+            stages["fit"] = run_stage(run_fit, player_features_file_path, n_jobs)
+            stages["predict"] = run_stage(
+                run_predict, stages["fit"]["output_file_path"], player_features_file_path
+            )
+            for stage in ["fit", "predict"]:
+                stages[stage]["rows"] = stages["make_player_features"]["output_rows"]
+        finally:
+            os.chdir(working_folder)
+
+    for stage in stages.values():
+        stage.pop("output_file_path", None)
+        if "rows" in stage:
+            stage["rows_per_second"] = stage["rows"] / stage["seconds"]
+
+    return {
+        "commit": get_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {
+            "number_of_games": number_of_games,
+            "seed": seed,
+            "headers_only": headers_only,
+            "n_jobs": n_jobs,
+            "output_format": output_format,
+            "pgn_file_size_mb": pgn_file_size_mb,
+        },
+        "stages": stages,
+    }
+
+
+def print_results(results: dict, previous_results: dict = None) -> None:
+    print(f"commit {results['commit']}, {results['parameters']['number_of_games']} games")
+    for name, stage in results["stages"].items():
+        rate = (
+            f"{stage['games_per_second']:12,.0f} games/s"
+            if "games_per_second" in stage
+            else f"{stage['rows_per_second']:13,.0f} rows/s"
+        )
+        line = f"{name:>22}: {stage['seconds']:8.2f}s {rate}, peak rss {stage['peak_rss_mb']:7.1f} MB"
+        if previous_results is not None and name in previous_results["stages"]:
+            previous_stage = previous_results["stages"][name]
+            line += (
+                f" | {previous_stage['seconds'] / stage['seconds']:5.2f}x speed, "
+                f"{stage['peak_rss_mb'] - previous_stage['peak_rss_mb']:+7.1f} MB "
+                f"vs {previous_results['commit']}"
+            )
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline stages on a synthetic pgn file"
+    )
+    parser.add_argument("--number-of-games", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--read-moves",
+        action="store_true",
+        help="Parse every game with chess.pgn.read_game instead of only reading the headers",
+    )
+    parser.add_argument("--n-jobs", type=int, default=1)
+    parser.add_argument("--output-format", type=str, default="parquet")
+    parser.add_argument("--results-folder", type=str, default=DEFAULT_RESULTS_FOLDER)
+    parser.add_argument(
+        "--compare-to",
+        type=str,
+        default=None,
+        help="Path to the results of another commit to compare with",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.number_of_games,
+        args.seed,
+        headers_only=not args.read_moves,
+        n_jobs=args.n_jobs,
+        output_format=args.output_format,
+    )
+    previous_results = None
+    if args.compare_to is not None:
+        with open(args.compare_to) as f:
+            previous_results = json.load(f)
+    print_results(results, previous_results)
+
+    os.makedirs(args.results_folder, exist_ok=True)
+    results_file_path = f"{args.results_folder}/{results['commit']}.json"
+    with open(results_file_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved the results to {results_file_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Generates a deterministic synthetic pgn file with lichess style headers, for benchmarks and tests.
+
+Games are played between a fixed pool of players, each of whom plays most of their games in one time control,
+so that many (player, time control) pairs reach MIN_GAMES. Like the lichess database, some games have unknown
+players or ratings ("?"), some have no rating difference, some are unfinished ("*"), and new players start
+with a provisional rating of 1500.
+
+Usage: PYTHONPATH=. python3 benchmarks/synthetic_pgn.py lichess_downloaded_games/synthetic.pgn --number-of-games 100000
+"""
+
+import argparse
+import random
+import pyzstd
+
+## (Event, TimeControl) of each kind of game, chosen in proportion to the weights
+EVENTS = [
+    ("Rated Bullet game", ["60+0", "120+1"], 0.30),
+    ("Rated Blitz game", ["180+0", "180+2", "300+0", "300+3"], 0.40),
+    ("Rated Rapid game", ["600+0", "600+5", "900+10"], 0.20),
+    ("Rated Classical game", ["1800+0", "1800+20"], 0.07),
+    ("Rated Correspondence game", ["-"], 0.03),
+]
+
+## probabilities of the cases that parse_pgn skips
+UNKNOWN_PLAYER_PROBABILITY = 0.002
+UNKNOWN_RATING_PROBABILITY = 0.002
+MISSING_RATING_DIFF_PROBABILITY = 0.01
+UNFINISHED_GAME_PROBABILITY = 0.005
+
+## each player plays this proportion of their games in their favourite time control
+FAVOURITE_TIME_CONTROL_PROBABILITY = 0.8
+
+PROVISIONAL_RATING = 1500
+
+MOVETEXT = (
+    "1. e4 {{ [%clk 0:03:00] }} 1... e5 {{ [%clk 0:03:00] }} 2. Nf3 {{ [%clk 0:02:58] }} "
+    "2... Nc6 {{ [%clk 0:02:57] }} 3. Bb5 {{ [%clk 0:02:55] }} 3... a6 {{ [%clk 0:02:54] }} {result}"
+)
+
+
+def generate_games(number_of_games: int, number_of_players: int = None, seed: int = 0):
+    """Yields the text of number_of_games games, which only depends on the arguments.
+    By default there are about 25 games per player, so most players reach MIN_GAMES in their favourite time control.
+    """
+    random_generator = random.Random(seed)
+    if number_of_players is None:
+        number_of_players = max(2, number_of_games // 25)
+
+    event_weights = [weight for _, _, weight in EVENTS]
+    players = [f"Player{i}" for i in range(number_of_players)]
+    favourite_events = random_generator.choices(
+        range(len(EVENTS)), weights=event_weights, k=number_of_players
+    )
+    ## ratings are only known once a player has played a game in a time control
+    ratings = {}
+    ## a higher skill wins more often than the ratings predict, i.e. a higher mean_perf_diff
+    skills = [random_generator.gauss(0, 0.1) for _ in range(number_of_players)]
+
+    for game_number in range(number_of_games):
+        white, black = random_generator.sample(range(number_of_players), 2)
+        if random_generator.random() < FAVOURITE_TIME_CONTROL_PROBABILITY:
+            event_index = favourite_events[white]
+        else:
+            event_index = random_generator.choices(
+                range(len(EVENTS)), weights=event_weights
+            )[0]
+        event, time_controls, _ = EVENTS[event_index]
+
+        white_rating = ratings.get((white, event_index), PROVISIONAL_RATING)
+        black_rating = ratings.get((black, event_index), PROVISIONAL_RATING)
+        expected_score = 1 / (1 + 10 ** ((black_rating - white_rating) / 400))
+        win_probability = min(
+            max(expected_score + skills[white] - skills[black], 0.02), 0.98
+        )
+        draw = random_generator.random() < 0.05
+        white_score = (
+            0.5 if draw else 1 if random_generator.random() < win_probability else 0
+        )
+        white_gain = round(20 * (white_score - expected_score))
+        ratings[(white, event_index)] = white_rating + white_gain
+        ratings[(black, event_index)] = black_rating - white_gain
+        result = {1: "1-0", 0.5: "1/2-1/2", 0: "0-1"}[white_score]
+
+        headers = {
+            "Event": event,
+            "Site": f"https://lichess.org/{game_number:08d}",
+            "Date": "2015.01.01",
+            "Round": "-",
+            "White": players[white],
+            "Black": players[black],
+            "Result": result,
+            "UTCDate": "2015.01.01",
+            "UTCTime": f"{game_number // 3600 % 24:02d}:{game_number // 60 % 60:02d}:{game_number % 60:02d}",
+            "WhiteElo": str(white_rating),
+            "BlackElo": str(black_rating),
+            "WhiteRatingDiff": f"{white_gain:+d}",
+            "BlackRatingDiff": f"{-white_gain:+d}",
+            "ECO": "C60",
+            "Opening": "Ruy Lopez: Morphy Defense",
+            "TimeControl": random_generator.choice(time_controls),
+            "Termination": "Normal",
+        }
+        if random_generator.random() < UNKNOWN_PLAYER_PROBABILITY:
+            headers["Black"] = "?"
+        if random_generator.random() < UNKNOWN_RATING_PROBABILITY:
+            headers["WhiteElo"] = "?"
+        if random_generator.random() < MISSING_RATING_DIFF_PROBABILITY:
+            del headers["WhiteRatingDiff"], headers["BlackRatingDiff"]
+        if random_generator.random() < UNFINISHED_GAME_PROBABILITY:
+            headers["Result"] = "*"
+
+        header_lines = "".join(f'[{tag} "{value}"]\n' for tag, value in headers.items())
+        yield f"{header_lines}\n{MOVETEXT.format(result=headers['Result'])}\n\n"
+
+
+def write_synthetic_pgn(
+    PGN_FILE_PATH, number_of_games: int, number_of_players: int = None, seed: int = 0
+) -> None:
+    """Writes generate_games to a .pgn file, or a .pgn.zst file which is compressed as it is written."""
+    if str(PGN_FILE_PATH).endswith(".zst"):
+        f = pyzstd.ZstdFile(PGN_FILE_PATH, "wb")
+    else:
+        f = open(PGN_FILE_PATH, "wb")
+    with f:
+        for game in generate_games(number_of_games, number_of_players, seed):
+            f.write(game.encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic lichess pgn file")
+    parser.add_argument(
+        "PGN_FILE_PATH", type=str, help="Path to the PGN (or .pgn.zst) file to write"
+    )
+    parser.add_argument("--number-of-games", type=int, default=100000)
+    parser.add_argument("--number-of-players", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_synthetic_pgn(
+        args.PGN_FILE_PATH, args.number_of_games, args.number_of_players, args.seed
+    )
+
+
+if __name__ == "__main__":
+    main()
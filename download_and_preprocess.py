@@ -1,91 +1,233 @@
 import argparse
+from concurrent.futures import CancelledError
+import hashlib
 import os
-import re
 from pathlib import Path
-import subprocess
-import pyzstd
+import threading
+import requests
 
 from enums import Folders
+from parse_pgn import get_checkpoint_file_path
+from pipeline import preprocess_pgn
+from pipeline_metrics import PipelineMetrics, get_default_metrics_file_path
+from player_data_io import FILE_FORMATS
 
+LICHESS_DATABASE_URL = "https://database.lichess.org/standard"
 
-def download_data(year, month, source):
+## the lichess open database publishes the sha256 checksum of every file in this file
+SHA256SUMS_FILE_NAME = "sha256sums.txt"
+
+## downloads are streamed to disk in blocks of this size, and an interrupted download
+## is resumed from the end of the partial file up to DOWNLOAD_RETRIES times
+DOWNLOAD_BLOCK_SIZE = 2**20
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_TIMEOUT_SECONDS = 60
+
+
+def get_database_file_name(year, month) -> str:
+    """Returns the name of the .pgn.zst file of a month of the lichess open database."""
+    return f"lichess_db_standard_rated_{year}-{str(month).zfill(2)}.pgn.zst"
+
+
+def get_sha256sums(database_url=LICHESS_DATABASE_URL) -> dict:
+    """Returns the published sha256 checksum of each file of the lichess open database, by file name."""
+    response = requests.get(
+        f"{database_url}/{SHA256SUMS_FILE_NAME}", timeout=DOWNLOAD_TIMEOUT_SECONDS
+    )
+    response.raise_for_status()
+    sha256sums = {}
+    for line in response.text.splitlines():
+        if line.strip():
+            sha256, file_name = line.split(maxsplit=1)
+            sha256sums[file_name.lstrip("*")] = sha256.lower()
+    return sha256sums
+
+
+def download_file(
+    url, file_path, expected_sha256: str = None, cancelled: threading.Event = None
+) -> int:
+    """Downloads url to file_path through a {file_path}.part file, and returns the size of the file in bytes.
+    If the .part file exists, e.g. from an interrupted run, or the connection drops, the download resumes
+    from the end of the .part file with an HTTP range request. If expected_sha256 is passed and the checksum
+    of the downloaded file is different, the .part file is removed and ValueError is raised.
+    If the cancelled event is set, the download stops after the current block and raises CancelledError,
+    keeping the .part file so that the download can be resumed.
+    """
+    part_file_path = f"{file_path}.part"
+    sha256 = hashlib.sha256()
+    number_of_bytes = 0
+    if os.path.exists(part_file_path):
+        with open(part_file_path, "rb") as f:
+            while block := f.read(DOWNLOAD_BLOCK_SIZE):
+                sha256.update(block)
+                number_of_bytes += len(block)
+
+    with requests.Session() as session:
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            headers = {"Range": f"bytes={number_of_bytes}-"} if number_of_bytes else {}
+            try:
+                if cancelled is not None and cancelled.is_set():
+                    raise CancelledError(f"The download of {url} was cancelled")
+                with session.get(
+                    url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT_SECONDS
+                ) as response:
+                    ## the .part file is already complete
+                    if response.status_code == 416:
+                        break
+                    response.raise_for_status()
+                    ## a server that ignores the range sends the whole file again
+                    if response.status_code != 206:
+                        sha256, number_of_bytes = hashlib.sha256(), 0
+                    with open(part_file_path, "ab" if number_of_bytes else "wb") as f:
+                        for block in response.iter_content(DOWNLOAD_BLOCK_SIZE):
+                            f.write(block)
+                            sha256.update(block)
+                            number_of_bytes += len(block)
+                            if cancelled is not None and cancelled.is_set():
+                                raise CancelledError(
+                                    f"The download of {url} was cancelled after {number_of_bytes} bytes"
+                                )
+                break
+            except (
+                requests.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+                requests.Timeout,
+            ) as e:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                print(f"Resuming the download of {url} after {number_of_bytes} bytes ({e})")
+
+    if expected_sha256 is not None and sha256.hexdigest() != expected_sha256:
+        os.remove(part_file_path)
+        raise ValueError(
+            f"The sha256 checksum of {url} is {sha256.hexdigest()}, expected {expected_sha256}"
+        )
+    os.replace(part_file_path, file_path)
+    return number_of_bytes
+
+
+def download_data(
+    year,
+    month,
+    source,
+    metrics: PipelineMetrics = None,
+    database_url=LICHESS_DATABASE_URL,
+    sha256sums: dict = None,
+    verify_checksum=True,
+    cancelled: threading.Event = None,
+):
+    """Downloads the .pgn.zst file of a month of the lichess open database to the lichess_downloaded_games
+    directory, unless it was already downloaded, and returns its file name. Unless verify_checksum=False,
+    the file is checked against the published sha256 checksums, which are fetched unless sha256sums is passed.
+    Setting the cancelled event stops the download, see download_file.
+    """
     if source != "lichess-open-database":
         raise ValueError(
             "Source must be lichess-open-database. Support for additional sources will be added in the future."
         )
 
-    year = str(year)
-    month = str(month).zfill(2)
-    url = f"https://database.lichess.org/standard/lichess_db_standard_rated_{year}-{month}.pgn.zst"
-    filename = f"lichess_db_standard_rated_{year}-{month}.pgn.zst"
-    if not os.path.exists(Folders.LICHESS_DOWNLOADED_GAMES.value):
-        os.mkdir(Folders.LICHESS_DOWNLOADED_GAMES.value)
-
-    # Check file size before downloading
-    response = subprocess.run(
-        ["wget", "--spider", "--server-response", url],
-        stderr=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-    )
-    # print(f"response: {response}")
-    result = re.search("Content-Length: (.*)\n", response.stderr.decode())
-    content_length = result.group(1) if result else None
-    download_file_size = int(content_length) if content_length.isdigit() else None
-
-    # Warn user if file size exceeds 1 GB
-    if download_file_size and download_file_size > 10**9:
-        user_response = input(
-            "Warning: File size exceeds 1GB. Do you want to proceed with the download? (Y/N): "
+    filename = get_database_file_name(year, month)
+    file_path = f"{Folders.LICHESS_DOWNLOADED_GAMES.value}/{filename}"
+    os.makedirs(Folders.LICHESS_DOWNLOADED_GAMES.value, exist_ok=True)
+    if os.path.exists(file_path):
+        print(f"{file_path} is already downloaded")
+        return filename
+
+    expected_sha256 = None
+    if verify_checksum:
+        if sha256sums is None:
+            sha256sums = get_sha256sums(database_url)
+        if filename not in sha256sums:
+            raise ValueError(f"{filename} has no published sha256 checksum")
+        expected_sha256 = sha256sums[filename]
+
+    if metrics is None:
+        metrics = PipelineMetrics()
+    with metrics.stage("download"):
+        print(f"Downloading {filename}...")
+        metrics.set_counts(
+            bytes=download_file(
+                f"{database_url}/{filename}", file_path, expected_sha256, cancelled
+            )
         )
-        if user_response.lower() != "y":
-            print("Download aborted.")
-            return None
-        else:
-            subprocess.run(["wget", url, "-P", Folders.LICHESS_DOWNLOADED_GAMES.value])
-    else:
-        subprocess.run(["wget", url, "-P", Folders.LICHESS_DOWNLOADED_GAMES.value])
 
     return filename
 
 
-def preprocess_data(filename, remove_raw_files):
-    """This function calls parse_pgn.py and make_player_features.py with pgn and csv filepaths"""
-
+def preprocess_data(
+    filename,
+    remove_raw_files,
+    output_format="csv",
+    metrics: PipelineMetrics = None,
+    generate_exploratory_plots=False,
+    min_games_prefilter=False,
+):
+    """This function runs the parse_pgn, make_player_features and (optionally) make_exploratory_plots stages
+    on the downloaded .pgn.zst file in this process, and saves the raw features and player features files
+    """
     BASE_FILE_NAME = Path(filename).stem.split(".")[
         0
     ]  ## removes .pgn.zst from extension
-    PGN_FILE_PATH = f"{Folders.LICHESS_DOWNLOADED_GAMES.value}/{BASE_FILE_NAME}.pgn"
     ZST_FILE_PATH = f"{Folders.LICHESS_DOWNLOADED_GAMES.value}/{BASE_FILE_NAME}.pgn.zst"
 
-    # decompress .pgn.zst and save as .pgn
-    with open(ZST_FILE_PATH, "rb") as f_in:
-        compressed_data = f_in.read()
+    # the .pgn.zst file is decompressed in chunks while it is parsed
+    preprocess_pgn(
+        ZST_FILE_PATH,
+        output_format=output_format,
+        save_raw_games=True,
+        save_player_features=True,
+        generate_exploratory_plots=generate_exploratory_plots,
+        metrics=metrics,
+        checkpoint_file_path=get_checkpoint_file_path(ZST_FILE_PATH),
+        min_games_prefilter=min_games_prefilter,
+    )
 
-    decompressed_data = pyzstd.decompress(compressed_data)
+    # Remove the downloaded .pgn.zst file
+    if remove_raw_files:
+        print("Cleaning up downloaded files...")
+        os.remove(ZST_FILE_PATH)
 
-    with open(PGN_FILE_PATH, "wb") as f_out:
-        f_out.write(decompressed_data)
 
-    subprocess.run(["python3", "parse_pgn.py", PGN_FILE_PATH])
+def stream_and_preprocess_data(
+    year,
+    month,
+    source,
+    remove_raw_files,
+    output_format="csv",
+    metrics: PipelineMetrics = None,
+    generate_exploratory_plots=False,
+    database_url=LICHESS_DATABASE_URL,
+):
+    """This function parses the .pgn.zst file of a month of the lichess open database while it is downloaded,
+    so nothing needs to be written to disk before parsing, and saves the raw features and player features files.
+    Unless remove_raw_files=True, the downloaded .pgn.zst file is also saved to lichess_downloaded_games as it is read.
+    The file is checked against its published sha256 checksum once it is fully read.
+    """
+    if source != "lichess-open-database":
+        raise ValueError(
+            "Source must be lichess-open-database. Support for additional sources will be added in the future."
+        )
 
-    CSV_RAW_FEATURES_FILE_PATH = (
-        f"{Folders.LICHESS_PLAYER_DATA.value}/{BASE_FILE_NAME}.csv"
-    )
-    subprocess.run(["python3", "make_player_features.py", CSV_RAW_FEATURES_FILE_PATH])
+    filename = get_database_file_name(year, month)
+    sha256sums = get_sha256sums(database_url)
+    if filename not in sha256sums:
+        raise ValueError(f"{filename} has no published sha256 checksum")
+    tee_file_path = None
+    if not remove_raw_files:
+        os.makedirs(Folders.LICHESS_DOWNLOADED_GAMES.value, exist_ok=True)
+        tee_file_path = f"{Folders.LICHESS_DOWNLOADED_GAMES.value}/{filename}"
 
-    ## make exploratory plots
-    CSV_PLAYER_FEATURE_FILE_PATH = (
-        f"{Folders.LICHESS_PLAYER_DATA.value}/{BASE_FILE_NAME}_player_features.csv"
+    preprocess_pgn(
+        f"{database_url}/{filename}",
+        output_format=output_format,
+        save_raw_games=True,
+        save_player_features=True,
+        generate_exploratory_plots=generate_exploratory_plots,
+        metrics=metrics,
+        tee_file_path=tee_file_path,
+        expected_sha256=sha256sums[filename],
     )
-    subprocess.run(
-        ["python3", "make_exploratory_plots.py", CSV_PLAYER_FEATURE_FILE_PATH]
-    )
-
-    # Remove the downloaded .pgn.zst and .pgn files
-    if remove_raw_files:
-        print("Cleaning up downloaded files...")
-        os.remove(PGN_FILE_PATH)
-        os.remove(ZST_FILE_PATH)
+    return filename
 
 
 def main():
@@ -109,10 +251,60 @@ def main():
         action="store_true",
         help="Remove raw files after preprocessing",
     )
+    parser.add_argument(
+        "--min-games-prefilter",
+        action="store_true",
+        help="Count the games of each player first, and only keep the games of players who can reach MIN_GAMES",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse the file while it is downloaded instead of downloading it first",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        default="csv",
+        choices=FILE_FORMATS,
+        help="Format of the raw features and player features files",
+    )
+    parser.add_argument(
+        "--metrics-file-path",
+        type=str,
+        default=None,
+        help="Path to the json file of pipeline metrics, by default a new file in pipeline_metrics",
+    )
     args = parser.parse_args()
+    if args.stream and args.min_games_prefilter:
+        parser.error("--min-games-prefilter reads the file twice, so it cannot be used with --stream")
 
-    filename = download_data(args.year, args.month, args.source)
-    preprocess_data(filename, args.remove_raw_files)
+    metrics = PipelineMetrics(
+        args.metrics_file_path
+        or get_default_metrics_file_path(
+            f"download_and_preprocess_{args.year}-{str(args.month).zfill(2)}"
+        ),
+        emit_interval_seconds=60,
+    )
+    if args.stream:
+        stream_and_preprocess_data(
+            args.year,
+            args.month,
+            args.source,
+            args.remove_raw_files,
+            args.output_format,
+            metrics,
+            generate_exploratory_plots=args.generate_exploratory_plots,
+        )
+        return
+    filename = download_data(args.year, args.month, args.source, metrics)
+    preprocess_data(
+        filename,
+        args.remove_raw_files,
+        args.output_format,
+        metrics,
+        generate_exploratory_plots=args.generate_exploratory_plots,
+        min_games_prefilter=args.min_games_prefilter,
+    )
 
 
 if __name__ == "__main__":
@@ -20,3 +20,4 @@ class Folders(Enum):
     MODEL_PLOTS = "model_plots"
     SAVED_MODELS = "saved_models"
     EXPLORATORY_PLOTS = "exploratory_plots"
+    PIPELINE_METRICS = "pipeline_metrics"
@@ -0,0 +1,99 @@
+from array import array
+import hashlib
+import numpy as np
+
+from make_player_features import MIN_GAMES
+
+## the sketch has GAME_COUNT_SKETCH_DEPTH rows of at most GAME_COUNT_SKETCH_WIDTH one byte counters,
+## so it uses at most width * depth bytes (64 MB) however many players the pgn file has
+GAME_COUNT_SKETCH_WIDTH = 2**24
+GAME_COUNT_SKETCH_DEPTH = 4
+MIN_GAME_COUNT_SKETCH_WIDTH = 2**16
+
+## even compressed, a game takes at least this many bytes, which bounds the number of
+## (player, time control) keys of a pgn file by its size
+MIN_BYTES_PER_GAME = 32
+
+## each row maps a 64-bit key hash to a counter by multiply-shift hashing with its own odd multiplier
+ROW_MULTIPLIERS = [
+    0x9E3779B97F4A7C15,
+    0xC2B2AE3D27D4EB4F,
+    0x165667B19E3779F9,
+    0xD6E8FEB86659FD93,
+    0xFF51AFD7ED558CCD,
+    0xC4CEB9FE1A85EC53,
+    0x94D049BB133111EB,
+    0xBF58476D1CE4E5B9,
+]
+
+## counters saturate instead of overflowing, which is enough to compare them to MIN_GAMES
+MAX_COUNT = 255
+
+
+def get_game_count_sketch_width(pgn_file_size: int) -> int:
+    """Returns a sketch width of at least twice the number of keys a pgn file of this size can have,
+    so that small files get a small sketch, up to GAME_COUNT_SKETCH_WIDTH.
+    """
+    max_number_of_keys = 2 * pgn_file_size // MIN_BYTES_PER_GAME
+    width = 1 << (2 * max_number_of_keys - 1).bit_length()
+    return min(GAME_COUNT_SKETCH_WIDTH, max(MIN_GAME_COUNT_SKETCH_WIDTH, width))
+
+
+def get_key_hash(player: str, time_control: str) -> int:
+    """Returns a 64-bit hash of a (player, time control), which is the same in every process."""
+    return int.from_bytes(
+        hashlib.blake2b(f"{player}\t{time_control}".encode(), digest_size=8).digest(),
+        "little",
+    )
+
+
+class GameCountSketch:
+    """
+    The GameCountSketch class is a count-min sketch of the number of games of each (player, time control), with methods:
+    .add_hashes to count one game for each key hash from get_key_hash, e.g. the hashes returned by a worker process
+    .estimate to return an upper bound of the number of games of a (player, time control)
+    .may_reach_min_games to return False for a (player, time control) that cannot reach min_games games
+
+    Estimates are never lower than the true counts, so every (player, time control) with at least min_games games
+    is kept, and a few with fewer games may be kept too when all of their counters are shared with other keys.
+    """
+
+    def __init__(
+        self,
+        min_games: int = MIN_GAMES,
+        width: int = GAME_COUNT_SKETCH_WIDTH,
+        depth: int = GAME_COUNT_SKETCH_DEPTH,
+    ):
+        if width & (width - 1) or not 1 <= depth <= len(ROW_MULTIPLIERS):
+            raise ValueError(
+                f"width must be a power of 2 and depth at most {len(ROW_MULTIPLIERS)}"
+            )
+        self.min_games = min_games
+        self._shift = 64 - width.bit_length() + 1
+        self._multipliers = ROW_MULTIPLIERS[:depth]
+        self._counts = np.zeros((depth, width), dtype=np.uint8)
+
+    def _get_indices(self, key_hash: int) -> list:
+        return [
+            (key_hash * multiplier & 0xFFFFFFFFFFFFFFFF) >> self._shift
+            for multiplier in self._multipliers
+        ]
+
+    def add_hashes(self, key_hashes: array) -> None:
+        key_hashes = np.frombuffer(key_hashes, dtype=np.uint64)
+        for row, multiplier in enumerate(self._multipliers):
+            ## uint64 multiplication wraps around like the & in _get_indices
+            indices, counts = np.unique(
+                (key_hashes * np.uint64(multiplier)) >> np.uint64(self._shift),
+                return_counts=True,
+            )
+            self._counts[row, indices] = np.minimum(
+                self._counts[row, indices] + counts, MAX_COUNT
+            )
+
+    def estimate(self, player: str, time_control: str) -> int:
+        indices = self._get_indices(get_key_hash(player, time_control))
+        return min(int(self._counts[row, index]) for row, index in enumerate(indices))
+
+    def may_reach_min_games(self, player: str, time_control: str) -> bool:
+        return self.estimate(player, time_control) >= self.min_games
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import os
+import queue
+import threading
+import requests
+
+## the response body is read in blocks of this size, up to STREAM_QUEUE_SIZE blocks ahead of the reader,
+## which bounds the memory used by a stream to about STREAM_BLOCK_SIZE * STREAM_QUEUE_SIZE
+STREAM_BLOCK_SIZE = 2**20
+STREAM_QUEUE_SIZE = 16
+
+## a dropped connection is resumed with a range request up to STREAM_RETRIES times
+STREAM_RETRIES = 5
+STREAM_TIMEOUT_SECONDS = 60
+
+
+def is_url(path) -> bool:
+    return str(path).startswith(("http://", "https://"))
+
+
+class HttpStream(io.RawIOBase):
+    """
+    The HttpStream class reads the body of an http(s) response as a read-only binary file, with methods:
+    .readinto to read the next bytes of the body (used by .read)
+    .tell to return the number of bytes of the body read so far
+    .close to stop reading the response
+
+    The body is downloaded by a background thread up to STREAM_QUEUE_SIZE blocks ahead of the reader,
+    so the download overlaps whatever the reader does with the body, and nothing is written to disk.
+    If the connection drops, the download resumes where it stopped with an HTTP range request.
+    With a tee_file_path, the body is also written to {tee_file_path}.part as it is downloaded,
+    which is renamed to tee_file_path once the whole body is read. With an expected_sha256,
+    reading the end of a body with a different checksum raises ValueError and removes the .part file.
+    """
+
+    def __init__(self, url: str, tee_file_path=None, expected_sha256: str = None):
+        super().__init__()
+        self.url = url
+        self.tee_file_path = tee_file_path
+        self.expected_sha256 = expected_sha256
+        self._blocks = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self._stopped = threading.Event()
+        self._block = memoryview(b"")
+        self._position = 0
+        self._error = None
+        self._end_of_body = False
+        self._thread = threading.Thread(target=self._download, daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        """Waits for room in the queue for the next item, and returns False if the stream was closed."""
+        while not self._stopped.is_set():
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _download(self) -> None:
+        sha256 = hashlib.sha256()
+        number_of_bytes = 0
+        tee_file = None
+        part_file_path = f"{self.tee_file_path}.part"
+        try:
+            if self.tee_file_path is not None:
+                tee_file = open(part_file_path, "wb")
+            with requests.Session() as session:
+                for attempt in range(STREAM_RETRIES + 1):
+                    headers = {"Range": f"bytes={number_of_bytes}-"} if number_of_bytes else {}
+                    try:
+                        with session.get(
+                            self.url,
+                            headers=headers,
+                            stream=True,
+                            timeout=STREAM_TIMEOUT_SECONDS,
+                        ) as response:
+                            response.raise_for_status()
+                            if number_of_bytes and response.status_code != 206:
+                                raise ValueError(
+                                    f"{self.url} does not support range requests, so the stream cannot resume"
+                                )
+                            for block in response.iter_content(STREAM_BLOCK_SIZE):
+                                sha256.update(block)
+                                number_of_bytes += len(block)
+                                if tee_file is not None:
+                                    tee_file.write(block)
+                                if not self._put(block):
+                                    return
+                        break
+                    except (
+                        requests.ConnectionError,
+                        requests.exceptions.ChunkedEncodingError,
+                        requests.Timeout,
+                    ) as e:
+                        if attempt == STREAM_RETRIES:
+                            raise
+                        print(f"Resuming the stream of {self.url} after {number_of_bytes} bytes ({e})")
+
+            if self.expected_sha256 is not None and sha256.hexdigest() != self.expected_sha256:
+                if tee_file is not None:
+                    tee_file.close()
+                    os.remove(part_file_path)
+                raise ValueError(
+                    f"The sha256 checksum of {self.url} is {sha256.hexdigest()}, expected {self.expected_sha256}"
+                )
+            if tee_file is not None:
+                tee_file.close()
+                os.replace(part_file_path, self.tee_file_path)
+            self._put(b"")
+        except BaseException as e:
+            self._put(e)
+        finally:
+            if tee_file is not None:
+                tee_file.close()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._error is not None:
+            raise self._error
+        if not self._block:
+            if self._end_of_body:
+                return 0
+            item = self._blocks.get()
+            if isinstance(item, BaseException):
+                self._error = item
+                raise item
+            if not item:
+                self._end_of_body = True
+                return 0
+            self._block = memoryview(item)
+        number_of_bytes = min(len(buffer), len(self._block))
+        buffer[:number_of_bytes] = self._block[:number_of_bytes]
+        self._block = self._block[number_of_bytes:]
+        self._position += number_of_bytes
+        return number_of_bytes
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        ## the download thread stops the next time it waits for room in the queue
+        self._stopped.set()
+        super().close()
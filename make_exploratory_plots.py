@@ -1,25 +1,39 @@
 import argparse
 import os
 from pathlib import Path
-import pandas as pd
 import plotly.graph_objects as go
 from enums import Folders
+from player_data_io import read_player_features
 
+## columns of the player features that are plotted
+PLOTTED_COLUMNS = ["time_control", "rating_bin", "mean_rating_gain", "mean_perf_diff"]
 
-def make_exploratory_plots(CSV_PLAYER_FEATURE_FILE_PATH):
+
+def make_exploratory_plots(CSV_PLAYER_FEATURE_FILE_PATH, all_player_features=None):
+    """Writes the exploratory plots of the player features file to the exploratory_plots directory.
+    If all_player_features is passed (with time_control as a column or index level), it is plotted instead of
+    reading the file, and CSV_PLAYER_FEATURE_FILE_PATH is only used to name the plots.
+    """
     if not os.path.exists(Folders.EXPLORATORY_PLOTS.value):
         os.mkdir(Folders.EXPLORATORY_PLOTS.value)
 
     BASE_FILE_NAME = Path(CSV_PLAYER_FEATURE_FILE_PATH).stem.split(".")[0]
 
-    ## load the player features dataframe
-    all_player_features = pd.read_csv(CSV_PLAYER_FEATURE_FILE_PATH)
+    ## load the player features dataframe, only reading the columns that are plotted
+    if all_player_features is None:
+        all_player_features = read_player_features(
+            CSV_PLAYER_FEATURE_FILE_PATH, columns=PLOTTED_COLUMNS
+        )
+    else:
+        all_player_features = all_player_features.reset_index()[PLOTTED_COLUMNS]
     all_player_features = all_player_features[
         all_player_features["time_control"].isin(["bullet", "blitz", "classical"])
     ]
 
     ## plot the distribution of mean rating gain for each rating bin
-    for time_group, time_group_df in all_player_features.groupby("time_control"):
+    for time_group, time_group_df in all_player_features.groupby(
+        "time_control", observed=True
+    ):
         fig = go.Figure()
         for rating_bin, rating_group in time_group_df.groupby("rating_bin"):
             rating_bin_str = f"{rating_bin}-{rating_bin+100}"
@@ -68,7 +82,9 @@ def make_exploratory_plots(CSV_PLAYER_FEATURE_FILE_PATH):
         )
 
     ## plot distribution of mean_perf_diff
-    for time_group, time_group_df in all_player_features.groupby("time_control"):
+    for time_group, time_group_df in all_player_features.groupby(
+        "time_control", observed=True
+    ):
         fig = go.Figure()
         for rating_bin, rating_group in time_group_df.groupby("rating_bin"):
             rating_bin_str = f"{rating_bin}-{rating_bin+100}"
@@ -124,7 +140,7 @@ if __name__ == "__main__":
     parser.add_argument(
         "CSV_PLAYER_FEATURE_FILE_PATH",
         type=str,
-        help="Path to the player features CSV file",
+        help="Path to the player features CSV (or parquet) file",
     )
     args = parser.parse_args()
 
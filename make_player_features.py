@@ -5,54 +5,89 @@ import numpy as np
 import pandas as pd
 
 from enums import Folders
+from pipeline_metrics import PipelineMetrics, get_default_metrics_file_path
+from player_data_io import (
+    FILE_FORMATS,
+    iter_raw_games,
+    read_raw_games,
+    write_player_features,
+)
 
 
-def make_player_features(CSV_RAW_FEATURES_FILE_PATH):
-    """Creates features at the player + time control level from the CSV file containing raw features."""
+## users who have played fewer games in a time control are filtered out
+MIN_GAMES = 30
 
-    all_player_games_df = pd.read_csv(
-        CSV_RAW_FEATURES_FILE_PATH,
-        index_col=[0, 1],
-    )
-    all_player_games_df.index = all_player_games_df.index.set_names(
-        ["player", "time_control"]
-    )
+## rough peak memory used per raw features row while aggregating a chunk, used to size chunks
+BYTES_PER_RAW_GAMES_ROW = 500
 
-    ## filter out users who have not played enough games
-    MIN_GAMES = 30
-    all_player_games_filtered_df = all_player_games_df.loc[
-        all_player_games_df.groupby(level=["player", "time_control"]).size()
-        >= MIN_GAMES
-    ].copy()
+## when raw features are aggregated in chunks, half of max_memory_mb is used to read and aggregate a chunk,
+## and the partial aggregates may use at most MAX_STATE_MEMORY_SHARE of it, since folding them holds the partial
+## aggregates, about as many rows of chunk aggregates, their concatenation and the merged copy at once
+CHUNK_MEMORY_SHARE = 1 / 2
+MAX_STATE_MEMORY_SHARE = 1 / 8
 
-    ## calculate how much someone exceeds expectations: (actual win rate - expected win rate)
-    ## someone who has a high win rate could just play mostly lower rated opposition
+## calculate how much someone exceeds expectations: (actual win rate - expected win rate)
+## someone who has a high win rate could just play mostly lower rated opposition
 
-    ## this is more involved and requires figuring out expected scores for each game
-    ## e.g. if player 1 is 1500 and player 2 is also 1500, player 1 should have an expected score of 0.5
-    ## but the exact nature of the curve depends on the glicko-2 rating system
+## this is more involved and requires figuring out expected scores for each game
+## e.g. if player 1 is 1500 and player 2 is also 1500, player 1 should have an expected score of 0.5
+## but the exact nature of the curve depends on the glicko-2 rating system
 
-    ## we use will the following paper: http://www.glicko.net/glicko/glicko2.pdf
-    ## and this comment left by @chess_in_sgv:
+## we use will the following paper: http://www.glicko.net/glicko/glicko2.pdf
+## and this comment left by @chess_in_sgv:
 
-    # Let P2 = Expected outcome for player 2. Then:
-    # P2 = 1 / (1 + e^-a)
-    # with a = g(sqrt(r12+r22)) * (s2-s1))
-    # and g(x) = 1/sqrt(1+3x2/pi2)
+# Let P2 = Expected outcome for player 2. Then:
+# P2 = 1 / (1 + e^-a)
+# with a = g(sqrt(r12+r22)) * (s2-s1))
+# and g(x) = 1/sqrt(1+3x2/pi2)
 
-    ##  source: https://www.reddit.com/r/chess/comments/i0pnv1/comment/fzrhhwi
+##  source: https://www.reddit.com/r/chess/comments/i0pnv1/comment/fzrhhwi
 
-    def g(x):
-        return 1 / np.sqrt(1 + 3 * x**2 / np.pi**2)
 
-    def get_player_expected_score(
-        player_rating, opponent_rating, player_rd=80.0, opponent_rd=80.0
-    ):
-        """Returns expected score of player based on player rating, opponent rating, and RDs (if known)."""
-        A = g(np.sqrt(player_rd**2 + opponent_rd**2)) * (
-            player_rating - opponent_rating
-        )
-        return 1 / (1 + np.exp(-A))
+def g(x):
+    return 1 / np.sqrt(1 + 3 * x**2 / np.pi**2)
+
+
+def get_player_expected_score(
+    player_rating, opponent_rating, player_rd=80.0, opponent_rd=80.0
+):
+    """Returns expected score of player based on player rating, opponent rating, and RDs (if known)."""
+    A = g(np.sqrt(player_rd**2 + opponent_rd**2)) * (player_rating - opponent_rating)
+    return 1 / (1 + np.exp(-A))
+
+
+def add_rating_bins(all_player_features: pd.DataFrame) -> None:
+    """Assigns the 100 point rating bin of each player's mean_rating to the rating_bin column."""
+    min_rating, max_rating = (
+        all_player_features["mean_rating"].min(),
+        all_player_features["mean_rating"].max(),
+    )
+    min_bin_rating = np.floor(all_player_features["mean_rating"].min() / 100.0) * 100
+    max_bin_rating = (
+        100 + np.ceil(all_player_features["mean_rating"].max() / 100.0) * 100
+    )
+    rating_bins = np.arange(min_bin_rating, max_bin_rating, 100)
+
+    ## assign rating bin string to each mean_rating
+    rating_bin_labels = [f"{str(int(x))} - {str(int(x)+100)}" for x in rating_bins[:-1]]
+    all_player_features["rating_bin"] = pd.cut(
+        all_player_features["mean_rating"],
+        rating_bins,
+        right=True,
+        labels=rating_bins[:-1],
+    ).astype(int)
+
+
+def aggregate_player_features(all_player_games_df: pd.DataFrame) -> pd.DataFrame:
+    """Returns features at the player + time control level from the raw features with one row per game."""
+
+    ## filter out users who have not played enough games
+    all_player_games_filtered_df = all_player_games_df.loc[
+        all_player_games_df.groupby(
+            level=["player", "time_control"], observed=True
+        ).size()
+        >= MIN_GAMES
+    ].copy()
 
     all_player_games_filtered_df["expected_scores"] = get_player_expected_score(
         player_rating=all_player_games_filtered_df["ratings"].to_numpy(),
@@ -67,7 +102,7 @@ def make_player_features(CSV_RAW_FEATURES_FILE_PATH):
 
     ## AGGREGATE GAME RESULTS FEATURES by player + time control
     all_player_features = all_player_games_filtered_df.groupby(
-        level=["player", "time_control"]
+        level=["player", "time_control"], observed=True
     ).agg(
         number_of_games=("ratings", "count"),
         mean_perf_diff=(
@@ -102,38 +137,145 @@ def make_player_features(CSV_RAW_FEATURES_FILE_PATH):
     # most players don't want to lose!
     # (4) analysis of move times -- not yet implemented (unknown if such data is available)
 
-    min_rating, max_rating = (
-        all_player_features["mean_rating"].min(),
-        all_player_features["mean_rating"].max(),
-    )
-    min_bin_rating = np.floor(all_player_features["mean_rating"].min() / 100.0) * 100
-    max_bin_rating = (
-        100 + np.ceil(all_player_features["mean_rating"].max() / 100.0) * 100
-    )
-    rating_bins = np.arange(min_bin_rating, max_bin_rating, 100)
+    add_rating_bins(all_player_features)
+    return all_player_features
 
-    ## assign rating bin string to each mean_rating
-    rating_bin_labels = [f"{str(int(x))} - {str(int(x)+100)}" for x in rating_bins[:-1]]
-    all_player_features["rating_bin"] = pd.cut(
-        all_player_features["mean_rating"],
-        rating_bins,
-        right=True,
-        labels=rating_bins[:-1],
-    ).astype(int)
 
-    ## save to csv
-    BASE_FILE_NAME = Path(CSV_RAW_FEATURES_FILE_PATH).stem.split(".")[0]
-    all_player_features.to_csv(
-        f"{Folders.LICHESS_PLAYER_DATA.value}/{BASE_FILE_NAME}_player_features.csv"
+def aggregate_player_features_in_chunks(
+    RAW_FEATURES_FILE_PATH, max_memory_mb: float, metrics: PipelineMetrics = None
+) -> pd.DataFrame:
+    """Returns the same features as aggregate_player_features (within float tolerance, and median_rating within
+    player_feature_state.RATING_HISTOGRAM_BIN_WIDTH / 2) for raw features larger than memory.
+    The raw features are read in chunks sized to stay within max_memory_mb, and each chunk is folded into
+    partial aggregates per player + time control, which are only filtered by MIN_GAMES at the end.
+    The partial aggregates grow with the number of (player, time control), and MemoryError is raised
+    if they need more than MAX_STATE_MEMORY_SHARE of max_memory_mb.
+    The number of raw features rows read is added to the raw_games count of the current stage of metrics.
+    """
+    ## imported here because player_feature_state imports from this module
+    from player_feature_state import PlayerFeatureState
+
+    chunk_rows = max(
+        1, int(max_memory_mb * 2**20 * CHUNK_MEMORY_SHARE / BYTES_PER_RAW_GAMES_ROW)
     )
+    max_state_bytes = max_memory_mb * 2**20 * MAX_STATE_MEMORY_SHARE
+    state, chunk_states, number_of_chunk_state_rows = None, [], 0
+
+    def fold_chunk_states():
+        folded_state = PlayerFeatureState.merge(
+            chunk_states if state is None else [state] + chunk_states
+        )
+        if folded_state.memory_usage() > max_state_bytes:
+            raise MemoryError(
+                f"The partial aggregates of {len(folded_state.statistics)} (player, time control) use "
+                f"{folded_state.memory_usage() / 2**20:.1f} MB, more than {MAX_STATE_MEMORY_SHARE:.0%} "
+                f"of max_memory_mb={max_memory_mb}, so a larger max_memory_mb is needed"
+            )
+        return folded_state
+
+    for all_player_games_df in iter_raw_games(RAW_FEATURES_FILE_PATH, chunk_rows):
+        chunk_state = PlayerFeatureState.from_games(all_player_games_df)
+        chunk_states.append(chunk_state)
+        number_of_chunk_state_rows += len(chunk_state.rating_counts)
+        if metrics is not None:
+            metrics.add_counts(raw_games=len(all_player_games_df))
+            metrics.emit_if_due()
+
+        ## fold the chunk states into the partial aggregates once they have as many rows as the partial aggregates
+        ## (or a chunk), so each row of the partial aggregates is merged a bounded number of times on average
+        ## rather than once per chunk
+        if number_of_chunk_state_rows >= max(
+            chunk_rows, 0 if state is None else len(state.rating_counts)
+        ):
+            state = fold_chunk_states()
+            chunk_states, number_of_chunk_state_rows = [], 0
+
+    if chunk_states:
+        state = fold_chunk_states()
+    return state.to_player_features()
+
+
+def make_player_features(
+    RAW_FEATURES_FILE_PATH,
+    output_format="csv",
+    max_memory_mb=None,
+    metrics: PipelineMetrics = None,
+    all_player_games_df: pd.DataFrame = None,
+    write_output=True,
+) -> pd.DataFrame:
+    """Creates features at the player + time control level from the CSV (or parquet) file containing raw features,
+    and returns them after writing them to a csv (or parquet) file if write_output=True.
+    If all_player_games_df is passed (e.g. returned by parse_pgn), it is used instead of reading the raw features file,
+    whose path is then only used to name the player features file.
+    If max_memory_mb is passed, the raw features file is processed in chunks that fit in about that much memory.
+    The time, memory, raw features rows read and player features rows written are recorded
+    in the make_player_features stage of metrics.
+    """
+    if metrics is None:
+        metrics = PipelineMetrics()
+
+    with metrics.stage("make_player_features"):
+        if all_player_games_df is not None or max_memory_mb is None:
+            ## raw features may be stored as float32, but all features are calculated in float64
+            if all_player_games_df is None:
+                all_player_games_df = read_raw_games(RAW_FEATURES_FILE_PATH)
+            all_player_games_df = all_player_games_df.astype(np.float64)
+            metrics.set_counts(raw_games=len(all_player_games_df))
+            all_player_features = aggregate_player_features(all_player_games_df)
+        else:
+            all_player_features = aggregate_player_features_in_chunks(
+                RAW_FEATURES_FILE_PATH, max_memory_mb, metrics
+            )
+        metrics.set_counts(rows=len(all_player_features))
+
+        ## save to csv or parquet
+        if write_output:
+            BASE_FILE_NAME = Path(RAW_FEATURES_FILE_PATH).stem.split(".")[0]
+            write_player_features(
+                all_player_features,
+                f"{Folders.LICHESS_PLAYER_DATA.value}/{BASE_FILE_NAME}_player_features.{output_format}",
+            )
+
+    return all_player_features
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Create player features from CSV file")
     parser.add_argument(
-        "CSV_RAW_FEATURES_FILE_PATH", type=str, help="Path to the CSV file"
+        "RAW_FEATURES_FILE_PATH",
+        type=str,
+        help="Path to the CSV (or parquet) file containing raw features",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        default="csv",
+        choices=FILE_FORMATS,
+        help="Format of the player features file",
+    )
+    parser.add_argument(
+        "--max-memory-mb",
+        type=float,
+        default=None,
+        help="Process the raw features in chunks that fit in about this much memory",
+    )
+    parser.add_argument(
+        "--metrics-file-path",
+        type=str,
+        default=None,
+        help="Path to the json file of pipeline metrics, by default a new file in pipeline_metrics",
     )
     args = parser.parse_args()
 
     ## create features from the CSV file
-    make_player_features(args.CSV_RAW_FEATURES_FILE_PATH)
+    BASE_FILE_NAME = Path(args.RAW_FEATURES_FILE_PATH).stem.split(".")[0]
+    make_player_features(
+        args.RAW_FEATURES_FILE_PATH,
+        output_format=args.output_format,
+        max_memory_mb=args.max_memory_mb,
+        metrics=PipelineMetrics(
+            args.metrics_file_path
+            or get_default_metrics_file_path(f"make_player_features_{BASE_FILE_NAME}"),
+            emit_interval_seconds=60,
+        ),
+    )
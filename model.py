@@ -1,13 +1,167 @@
-from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import hashlib
+import json
 import os
-import pickle
+import subprocess
+import sys
+import time
 from typing import Union
 import numpy as np
 import pandas as pd
 
 from enums import TimeControl, Folders
-from player_account_handler import PlayerAccountHandler
-from model_plots import generate_model_threshold_plots
+from pipeline_metrics import PipelineMetrics
+from player_data_io import (
+    THRESHOLD_CURVES_DTYPES,
+    THRESHOLD_CURVES_FILE_SUFFIX,
+    write_threshold_curves,
+)
+
+## thresholds are stored in a dense table indexed by (time control code, rating_bin // RATING_BIN_SIZE),
+## where the time control code is the position of the time control in TimeControl.ALL
+RATING_BIN_SIZE = 100
+NUMBER_OF_RATING_BINS = 40
+DEFAULT_THRESHOLD = 0.15
+
+DEFAULT_MODEL_NAME = "player_anomaly_detection_model"
+
+## a model file is MODEL_FILE_MAGIC, the length of the header as a little-endian uint64, a json header,
+## then the raw bytes of each array starting at an offset aligned to MODEL_FILE_ALIGNMENT bytes.
+## the header holds the format version, the metadata of the model,
+## and the dtype, shape, offset and sha256 checksum of each array
+MODEL_FILE_MAGIC = b"PADMODEL"
+MODEL_FILE_FORMAT_VERSION = 1
+MODEL_FILE_EXTENSION = ".model"
+MODEL_FILE_ALIGNMENT = 64
+
+
+def write_model_file(model_file_path, arrays: dict, metadata: dict) -> None:
+    """Writes named numpy arrays and json serializable metadata to a model file."""
+    array_headers, offset = {}, 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        array_headers[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+            "sha256": hashlib.sha256(array.tobytes()).hexdigest(),
+        }
+        offset += -(-array.nbytes // MODEL_FILE_ALIGNMENT) * MODEL_FILE_ALIGNMENT
+    header = json.dumps(
+        {
+            "format_version": MODEL_FILE_FORMAT_VERSION,
+            "metadata": metadata,
+            "arrays": array_headers,
+        }
+    ).encode()
+
+    ## the arrays start after the header, padded so they are aligned in the file
+    data_start = len(MODEL_FILE_MAGIC) + 8 + len(header)
+    header += b" " * (-data_start % MODEL_FILE_ALIGNMENT)
+    with open(model_file_path, "wb") as f:
+        f.write(MODEL_FILE_MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, array in arrays.items():
+            array_bytes = np.ascontiguousarray(array).tobytes()
+            f.write(array_bytes)
+            f.write(b"\0" * (-len(array_bytes) % MODEL_FILE_ALIGNMENT))
+
+
+def read_model_file(model_file_path, verify_checksum: bool = True) -> tuple:
+    """Returns (arrays, metadata) of a model file, where the arrays are read-only views of the memory mapped file,
+    which can be shared by several processes. With verify_checksum=True, each array is checked against its sha256 checksum.
+    """
+    with open(model_file_path, "rb") as f:
+        if f.read(len(MODEL_FILE_MAGIC)) != MODEL_FILE_MAGIC:
+            raise ValueError(f"{model_file_path} is not a model file")
+        header_length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_length))
+    if header["format_version"] != MODEL_FILE_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported model file format version {header['format_version']}, "
+            f"must be {MODEL_FILE_FORMAT_VERSION}"
+        )
+
+    data = np.memmap(model_file_path, dtype=np.uint8, mode="r")
+    data_start = len(MODEL_FILE_MAGIC) + 8 + header_length
+    arrays = {}
+    for name, array_header in header["arrays"].items():
+        dtype = np.dtype(array_header["dtype"])
+        start = data_start + array_header["offset"]
+        array_bytes = data[
+            start : start + dtype.itemsize * int(np.prod(array_header["shape"]))
+        ]
+        if (
+            verify_checksum
+            and hashlib.sha256(array_bytes).hexdigest() != array_header["sha256"]
+        ):
+            raise ValueError(f"Checksum of {name} in {model_file_path} does not match")
+        arrays[name] = array_bytes.view(dtype).reshape(array_header["shape"])
+    return arrays, header["metadata"]
+
+
+def search_thresholds(
+    mean_perf_diffs: np.ndarray, scores: np.ndarray, min_threshold: float
+) -> pd.DataFrame:
+    """Evaluates the metric log(N+1) * accuracy at every distinct threshold above min_threshold in one vectorized pass,
+    where N is the number of players with mean_perf_diff > threshold and accuracy is the mean score of those players.
+    Returns a DataFrame with columns threshold, accuracy, metric and number_of_flagged_players sorted by threshold,
+    where the thresholds are min_threshold and every distinct mean_perf_diff that leaves at least one player flagged.
+    """
+    is_candidate = mean_perf_diffs > min_threshold
+    candidate_perf_diffs = mean_perf_diffs[is_candidate]
+    candidate_scores = scores[is_candidate]
+
+    ## sort players once from highest to lowest mean_perf_diff, so that the players flagged
+    ## by each threshold are the players before it, and their counts and scores are cumulative sums
+    order = np.argsort(-candidate_perf_diffs, kind="stable")
+    sorted_perf_diffs = candidate_perf_diffs[order]
+    number_of_flagged_players = np.arange(1, len(sorted_perf_diffs) + 1)
+    accuracy = np.cumsum(candidate_scores[order]) / number_of_flagged_players
+
+    ## the threshold that flags the first k players is the mean_perf_diff of the next player,
+    ## so thresholds only exist where the next player has a strictly lower mean_perf_diff
+    thresholds = np.append(sorted_perf_diffs[1:], min_threshold)
+    is_cut_point = np.append(sorted_perf_diffs[:-1] > sorted_perf_diffs[1:], True)[
+        : len(sorted_perf_diffs)
+    ]
+
+    ## this metric ensures that number of flagged players
+    ## doesn't disproportionately impact the metric:
+
+    ## a threshold that flags 100 players with 0.50 accuracy
+    ## is worse than a threshold that flags 20 players with 1.00 accuracy
+    metric = np.log(number_of_flagged_players + 1) * accuracy
+    return pd.DataFrame(
+        {
+            "threshold": thresholds[is_cut_point][::-1],
+            "accuracy": accuracy[is_cut_point][::-1],
+            "metric": metric[is_cut_point][::-1],
+            "number_of_flagged_players": number_of_flagged_players[is_cut_point][::-1],
+        }
+    )
+
+
+def fit_rating_bin(
+    mean_perf_diffs: np.ndarray,
+    scores: np.ndarray,
+    min_threshold: float,
+    default_threshold: float,
+) -> tuple:
+    """Returns the threshold curve, best threshold and best train metric of one (rating bin, time control).
+    The default threshold is kept unless some threshold has a positive metric, and ties are broken by the lowest threshold.
+    """
+    ## exact search over every distinct threshold above the minimum threshold
+    threshold_curve = search_thresholds(mean_perf_diffs, scores, min_threshold)
+
+    best_threshold = default_threshold
+    best_train_metric = 0.00
+    if len(threshold_curve) and threshold_curve["metric"].max() > 0:
+        best_index = threshold_curve["metric"].to_numpy().argmax()
+        best_threshold = float(threshold_curve["threshold"].iloc[best_index])
+        best_train_metric = float(threshold_curve["metric"].iloc[best_index])
+    return threshold_curve, best_threshold, best_train_metric
 
 
 class PlayerAnomalyDetectionModel:
@@ -15,184 +169,376 @@ class PlayerAnomalyDetectionModel:
     The PlayerAnomalyDetectionModel class returns a model with methods:
     .fit to tune the model's internal thresholds on training data
     .predict to make predictions on test data
-    .load_model to load a predefined model from a pkl file
+    .load_model to load a predefined model from a model file
     .save_model to save the model to a file
+    .wait_for_plots to wait for the plots rendered in the background after fitting
+
+    After fitting, fit_timings holds the time spent fetching account statuses and searching thresholds.
+    The thresholds and their train metrics are stored in dense arrays of shape
+    (len(TimeControl.ALL), NUMBER_OF_RATING_BINS), so predictions are a single gather and comparison.
     """
 
-    def __init__(self, player_account_handler):
+    def __init__(self, player_account_handler, min_threshold: float = 0.10):
         self.is_fitted = False
-        self._thresholds = {
-            (time_control, "perf_delta_thresholds"): {
-                f"{rating_bin}-{rating_bin+100}": 0.15
-                for rating_bin in np.arange(0, 4000, 100)
-            }
-            for time_control in TimeControl.ALL.value
-        }
+        self.fit_timings = {}
+        self._plot_process = None
+        self._threshold_table = np.full(
+            (len(TimeControl.ALL.value), NUMBER_OF_RATING_BINS), DEFAULT_THRESHOLD
+        )
         self._player_account_handler = player_account_handler
         self._account_status_score_map = {
             "open": 0,
             "tosViolation": 1,
             "closed": 0.75,  # weight closed account as closer to a tosViolation
         }
-        self._threshold_metrics = {
+        ## metrics are NaN for rating bins that have not been fitted
+        self._threshold_metric_table = np.full(
+            (len(TimeControl.ALL.value), NUMBER_OF_RATING_BINS), np.nan
+        )
+        self._threshold_curves = {
+            (time_control, "perf_delta_thresholds"): {}
+            for time_control in TimeControl.ALL.value
+        }
+
+        ## thresholds are searched above min_threshold, and the account status
+        ## of every player above min_threshold is needed to fit the model
+        self._min_threshold = min_threshold
+
+    @property
+    def _thresholds(self) -> dict:
+        """Returns the thresholds as a dictionary keyed by (time_control, "perf_delta_thresholds")
+        and then by rating bin keys such as "1500-1600".
+        """
+        return self._get_table_dict(self._threshold_table)
+
+    @property
+    def _threshold_metrics(self) -> dict:
+        """Returns the train metrics of the thresholds in the same layout as _thresholds,
+        with None for rating bins that have not been fitted.
+        """
+        return self._get_table_dict(self._threshold_metric_table)
+
+    @staticmethod
+    def _get_table_dict(table: np.ndarray) -> dict:
+        return {
             (time_control, "perf_delta_thresholds"): {
-                f"{rating_bin}-{rating_bin+100}": None
-                for rating_bin in np.arange(0, 4000, 100)
+                f"{rating_bin}-{rating_bin+RATING_BIN_SIZE}": None
+                if np.isnan(value)
+                else float(value)
+                for rating_bin, value in zip(
+                    range(0, NUMBER_OF_RATING_BINS * RATING_BIN_SIZE, RATING_BIN_SIZE),
+                    table[time_control_code],
+                )
             }
-            for time_control in TimeControl.ALL.value
+            for time_control_code, time_control in enumerate(TimeControl.ALL.value)
         }
 
-    def load_model(self, model_file_name: str):
+    @staticmethod
+    def _get_table_indices(time_controls, rating_bins) -> tuple:
+        """Returns the (time control code, rating bin index) of each row into the threshold table."""
+        time_control_codes = pd.Categorical(
+            time_controls, categories=TimeControl.ALL.value
+        ).codes
+        rating_bin_indices = np.asarray(rating_bins, dtype=np.int64) // RATING_BIN_SIZE
+        if (time_control_codes < 0).any():
+            raise ValueError(f"Time controls must be one of {TimeControl.ALL.value}")
+        if (
+            (rating_bin_indices < 0) | (rating_bin_indices >= NUMBER_OF_RATING_BINS)
+        ).any():
+            raise ValueError(
+                f"Rating bins must be between 0 and {(NUMBER_OF_RATING_BINS - 1) * RATING_BIN_SIZE}"
+            )
+        return time_control_codes, rating_bin_indices
+
+    def get_thresholds(self, test_data: pd.DataFrame) -> np.ndarray:
+        """Returns the threshold of each row of test_data from its time_control and rating_bin."""
+        return self._threshold_table[
+            self._get_table_indices(test_data["time_control"], test_data["rating_bin"])
+        ]
+
+    def load_model(self, model_file_path: str, verify_checksum: bool = True):
         """
-        Loads a model from a file. Not yet implemented.
+        Loads a model saved with .save_model. The thresholds are memory mapped read-only,
+        so the loaded model can predict but not be fitted again.
         """
-        pass
+        arrays, metadata = read_model_file(model_file_path, verify_checksum)
+        if (
+            metadata["time_controls"] != TimeControl.ALL.value
+            or metadata["rating_bin_size"] != RATING_BIN_SIZE
+            or arrays["thresholds"].shape
+            != (len(TimeControl.ALL.value), NUMBER_OF_RATING_BINS)
+        ):
+            raise ValueError(
+                f"{model_file_path} has different time controls or rating bins than this model"
+            )
+        self._threshold_table = arrays["thresholds"]
+        self._threshold_metric_table = arrays["threshold_metrics"]
+        self._min_threshold = metadata["min_threshold"]
+        self._account_status_score_map = metadata["account_status_score_map"]
+        self.fit_timings = metadata["fit_timings"]
+        self.is_fitted = metadata["is_fitted"]
 
-    def fit(self, train_data: pd.DataFrame, generate_plots=True):
+    def fit(
+        self,
+        train_data: pd.DataFrame,
+        generate_plots=True,
+        n_jobs=1,
+        base_file_name=DEFAULT_MODEL_NAME,
+        metrics: PipelineMetrics = None,
+    ):
+        """Sets the thresholds of each (rating bin, time control) from the training data.
+        With n_jobs > 1 (or None for all cores), the rating bins are fitted in parallel by a pool of worker processes.
+        The threshold curves are saved to the model_plots directory in {base_file_name}_threshold_curves.parquet,
+        and with generate_plots=True the plots are rendered from it by a background process, see .wait_for_plots.
+        The time, memory, rows and fit_timings are recorded in the fit stage of metrics.
+        """
+        if metrics is None:
+            metrics = PipelineMetrics()
         if not self.is_fitted:
-            self._set_thresholds(train_data, generate_plots)
+            with metrics.stage("fit"):
+                self._set_thresholds(train_data, generate_plots, n_jobs, base_file_name)
+                metrics.set_counts(
+                    rows=len(train_data),
+                    candidate_players=self.fit_timings["number_of_candidate_players"],
+                )
+                metrics.set_values(fit_timings=self.fit_timings)
             self.is_fitted = True
         else:
             print("Warning: model is already fitted")
             pass
 
-    def _set_thresholds(self, train_data, generate_plots):
-        ## set thresholds by each rating bin, also updates player account statuses
-        ## generate plots of threshold vs accuracy
+    def _set_thresholds(
+        self, train_data, generate_plots, n_jobs=1, base_file_name=DEFAULT_MODEL_NAME
+    ):
+        ## set thresholds by each rating bin in two phases:
+        ## (1) fetch the account statuses of every player who can be flagged in any rating bin at once,
+        ## while the training data is split into rating bins
+        ## (2) search the thresholds in memory, and save the threshold curves to generate plots of threshold vs accuracy
         train_data_filtered = train_data[
             train_data["time_control"].isin(TimeControl.ALL.value)
         ]
-        for group_tuple, train_rating_bin_df in tqdm(
-            train_data_filtered.groupby(["rating_bin", "time_control"])
+        mean_perf_diffs = train_data_filtered["mean_perf_diff"].to_numpy(dtype=float)
+        candidate_players = (
+            train_data_filtered.loc[mean_perf_diffs > self._min_threshold, "player"]
+            .unique()
+            .tolist()
+        )
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            account_status_future = executor.submit(
+                self._update_account_statuses, candidate_players
+            )
+            rating_bin_groups = sorted(
+                train_data_filtered.groupby(
+                    ["rating_bin", "time_control"], observed=True
+                ).indices.items()
+            )
+            wait_start_time = time.perf_counter()
+            account_status_seconds = account_status_future.result()
+            account_status_wait_seconds = time.perf_counter() - wait_start_time
+
+        ## get the score for each player, unknown account statuses count as 0
+        search_start_time = time.perf_counter()
+        train_scores = (
+            train_data_filtered["player"]
+            .astype(object)
+            .map(self._player_account_handler._account_statuses)
+            .map(self._account_status_score_map)
+            .fillna(0)
+            .to_numpy(dtype=float)
+        )
+
+        ## progress bars are only imported when fitting, so scoring does not import them
+        from tqdm import tqdm
+
+        ## each rating bin only needs its mean_perf_diff and score arrays,
+        ## and the results are gathered in the sorted order of the rating bins
+        table_indices = [
+            self._get_table_indices([time_control], [rating_bin])
+            for (rating_bin, time_control), _ in rating_bin_groups
+        ]
+        fit_rating_bin_args = [
+            [mean_perf_diffs[group_indices] for _, group_indices in rating_bin_groups],
+            [train_scores[group_indices] for _, group_indices in rating_bin_groups],
+            [self._min_threshold] * len(rating_bin_groups),
+            [float(self._threshold_table[table_index][0]) for table_index in table_indices],
+        ]
+        if n_jobs == 1:
+            rating_bin_results = list(
+                tqdm(
+                    map(fit_rating_bin, *fit_rating_bin_args),
+                    total=len(rating_bin_groups),
+                )
+            )
+        else:
+            n_jobs = n_jobs or os.cpu_count()
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                rating_bin_results = list(
+                    tqdm(
+                        executor.map(
+                            fit_rating_bin,
+                            *fit_rating_bin_args,
+                            chunksize=max(1, len(rating_bin_groups) // (4 * n_jobs)),
+                        ),
+                        total=len(rating_bin_groups),
+                    )
+                )
+
+        threshold_curves = []
+        for (group_tuple, _), table_index, rating_bin_result in zip(
+            rating_bin_groups, table_indices, rating_bin_results
         ):
             rating_bin, time_control = group_tuple
-            rating_bin_key = f"{rating_bin}-{rating_bin+100}"
-
-            ## start with the default threshold for each rating bin
-            train_threshold = self._thresholds[(time_control, "perf_delta_thresholds")][
-                rating_bin_key
-            ]
-
-            ## simple 1D grid search for the best threshold (this can be refined)
-            delta_th = 0.01
-            best_threshold = train_threshold  # defaults to 0.20
-            best_train_metric = 0.00
-
-            train_accuracy_list = []
-            train_metric_list = []
-            train_threshold_list = []
-            train_number_of_flagged_players = []
-
-            while True:
-                all_flagged_players = train_rating_bin_df[
-                    train_rating_bin_df["mean_perf_diff"] > train_threshold
-                ]["player"].tolist()
-
-                number_of_flagged_players = len(all_flagged_players)
-
-                ## break if threshold is large enough to filter out all players
-                if number_of_flagged_players == 0:
-                    break
-
-                ## set the account status for each player
-                for player in all_flagged_players:
-                    self._player_account_handler.update_player_account_status(player)
-
-                ## get the account status for each player
-                train_predictions = [
-                    self._player_account_handler._account_statuses.get(player)
-                    for player in all_flagged_players
-                ]
-
-                ## get the score for each player
-                train_scores = [
-                    self._account_status_score_map.get(status)
-                    for status in train_predictions
-                ]
-
-                ## calculate accuracy of the model
-                train_accuracy = sum(train_scores) / len(train_predictions)
-                train_accuracy_list.append(train_accuracy)
-                train_threshold_list.append(train_threshold)
-                train_number_of_flagged_players.append(number_of_flagged_players)
-
-                ## this metric ensures that number of flagged players
-                ## doesn't disproportionately impact the metric:
-
-                ## a threshold that flags 100 players with 0.50 accuracy
-                ## is worse than a threshold that flags 20 players with 1.00 accuracy
-                train_metric = np.log(number_of_flagged_players + 1) * train_accuracy
-                train_metric_list.append(train_metric)
-
-                ## update the best threshold
-                if train_metric > best_train_metric:
-                    best_train_metric = train_metric
-                    best_threshold = train_threshold
-                train_threshold += delta_th
+            threshold_curve, best_threshold, best_train_metric = rating_bin_result
+            rating_bin_key = f"{rating_bin}-{rating_bin+RATING_BIN_SIZE}"
 
             ## set the best threshold
-            self._thresholds[(time_control, "perf_delta_thresholds")][
-                rating_bin_key
-            ] = best_threshold
+            self._threshold_table[table_index] = best_threshold
+            self._threshold_metric_table[table_index] = best_train_metric
 
-            self._threshold_metrics[(time_control, "perf_delta_thresholds")][
+            self._threshold_curves[(time_control, "perf_delta_thresholds")][
                 rating_bin_key
-            ] = best_train_metric
-
-            ## we need to integrate this into the model logic properly
-            BASE_FILE_NAME = "test"
-
-            ## generate plots by default
-            if generate_plots:
-                generate_model_threshold_plots(
-                    BASE_FILE_NAME,
-                    Folders.MODEL_PLOTS.value,
-                    train_threshold_list,
-                    train_accuracy_list,
-                    train_metric_list,
-                    train_number_of_flagged_players,
-                    best_threshold,
-                    time_control,
-                    rating_bin_key,
+            ] = threshold_curve
+            threshold_curves.append(
+                threshold_curve.assign(
+                    time_control=time_control,
+                    rating_bin=rating_bin,
+                    best_threshold=best_threshold,
                 )
+            )
+        threshold_search_seconds = time.perf_counter() - search_start_time
+
+        ## save every threshold curve to one file on every fit, and only render the plots from it
+        ## in a background process when they are wanted, see .wait_for_plots
+        threshold_curves_start_time = time.perf_counter()
+        threshold_curves_file_path = self._save_threshold_curves(
+            threshold_curves, base_file_name
+        )
+        if generate_plots:
+            model_plots_script = os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "model_plots.py"
+            )
+            self._plot_process = subprocess.Popen(
+                [sys.executable, model_plots_script, threshold_curves_file_path]
+            )
+        threshold_curves_seconds = time.perf_counter() - threshold_curves_start_time
+
+        self.fit_timings = {
+            "number_of_candidate_players": len(candidate_players),
+            "account_status_seconds": account_status_seconds,
+            "account_status_wait_seconds": account_status_wait_seconds,
+            "threshold_search_seconds": threshold_search_seconds,
+            "threshold_curves_seconds": threshold_curves_seconds,
+        }
+        print(
+            f"Fetched the account statuses of {len(candidate_players)} players in {account_status_seconds:.2f}s "
+            f"(waited {account_status_wait_seconds:.2f}s), "
+            f"searched thresholds in {threshold_search_seconds:.2f}s"
+        )
+
+    def wait_for_plots(self, timeout: float = None) -> Union[int, None]:
+        """Waits for the plots of the last fit to be rendered, and returns the exit status of the plot process,
+        or None if no plots were rendered. A non-zero exit status is printed as a warning.
+        """
+        if self._plot_process is None:
+            return None
+        exit_status = self._plot_process.wait(timeout)
+        if exit_status != 0:
+            print(f"Warning: rendering the model plots failed with exit status {exit_status}")
+        return exit_status
+
+    def _save_threshold_curves(self, threshold_curves, base_file_name) -> str:
+        """Saves the threshold curves of every (rating bin, time control) to a parquet file
+        in the model_plots directory, and returns its path.
+        """
+        if not os.path.exists(Folders.MODEL_PLOTS.value):
+            os.mkdir(Folders.MODEL_PLOTS.value)
+        threshold_curves_file_path = (
+            f"{Folders.MODEL_PLOTS.value}/{base_file_name}{THRESHOLD_CURVES_FILE_SUFFIX}"
+        )
+        ## a model fitted without any rating bins saves an empty file
+        threshold_curves = (
+            pd.concat(threshold_curves, ignore_index=True)
+            if threshold_curves
+            else pd.DataFrame(columns=list(THRESHOLD_CURVES_DTYPES))
+        )
+        write_threshold_curves(
+            threshold_curves[list(THRESHOLD_CURVES_DTYPES)], threshold_curves_file_path
+        )
+        return threshold_curves_file_path
 
-    def predict(self, test_data: pd.DataFrame):
+    def _update_account_statuses(self, players) -> float:
+        """Fetches the account statuses of players without a known account status,
+        and returns the time taken in seconds.
+        """
+        start_time = time.perf_counter()
+        self._player_account_handler.update_player_account_statuses(players)
+        return time.perf_counter() - start_time
+
+    def predict(self, test_data: pd.DataFrame, metrics: PipelineMetrics = None):
         """Returns pd.DataFrame of size (m+2, k)
-        where k = number of flagged games, and m = number of features
+        where k = number of flagged games, and m = number of features.
+        The time, memory, rows and anomalies are recorded in the predict stage of metrics.
         """
         if not self.is_fitted:
             print("Warning: model is not fitted and will use default thresholds")
+        if metrics is None:
+            metrics = PipelineMetrics()
 
-        ## predictions are only made on known time controls
-        predictions = test_data[
-            test_data["time_control"].isin(TimeControl.ALL.value)
-        ].copy()
-        predictions["is_anomaly"] = predictions.apply(
-            lambda row: row["mean_perf_diff"]
-            > self._thresholds[(row["time_control"], "perf_delta_thresholds")][
-                f"{row['rating_bin']}-{row['rating_bin']+100}"
-            ],
-            axis=1,
-        )
+        with metrics.stage("predict"):
+            ## predictions are only made on known time controls
+            predictions = test_data[
+                test_data["time_control"].isin(TimeControl.ALL.value)
+            ].copy()
+            predictions["is_anomaly"] = predictions[
+                "mean_perf_diff"
+            ].to_numpy() > self.get_thresholds(predictions)
 
-        predictions["account_status"] = predictions.apply(
-            lambda row: self._player_account_handler._account_statuses.get(
-                row["player"]
-            ),
-            axis=1,
-        )
+            ## unknown account statuses are None
+            account_statuses = (
+                predictions["player"]
+                .map(self._player_account_handler._account_statuses)
+                .astype(object)
+            )
+            predictions["account_status"] = account_statuses.where(
+                account_statuses.notna(), None
+            )
+            metrics.set_counts(
+                rows=len(test_data), anomalies=int(predictions["is_anomaly"].sum())
+            )
 
         return predictions
 
     def save_model(
         self,
-        model_name: str = "player_anomaly_detection_model",
+        model_name: str = DEFAULT_MODEL_NAME,
         saved_models_folder=Folders.SAVED_MODELS.value,
-    ):
-        if not os.path.exists(Folders.SAVED_MODELS.value):
-            os.mkdir(Folders.SAVED_MODELS.value)
-        if os.path.exists(f"{Folders.SAVED_MODELS.value}/{model_name}"):
+    ) -> str:
+        """Saves the thresholds, train metrics and metadata of the model to {model_name}.model
+        in the saved models folder without overwriting an existing model, and returns the path of the file.
+        """
+        if not os.path.exists(saved_models_folder):
+            os.mkdir(saved_models_folder)
+        while os.path.exists(
+            f"{saved_models_folder}/{model_name}{MODEL_FILE_EXTENSION}"
+        ):
             model_name = model_name + "_"
 
-        with open(f"{Folders.SAVED_MODELS.value}/{model_name}.pkl", "wb") as f:
-            pickle.dump(self._thresholds, f)
+        model_file_path = f"{saved_models_folder}/{model_name}{MODEL_FILE_EXTENSION}"
+        write_model_file(
+            model_file_path,
+            arrays={
+                "thresholds": self._threshold_table,
+                "threshold_metrics": self._threshold_metric_table,
+            },
+            metadata={
+                "is_fitted": self.is_fitted,
+                "time_controls": TimeControl.ALL.value,
+                "rating_bin_size": RATING_BIN_SIZE,
+                "min_threshold": self._min_threshold,
+                "account_status_score_map": self._account_status_score_map,
+                "fit_timings": self.fit_timings,
+                "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            },
+        )
+        return model_file_path
@@ -1,12 +1,14 @@
-import json
+import argparse
 import os
+from pathlib import Path
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import plotly.io as pio
 
-def generate_model_threshold_plots(
-    base_file_name,
-    model_plots_folder,
+from enums import Folders
+from player_data_io import THRESHOLD_CURVES_FILE_SUFFIX, read_threshold_curves
+
+
+def make_model_threshold_figure(
     train_threshold_list,
     train_accuracy_list,
     train_metric_list,
@@ -15,21 +17,21 @@ def generate_model_threshold_plots(
     time_control,
     rating_bin_key,
 ):
-    """Generate model threshold plots showing accuracy and number of players vs model threshold(s)."""
+    """Returns the model threshold figure showing accuracy and number of players vs model threshold(s)."""
 
     fig = make_subplots(specs=[[{"secondary_y": True}]])
     fig.add_trace(
         go.Scatter(
-            x=train_threshold_list, 
-            y=train_metric_list, 
+            x=train_threshold_list,
+            y=train_metric_list,
             name="Train Metric"
         ),
         secondary_y=False,
     )
     fig.add_trace(
         go.Scatter(
-            x=train_threshold_list, 
-            y=train_accuracy_list, 
+            x=train_threshold_list,
+            y=train_accuracy_list,
             name="Accuracy"
         ),
         secondary_y=False,
@@ -56,15 +58,105 @@ def generate_model_threshold_plots(
         yaxis2_title="Number of Flagged Players",
         yaxis_range=[0, 1],
     )
+    return fig
+
+
+def generate_model_threshold_plots(
+    base_file_name,
+    model_plots_folder,
+    train_threshold_list,
+    train_accuracy_list,
+    train_metric_list,
+    train_number_of_flagged_players,
+    best_threshold,
+    time_control,
+    rating_bin_key,
+):
+    """Generate model threshold plots showing accuracy and number of players vs model threshold(s)."""
+
+    fig = make_model_threshold_figure(
+        train_threshold_list,
+        train_accuracy_list,
+        train_metric_list,
+        train_number_of_flagged_players,
+        best_threshold,
+        time_control,
+        rating_bin_key,
+    )
     if not os.path.exists(model_plots_folder):
         os.mkdir(model_plots_folder)
-    
+
     # fig.write_html(
     #     f"{model_plots_folder}/{base_file_name}_model_thresholds_{time_control}_{rating_bin_key}.html"
     # )
 
     ## we may want both htmls and jsons that can be used to directly import and access the figure objects
-    fig_json = fig.to_json()
+    ## the figure json is written as is, so it can be read with plotly.io.read_json
     model_plot_filename = f"{model_plots_folder}/{base_file_name}_model_thresholds_{time_control}_{rating_bin_key}.json"
-    with open(model_plot_filename, 'w') as f:
-        json.dump(fig_json, f)
\ No newline at end of file
+    with open(model_plot_filename, "w") as f:
+        f.write(fig.to_json())
+
+
+def get_model_threshold_figure(threshold_curves_file_path, time_control, rating_bin):
+    """Returns the model threshold figure of one (rating bin, time control) from a threshold curves file,
+    reading only the rows of that rating bin.
+    """
+    threshold_curve = read_threshold_curves(
+        threshold_curves_file_path,
+        filters=[("time_control", "==", time_control), ("rating_bin", "==", rating_bin)],
+    )
+    return make_model_threshold_figure(
+        threshold_curve["threshold"].tolist(),
+        threshold_curve["accuracy"].tolist(),
+        threshold_curve["metric"].tolist(),
+        threshold_curve["number_of_flagged_players"].tolist(),
+        threshold_curve["best_threshold"].iloc[0],
+        time_control,
+        f"{rating_bin}-{rating_bin+100}",
+    )
+
+
+def generate_model_threshold_plots_from_curves(
+    threshold_curves_file_path, model_plots_folder=Folders.MODEL_PLOTS.value
+):
+    """Generates the model threshold plots of every (rating bin, time control) in a threshold curves file."""
+    base_file_name = Path(threshold_curves_file_path).name.removesuffix(
+        THRESHOLD_CURVES_FILE_SUFFIX
+    )
+    threshold_curves = read_threshold_curves(threshold_curves_file_path)
+    for (time_control, rating_bin), threshold_curve in threshold_curves.groupby(
+        ["time_control", "rating_bin"], observed=True
+    ):
+        generate_model_threshold_plots(
+            base_file_name,
+            model_plots_folder,
+            threshold_curve["threshold"].tolist(),
+            threshold_curve["accuracy"].tolist(),
+            threshold_curve["metric"].tolist(),
+            threshold_curve["number_of_flagged_players"].tolist(),
+            threshold_curve["best_threshold"].iloc[0],
+            time_control,
+            f"{rating_bin}-{rating_bin+100}",
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate model threshold plots from a threshold curves file"
+    )
+    parser.add_argument(
+        "THRESHOLD_CURVES_FILE_PATH",
+        type=str,
+        help="Path to the threshold curves file written when fitting the model",
+    )
+    parser.add_argument(
+        "--model-plots-folder",
+        type=str,
+        default=Folders.MODEL_PLOTS.value,
+        help="Folder to save the model threshold plots to",
+    )
+    args = parser.parse_args()
+
+    generate_model_threshold_plots_from_curves(
+        args.THRESHOLD_CURVES_FILE_PATH, args.model_plots_folder
+    )
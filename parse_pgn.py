@@ -1,209 +1,768 @@
 import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import io
 import os
+import pickle
+import re
+import time
+from typing import Callable, Optional
 import pandas as pd
 import chess.pgn
-import zstandard as zstd
+import pyzstd
 from enums import TimeControl, Folders
+from game_count_sketch import (
+    GameCountSketch,
+    get_game_count_sketch_width,
+    get_key_hash,
+)
 from pathlib import Path
+from http_stream import HttpStream, is_url
+from pipeline_metrics import PipelineMetrics, get_default_metrics_file_path
+from player_data_io import FILE_FORMATS, write_raw_games
+from player_info_accumulator import PlayerInfoAccumulator
 
+## byte-level equivalents of chess.pgn.TAG_REGEX and chess.pgn.SKIP_MOVETEXT_REGEX
+TAG_REGEX = re.compile(rb'^\[([A-Za-z0-9][A-Za-z0-9_+#=:-]*)\s+"([^\r]*)"\]\s*$')
+SKIP_MOVETEXT_REGEX = re.compile(rb";|\{|\}")
 
-all_player_info = {}
-# dictionary storing player info in the following format:
-# {
-#     ('player1', 'bullet'): {
-#         'ratings': [rating1, rating2, ...],
-#         'opponent_ratings': [opp_rating1, opp_rating2, ...],
-#         'actual_scores': [score1, score2, ...],
-#         'rating_gains': [rating_gain1, rating_gain2, ...]
-#         'increments': [increment1, increment2, ...]
-#     },
-#     ('player1', 'blitz'): {
-#         ...
-#     },
-#     ...
-#     ('playerN', 'bullet'): {
-#         ...
-#     }
-# }
-
-
-def update_all_player_info(
-    player: str,
-    time_control: str,
-    current_rating: float,
-    opponent_rating: float,
-    score: int,
-    rating_gain: float,
-    is_increment: int,
-    all_player_info: dict = all_player_info,
-) -> None:
-    """Updates all_player_info dictionary with the information from a single game."""
-
-    # this particular (player, time control) has not been added to all_player_info
-    if (all_player_info.get((player, time_control)) is None) & (
-        current_rating != 1500.0
-    ):
-        all_player_info[(player, time_control)] = {
-            "ratings": [current_rating],
-            "opponent_ratings": [opponent_rating],
-            "actual_scores": [score],
-            "rating_gains": [rating_gain],
-            "increments": [is_increment],
-        }
-
-    # exclude a rating of 1500.0 exactly as this could be a first game
-    # refine analysis by excluding the first N_0 = 10 games if the first rating is 1500.0
-    elif (all_player_info.get((player, time_control)) is None) & (
-        current_rating == 1500.0
-    ):
-        pass
+## size of each compressed chunk read from a .pgn.zst file, which bounds memory use while streaming
+ZST_READ_SIZE = 2**20
+
+## approximate size of the decompressed chunks of games sent to each worker when parsing in parallel
+CHUNK_SIZE = 2**24
+
+## with a checkpoint file, a checkpoint is written after the first chunk of games parsed
+## at least CHECKPOINT_INTERVAL_SECONDS after the previous checkpoint
+CHECKPOINT_INTERVAL_SECONDS = 300
+CHECKPOINT_FORMAT_VERSION = 1
+
+## progress is printed and the metrics are updated every PROGRESS_INTERVAL [valid] games
+PROGRESS_INTERVAL = 10000
+
+## reasons a game is skipped, in the order they are checked
+SKIP_REASONS = [
+    "unknown_player",
+    "unknown_rating",
+    "missing_rating_diff",
+    "unfinished_game",
+]
+
+## chess.pgn.Headers always starts with the seven tag roster
+DEFAULT_HEADERS = {
+    "Event": "?",
+    "Site": "?",
+    "Date": "????.??.??",
+    "Round": "?",
+    "White": "?",
+    "Black": "?",
+    "Result": "*",
+}
+
+
+class ZstdPgnFile(pyzstd.ZstdFile):
+    """A .pgn.zst file opened in binary mode, which is decompressed in chunks as it is read,
+    and which also closes the compressed file it reads from.
+    """
+
+    def __init__(self, compressed_file):
+        self.compressed_file = compressed_file
+        super().__init__(compressed_file, "rb", read_size=ZST_READ_SIZE)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.compressed_file.close()
+
+
+def open_pgn(PGN_FILE_PATH, tee_file_path=None, expected_sha256: str = None):
+    """Opens a .pgn file, or a .pgn.zst file which is decompressed in chunks as it is read, in binary mode.
+    PGN_FILE_PATH can also be an http(s) URL, whose response is decompressed and read as it is downloaded
+    without being written to disk, unless a tee_file_path is passed (see HttpStream).
+    """
+    if is_url(PGN_FILE_PATH):
+        stream = HttpStream(PGN_FILE_PATH, tee_file_path, expected_sha256)
+        if PGN_FILE_PATH.endswith(".zst"):
+            return ZstdPgnFile(stream)
+        return io.BufferedReader(stream, ZST_READ_SIZE)
+    if str(PGN_FILE_PATH).endswith(".zst"):
+        return ZstdPgnFile(open(PGN_FILE_PATH, "rb"))
+    return open(PGN_FILE_PATH, "rb")
+
+
+def get_compressed_offset(pgn) -> int:
+    """Returns the number of bytes read from the file of a pgn file opened with open_pgn,
+    which for a .pgn.zst file includes compressed bytes that have not been decompressed yet.
+    """
+    if isinstance(pgn, ZstdPgnFile):
+        return pgn.compressed_file.tell()
+    return pgn.tell()
+
+
+def read_game_headers(pgn) -> Optional[dict]:
+    """Reads the headers of the next game from a pgn file opened in binary mode and skips over its movetext.
+    This follows the same rules as chess.pgn.read_game for where a game starts and ends, so the result
+    is equal to chess.pgn.read_game(pgn).headers, but no moves or boards are built.
+    Returns None when the end of the file is reached.
+    """
+
+    # ignore leading empty lines and comments
+    line = pgn.readline().lstrip(b"\xef\xbb\xbf")
+    while line.isspace() or line.startswith(b"%") or line.startswith(b";"):
+        line = pgn.readline()
+
+    # parse game headers, ignoring up to one consecutive empty line between headers
+    headers = None
+    consecutive_empty_lines = 0
+    while line:
+        if line.startswith(b"%") or line.startswith(b";"):
+            line = pgn.readline()
+            continue
+
+        if consecutive_empty_lines < 1 and line.isspace():
+            consecutive_empty_lines += 1
+            line = pgn.readline()
+            continue
+
+        if headers is None:
+            headers = DEFAULT_HEADERS.copy()
+
+        if not line.startswith(b"["):
+            break
+
+        consecutive_empty_lines = 0
+        tag_match = TAG_REGEX.match(line)
+        if tag_match:
+            headers[tag_match.group(1).decode()] = tag_match.group(2).decode()
+        line = pgn.readline()
+
+    if headers is None:
+        return None
+
+    # skip the movetext: the game ends at the first empty line outside of a {comment}
+    in_comment = False
+    while line:
+        if not in_comment:
+            if line.isspace():
+                break
+            elif line.startswith(b"%"):
+                line = pgn.readline()
+                continue
 
-    # this particular (player, time control) is already in all_player_info
-    # so update or append each field as needed
+        if b"{" in line or b"}" in line or b";" in line:
+            for match in SKIP_MOVETEXT_REGEX.finditer(line):
+                token = match.group(0)
+                if token == b"{":
+                    in_comment = True
+                elif not in_comment and token == b";":
+                    break
+                elif token == b"}":
+                    in_comment = False
+
+        line = pgn.readline()
+
+    return headers
+
+
+def iter_game_headers(pgn, headers_only: bool = False):
+    """Yields the headers of each game in a pgn file opened in binary mode.
+    With headers_only=True the movetext is skipped by read_game_headers,
+    otherwise every game is fully parsed with chess.pgn.read_game.
+    """
+    if headers_only:
+        while True:
+            headers = read_game_headers(pgn)
+            if headers is None:
+                return
+            yield headers
     else:
-        all_player_info[(player, time_control)]["ratings"].append(current_rating)
-        all_player_info[(player, time_control)]["opponent_ratings"].append(
-            opponent_rating
-        )
-        all_player_info[(player, time_control)]["actual_scores"].append(score)
-        all_player_info[(player, time_control)]["rating_gains"].append(rating_gain)
-        all_player_info[(player, time_control)]["increments"].append(is_increment)
+        pgn_text = io.TextIOWrapper(pgn, encoding="utf-8")
+        try:
+            while True:
+                game = chess.pgn.read_game(pgn_text)
+                if game is None:
+                    return
+                yield game.headers
+        finally:
+            ## the wrapper would close pgn when it is collected, but pgn belongs to the caller
+            if not pgn.closed:
+                pgn_text.detach()
+
+
+def get_time_control(event: str) -> str:
+    """Returns the time control named in the Event header of a game."""
+    event = event.lower()
+    if TimeControl.BULLET.value in event:
+        return TimeControl.BULLET.value
+    elif TimeControl.BLITZ.value in event:
+        return TimeControl.BLITZ.value
+    elif TimeControl.RAPID.value in event:
+        return TimeControl.RAPID.value
+    elif TimeControl.CLASSICAL.value in event:
+        return TimeControl.CLASSICAL.value
+    else:
+        return TimeControl.OTHER.value
+
+
+def get_skip_reason(headers) -> Optional[str]:
+    """Returns the reason a game is skipped (one of SKIP_REASONS), or None if the game is used."""
+
+    # skip games with unknown players, ratings, rating difference, or result
+    # if either opponent has not played rated games, their rating is 1500
+    # but a rating difference is not calculated because this rating is misleading
+    # therefore, we will exclude such games
+    white_player, black_player = headers.get("White"), headers.get("Black")
+    if white_player is None or black_player is None:
+        return "unknown_player"
+    if "?" in white_player or "?" in black_player:
+        return "unknown_player"
+    if "?" in str(headers.get("WhiteElo")) or "?" in str(headers.get("BlackElo")):
+        return "unknown_rating"
+    if headers.get("WhiteRatingDiff") is None or headers.get("BlackRatingDiff") is None:
+        return "missing_rating_diff"
+    if headers["Result"] not in ["1-0", "0-1", "1/2-1/2"]:
+        return "unfinished_game"
+    return None
 
 
-def parse_pgn(PGN_FILE_PATH):
-    """Parses the pgn file and extracts information from each game, calls update_all_player_info after each game,
-    and creates a DataFrameom from all_player_info which is then written to a csv file.
+def update_all_player_info_from_headers(
+    headers, all_player_info: PlayerInfoAccumulator, skipped_games: dict = None
+) -> bool:
+    """Updates all_player_info with both players of a single game,
+    and returns False if the game was skipped. If skipped_games is passed,
+    the number of skipped games for the reason the game was skipped is incremented.
     """
 
-    print(f"Parsing {PGN_FILE_PATH}...")
+    skip_reason = get_skip_reason(headers)
+    if skip_reason is not None:
+        if skipped_games is not None:
+            skipped_games[skip_reason] = skipped_games.get(skip_reason, 0) + 1
+        return False
 
-    if not os.path.exists(Folders.LICHESS_PLAYER_DATA.value):
-        os.mkdir(Folders.LICHESS_PLAYER_DATA.value)
+    # get time control
+    time_control = get_time_control(headers["Event"])
+
+    # get info for both players
+    white_player, black_player = headers["White"], headers["Black"]
+    white_rating, black_rating = headers["WhiteElo"], headers["BlackElo"]
+    white_gain, black_gain = headers["WhiteRatingDiff"], headers["BlackRatingDiff"]
+    increment = headers["TimeControl"][0]
+    result = headers["Result"]
+
+    white_score = 1 if result == "1-0" else 0.5 if result == "1/2-1/2" else 0
+    black_score = 0 if result == "1-0" else 0.5 if result == "1/2-1/2" else 1
 
-    pgn = open(PGN_FILE_PATH)
+    ## only convert rating and rating gain to a number once we know it's not None
+    white_rating = float(white_rating)
+    black_rating = float(black_rating)
+    white_gain = float(white_gain)
+    black_gain = float(black_gain)
 
-    # parse the pgn file, and extract information from each game
+    is_increment = 0 if increment == "0" else 1
+
+    # update white player info
+    all_player_info.add_game(
+        player=white_player,
+        time_control=time_control,
+        current_rating=white_rating,
+        opponent_rating=black_rating,
+        score=white_score,
+        rating_gain=white_gain,
+        is_increment=is_increment,
+    )
+
+    # update black player info
+    all_player_info.add_game(
+        player=black_player,
+        time_control=time_control,
+        current_rating=black_rating,
+        opponent_rating=white_rating,
+        score=black_score,
+        rating_gain=black_gain,
+        is_increment=is_increment,
+    )
+    return True
+
+
+def parse_games(
+    pgn,
+    all_player_info: PlayerInfoAccumulator,
+    headers_only: bool = False,
+    print_progress: bool = True,
+    skipped_games: dict = None,
+    metrics: PipelineMetrics = None,
+) -> int:
+    """Reads every game from a pgn file opened in binary mode into all_player_info,
+    and returns the number of [valid] games parsed. Skipped games are counted by reason in skipped_games,
+    and the games_parsed count of the current stage of metrics is updated every PROGRESS_INTERVAL games.
+    """
     number_of_games_parsed = 0
+    for headers in iter_game_headers(pgn, headers_only):
+        if update_all_player_info_from_headers(headers, all_player_info, skipped_games):
+            number_of_games_parsed += 1
+            if number_of_games_parsed % PROGRESS_INTERVAL == 0:
+                if print_progress:
+                    print(f"{number_of_games_parsed} games parsed...")
+                if metrics is not None:
+                    metrics.set_counts(games_parsed=number_of_games_parsed)
+                    metrics.emit_if_due()
+    return number_of_games_parsed
+
+
+def find_last_game_start(buffer: bytes) -> int:
+    """Returns the index in buffer of the last line starting with an [Event tag that follows an empty line,
+    or 0 if there is none. Games are only split at these lines so that no game is cut in half.
+    """
+    position = len(buffer)
     while True:
-        game = chess.pgn.read_game(pgn)
-        if game is None:
-            print(f"{number_of_games_parsed} [valid] games parsed.")
-            break
+        position = buffer.rfind(b"\n[Event ", 0, position)
+        if position <= 0:
+            return 0
+        previous_line_start = buffer.rfind(b"\n", 0, position) + 1
+        if buffer[previous_line_start : position + 1].isspace():
+            return position + 1
 
-        headers = game.headers
-
-        # get time control
-        event = headers["Event"]
-        if TimeControl.BULLET.value in event.lower():
-            time_control = TimeControl.BULLET.value
-        elif TimeControl.BLITZ.value in event.lower():
-            time_control = TimeControl.BLITZ.value
-        elif TimeControl.RAPID.value in event.lower():
-            time_control = TimeControl.RAPID.value
-        elif TimeControl.CLASSICAL.value in event.lower():
-            time_control = TimeControl.CLASSICAL.value
-        else:
-            time_control = TimeControl.OTHER.value
 
-        # get info for both players
-        white_player, black_player = headers.get("White"), headers.get("Black")
-        white_rating, black_rating = headers.get("WhiteElo"), headers.get("BlackElo")
-        white_gain, black_gain = headers.get("WhiteRatingDiff"), headers.get(
-            "BlackRatingDiff"
-        )
-        increment = headers["TimeControl"][0]
-        result = headers["Result"]
-
-        # skip games with unknown players, ratings, rating difference, or result
-        # if either opponent has not played rated games, their rating is 1500
-        # but a rating difference is not calculated because this rating is misleading
-        # therefore, we will exclude such games
-        skip_game_condition = (
-            ("?" in white_player)
-            | ("?" in black_player)
-            | (white_player is None)
-            | (black_player is None)
-            | ("?" in str(white_rating))
-            | ("?" in str(black_rating))
-            | (white_gain is None)
-            | (black_gain is None)
-            | (result not in ["1-0", "0-1", "1/2-1/2"])
-        )
-        if skip_game_condition:
+def iter_game_chunks(pgn, chunk_size: int = CHUNK_SIZE):
+    """Yields consecutive chunks of roughly chunk_size bytes from a pgn file opened in binary mode,
+    where each chunk only contains complete games.
+    """
+    remainder = b""
+    while True:
+        data = pgn.read(chunk_size)
+        if not data:
+            if remainder:
+                yield remainder
+            return
+        buffer = remainder + data
+        split_index = find_last_game_start(buffer)
+        if split_index == 0:
+            remainder = buffer
             continue
+        yield buffer[:split_index]
+        remainder = buffer[split_index:]
+
+
+def iter_parsed_game_chunks(
+    pgn,
+    headers_only: bool = False,
+    n_jobs: int = None,
+    chunk_size: int = CHUNK_SIZE,
+    parse_chunk: Callable = None,
+):
+    """Yields the size in bytes and the result of parse_chunk (parse_game_chunk by default) of each chunk of games
+    from iter_game_chunks, in order. With n_jobs=1 the chunks are parsed in this process, otherwise by a pool
+    of n_jobs worker processes.
+    """
+    parse_chunk = parse_chunk or parse_game_chunk
+    chunks = iter_game_chunks(pgn, chunk_size)
+    if n_jobs == 1:
+        for chunk in chunks:
+            yield len(chunk), parse_chunk(chunk, headers_only)
+        return
+
+    n_jobs = n_jobs or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        ## only keep a bounded number of chunks in flight so that memory use stays flat
+        pending_chunks = []
+        while True:
+            for chunk in chunks:
+                pending_chunks.append(
+                    (len(chunk), executor.submit(parse_chunk, chunk, headers_only))
+                )
+                if len(pending_chunks) >= 2 * n_jobs:
+                    break
+            if not pending_chunks:
+                return
+            chunk_length, chunk_result = pending_chunks.pop(0)
+            yield chunk_length, chunk_result.result()
+
+
+def parse_game_chunk(chunk: bytes, headers_only: bool = False):
+    """Parses a chunk of complete games in a worker process, and returns the number of games parsed,
+    the player info of the chunk, which can be merged with PlayerInfoAccumulator.merge,
+    and the number of skipped games by reason.
+    """
+    chunk_player_info = PlayerInfoAccumulator(keep_skipped_games=True)
+    chunk_skipped_games = {}
+    number_of_games_parsed = parse_games(
+        io.BytesIO(chunk),
+        chunk_player_info,
+        headers_only,
+        print_progress=False,
+        skipped_games=chunk_skipped_games,
+    )
+    return number_of_games_parsed, chunk_player_info, chunk_skipped_games
+
+
+def iter_key_hash_batches(pgn, headers_only: bool = True, batch_size: int = PROGRESS_INTERVAL):
+    """Yields the get_key_hash of both players of each game of a pgn file opened in binary mode that is not skipped,
+    including games at a rating of 1500.0, in batches of batch_size games, so that the games of each
+    (player, time control) can be counted.
+    """
+    key_hashes = array("Q")
+    for headers in iter_game_headers(pgn, headers_only):
+        if get_skip_reason(headers) is None:
+            time_control = get_time_control(headers["Event"])
+            key_hashes.append(get_key_hash(headers["White"], time_control))
+            key_hashes.append(get_key_hash(headers["Black"], time_control))
+            if len(key_hashes) >= 2 * batch_size:
+                yield key_hashes
+                key_hashes = array("Q")
+    if key_hashes:
+        yield key_hashes
+
+
+def count_game_chunk(chunk: bytes, headers_only: bool = True) -> array:
+    """Returns the key hashes of every game of a chunk of complete games in a worker process (see iter_key_hash_batches)."""
+    key_hashes = array("Q")
+    for key_hash_batch in iter_key_hash_batches(io.BytesIO(chunk), headers_only):
+        key_hashes.extend(key_hash_batch)
+    return key_hashes
+
+
+def count_player_games(
+    PGN_FILE_PATH, n_jobs: int = 1, metrics: PipelineMetrics = None
+) -> GameCountSketch:
+    """Reads only the headers of every game of a pgn file, and returns a GameCountSketch of the number
+    of games of each (player, time control), which is an upper bound of its number of rows in the raw features.
+    The number of [valid] games counted is recorded in the games count of the current stage of metrics.
+    """
+    game_counts = GameCountSketch(
+        width=get_game_count_sketch_width(os.path.getsize(PGN_FILE_PATH))
+    )
+    number_of_games = 0
+    with open_pgn(PGN_FILE_PATH) as pgn:
+        if n_jobs == 1:
+            key_hash_batches = iter_key_hash_batches(pgn)
         else:
-            white_score = 1 if result == "1-0" else 0.5 if result == "1/2-1/2" else 0
-            black_score = 0 if result == "1-0" else 0.5 if result == "1/2-1/2" else 1
-
-            ## only convert rating and rating gain to a number once we know it's not None
-            white_rating = float(white_rating)
-            black_rating = float(black_rating)
-            white_gain = float(white_gain)
-            black_gain = float(black_gain)
-
-            is_increment = 0 if increment == "0" else 1
-
-            # update white player info
-            update_all_player_info(
-                player=white_player,
-                time_control=time_control,
-                current_rating=white_rating,
-                opponent_rating=black_rating,
-                score=white_score,
-                rating_gain=white_gain,
-                is_increment=is_increment,
+            key_hash_batches = (
+                key_hashes
+                for _, key_hashes in iter_parsed_game_chunks(
+                    pgn, True, n_jobs, CHUNK_SIZE, parse_chunk=count_game_chunk
+                )
             )
+        for key_hashes in key_hash_batches:
+            game_counts.add_hashes(key_hashes)
+            number_of_games += len(key_hashes) // 2
+            print(f"{number_of_games} games counted...")
+            if metrics is not None:
+                metrics.set_counts(games=number_of_games)
+                metrics.emit_if_due()
+    return game_counts
 
-            # update black player info
-            update_all_player_info(
-                player=black_player,
-                time_control=time_control,
-                current_rating=black_rating,
-                opponent_rating=white_rating,
-                score=black_score,
-                rating_gain=black_gain,
-                is_increment=is_increment,
-            )
 
-            number_of_games_parsed += 1
-            if number_of_games_parsed % 10000 == 0:
-                print(f"{number_of_games_parsed} games parsed...")
-
-    # convert to pandas DataFrame
-    all_player_df = pd.DataFrame.from_dict(
-        all_player_info,
-        orient="index",
-        columns=[
-            "ratings",
-            "opponent_ratings",
-            "actual_scores",
-            "rating_gains",
-            "increments",
-        ],
-    )
-
-    # explode all_player_df to each row corresponds to one game
-    all_player_games_exploded = all_player_df.explode(
-        column=[
-            "ratings",
-            "opponent_ratings",
-            "actual_scores",
-            "rating_gains",
-            "increments",
-        ]
-    )
-
-    # save to csv
+def parse_games_parallel(
+    pgn,
+    all_player_info: PlayerInfoAccumulator,
+    headers_only: bool = False,
+    n_jobs: int = None,
+    chunk_size: int = CHUNK_SIZE,
+    skipped_games: dict = None,
+    metrics: PipelineMetrics = None,
+    after_chunk: Callable[[int, int], None] = None,
+) -> int:
+    """Splits a pgn file opened in binary mode into chunks of complete games which are parsed by a pool of
+    n_jobs worker processes (or in this process with n_jobs=1), and merges the results into all_player_info
+    in game order. The result is identical to parse_games. Returns the number of [valid] games parsed.
+    After each chunk is merged, after_chunk is called with the number of games parsed and of bytes read so far,
+    which is where the next game starts.
+    """
+    number_of_games_parsed, number_of_bytes_parsed = 0, 0
+    for chunk_length, chunk_result in iter_parsed_game_chunks(
+        pgn, headers_only, n_jobs, chunk_size
+    ):
+        chunk_number_of_games_parsed, chunk_player_info, chunk_skipped_games = chunk_result
+        all_player_info.merge(chunk_player_info)
+        number_of_games_parsed += chunk_number_of_games_parsed
+        number_of_bytes_parsed += chunk_length
+        if skipped_games is not None:
+            for skip_reason, count in chunk_skipped_games.items():
+                skipped_games[skip_reason] = skipped_games.get(skip_reason, 0) + count
+        print(f"{number_of_games_parsed} games parsed...")
+        if metrics is not None:
+            metrics.set_counts(games_parsed=number_of_games_parsed)
+            metrics.emit_if_due()
+        if after_chunk is not None:
+            after_chunk(number_of_games_parsed, number_of_bytes_parsed)
+    return number_of_games_parsed
+
+
+def get_checkpoint_file_path(PGN_FILE_PATH) -> str:
+    """Returns the default path of the checkpoint file of a pgn file, in the lichess_player_data directory."""
     BASE_FILE_NAME = Path(PGN_FILE_PATH).stem.split(".")[0]
-    all_player_games_exploded.to_csv(
-        f"{Folders.LICHESS_PLAYER_DATA.value}/{BASE_FILE_NAME}.csv"
-    )
+    return f"{Folders.LICHESS_PLAYER_DATA.value}/{BASE_FILE_NAME}.parse_pgn_checkpoint"
+
+
+def write_checkpoint(checkpoint_file_path, checkpoint: dict) -> None:
+    """Pickles a checkpoint to a temporary file which then replaces the checkpoint file,
+    so that a crash while writing leaves the previous checkpoint.
+    """
+    checkpoint_folder = os.path.dirname(checkpoint_file_path)
+    if checkpoint_folder:
+        os.makedirs(checkpoint_folder, exist_ok=True)
+    temporary_file_path = f"{checkpoint_file_path}.tmp"
+    with open(temporary_file_path, "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_file_path, checkpoint_file_path)
+
+
+def read_checkpoint(
+    checkpoint_file_path,
+    pgn_file_size: int,
+    headers_only: bool,
+    min_games_prefilter: bool = False,
+) -> Optional[dict]:
+    """Returns the checkpoint in the checkpoint file if it was written while parsing a file of the same size
+    in the same mode, or None if there is no such checkpoint.
+    """
+    if not os.path.exists(checkpoint_file_path):
+        return None
+    with open(checkpoint_file_path, "rb") as f:
+        checkpoint = pickle.load(f)
+    if (
+        checkpoint.get("format_version") != CHECKPOINT_FORMAT_VERSION
+        or checkpoint["pgn_file_size"] != pgn_file_size
+        or checkpoint["headers_only"] != headers_only
+        or checkpoint.get("min_games_prefilter", False) != min_games_prefilter
+    ):
+        print(f"Ignoring {checkpoint_file_path}, which was written for a different file")
+        return None
+    return checkpoint
+
+
+def parse_pgn(
+    PGN_FILE_PATH,
+    headers_only=False,
+    n_jobs=1,
+    output_format="csv",
+    metrics: PipelineMetrics = None,
+    write_output=True,
+    checkpoint_file_path=None,
+    checkpoint_interval_seconds=CHECKPOINT_INTERVAL_SECONDS,
+    tee_file_path=None,
+    expected_sha256: str = None,
+    min_games_prefilter=False,
+) -> pd.DataFrame:
+    """Parses the pgn file and extracts information from each game into a PlayerInfoAccumulator,
+    and returns a DataFrame from all_player_info which is also written to a csv (or parquet) file if write_output=True.
+    PGN_FILE_PATH can also be a .pgn.zst file, which is decompressed as it is parsed, or an http(s) URL,
+    which is parsed as it is downloaded and optionally saved to tee_file_path (see open_pgn).
+    With headers_only=True, only the [Tag "value"] headers of each game are read and the moves are skipped.
+    With n_jobs > 1 (or None for all cores), chunks of games are parsed in parallel by a pool of worker processes.
+    With a checkpoint_file_path, all_player_info and the position of the next game are saved to it
+    about every checkpoint_interval_seconds, and parsing resumes from it if it exists, with the same result
+    as parsing the whole file. The checkpoint file is removed once the whole file is parsed.
+    With min_games_prefilter=True, a first pass over the headers counts the games of each (player, time control),
+    and only the games of those that can reach MIN_GAMES games are kept, which gives the same player features
+    with a fraction of the memory and raw features. The first pass is recorded in the count_player_games stage.
+    The time, memory, games parsed and skipped games by reason are recorded in the parse_pgn stage of metrics.
+    """
+    if metrics is None:
+        metrics = PipelineMetrics()
+    if is_url(PGN_FILE_PATH) and checkpoint_file_path is not None:
+        raise ValueError("Checkpoints can only be used when parsing a file, not a URL")
+    if is_url(PGN_FILE_PATH) and min_games_prefilter:
+        raise ValueError(
+            "The min games prefilter reads the file twice, so it can only be used when parsing a file, not a URL"
+        )
+
+    print(f"Parsing {PGN_FILE_PATH}...")
+
+    if write_output and not os.path.exists(Folders.LICHESS_PLAYER_DATA.value):
+        os.mkdir(Folders.LICHESS_PLAYER_DATA.value)
+
+    with metrics.stage("parse_pgn"):
+        # parse the pgn file, and extract information from each game
+        all_player_info = PlayerInfoAccumulator()
+        skipped_games = dict.fromkeys(SKIP_REASONS, 0)
+        checkpoint = None
+        if checkpoint_file_path is not None:
+            pgn_file_size = os.path.getsize(PGN_FILE_PATH)
+            checkpoint = read_checkpoint(
+                checkpoint_file_path, pgn_file_size, headers_only, min_games_prefilter
+            )
+        if checkpoint is not None:
+            print(
+                f"Resuming from {checkpoint_file_path} after {checkpoint['number_of_games_parsed']} games"
+            )
+            all_player_info = checkpoint["all_player_info"]
+            skipped_games = checkpoint["skipped_games"]
+            metrics.set_values(resumed_from_checkpoint=checkpoint["number_of_games_parsed"])
+        elif min_games_prefilter:
+            ## the game counts are pickled with all_player_info, so they are not counted again when resuming
+            with metrics.stage("count_player_games"):
+                game_counts = count_player_games(PGN_FILE_PATH, n_jobs, metrics)
+            all_player_info = PlayerInfoAccumulator(
+                key_filter=game_counts.may_reach_min_games
+            )
+        start_number_of_games_parsed = 0 if checkpoint is None else checkpoint["number_of_games_parsed"]
+        start_offset = 0 if checkpoint is None else checkpoint["decompressed_offset"]
+
+        with open_pgn(PGN_FILE_PATH, tee_file_path, expected_sha256) as pgn:
+            if checkpoint_file_path is None and n_jobs == 1:
+                number_of_games_parsed = parse_games(
+                    pgn,
+                    all_player_info,
+                    headers_only,
+                    skipped_games=skipped_games,
+                    metrics=metrics,
+                )
+            else:
+                ## checkpoints are written between chunks of games, which are parsed in this process with n_jobs=1,
+                ## and a .pgn.zst file is decompressed up to the start of the next game without parsing it
+                if start_offset:
+                    pgn.seek(start_offset)
+                last_checkpoint_time = time.perf_counter()
+
+                def write_checkpoint_if_due(number_of_games_parsed, number_of_bytes_parsed):
+                    nonlocal last_checkpoint_time
+                    if time.perf_counter() - last_checkpoint_time < checkpoint_interval_seconds:
+                        return
+                    write_checkpoint(
+                        checkpoint_file_path,
+                        {
+                            "format_version": CHECKPOINT_FORMAT_VERSION,
+                            "pgn_file_size": pgn_file_size,
+                            "headers_only": headers_only,
+                            "min_games_prefilter": min_games_prefilter,
+                            "number_of_games_parsed": start_number_of_games_parsed
+                            + number_of_games_parsed,
+                            "decompressed_offset": start_offset + number_of_bytes_parsed,
+                            "compressed_offset": get_compressed_offset(pgn),
+                            "skipped_games": skipped_games,
+                            "all_player_info": all_player_info,
+                        },
+                    )
+                    metrics.add_counts(checkpoints=1)
+                    last_checkpoint_time = time.perf_counter()
+
+                number_of_games_parsed = start_number_of_games_parsed + parse_games_parallel(
+                    pgn,
+                    all_player_info,
+                    headers_only,
+                    n_jobs,
+                    chunk_size=CHUNK_SIZE,
+                    skipped_games=skipped_games,
+                    metrics=metrics,
+                    after_chunk=None
+                    if checkpoint_file_path is None
+                    else write_checkpoint_if_due,
+                )
+            input_bytes = get_compressed_offset(pgn)
+        print(f"{number_of_games_parsed} [valid] games parsed.")
+        metrics.set_counts(
+            games=number_of_games_parsed + sum(skipped_games.values()),
+            games_parsed=number_of_games_parsed,
+            input_bytes=input_bytes,
+        )
+        metrics.set_values(skipped_games=skipped_games)
+
+        # one row per game, grouped by (player, time control)
+        all_player_games_df = all_player_info.to_frame()
+        metrics.set_counts(rows=len(all_player_games_df))
+
+        # save to csv or parquet
+        if write_output:
+            with metrics.stage("write_raw_games"):
+                BASE_FILE_NAME = Path(PGN_FILE_PATH).stem.split(".")[0]
+                write_raw_games(
+                    all_player_games_df,
+                    f"{Folders.LICHESS_PLAYER_DATA.value}/{BASE_FILE_NAME}.{output_format}",
+                )
+
+    if checkpoint_file_path is not None and os.path.exists(checkpoint_file_path):
+        os.remove(checkpoint_file_path)
+    return all_player_games_df
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Parse PGN file")
-    parser.add_argument("PGN_FILE_PATH", type=str, help="Path to the PGN file")
+    parser.add_argument(
+        "PGN_FILE_PATH",
+        type=str,
+        help="Path to the PGN (or .pgn.zst) file, or an http(s) URL which is parsed as it is downloaded",
+    )
+    parser.add_argument(
+        "--headers-only",
+        action="store_true",
+        help="Only read the headers of each game and skip parsing the moves",
+    )
+    parser.add_argument(
+        "--n-jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse the file, 0 uses all cores",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        default="csv",
+        choices=FILE_FORMATS,
+        help="Format of the output file",
+    )
+    parser.add_argument(
+        "--checkpoint-file-path",
+        type=str,
+        default=None,
+        help="Path to the checkpoint file to resume from and save to, "
+        "by default lichess_player_data/<file name>.parse_pgn_checkpoint",
+    )
+    parser.add_argument(
+        "--checkpoint-interval-seconds",
+        type=float,
+        default=CHECKPOINT_INTERVAL_SECONDS,
+        help="Save a checkpoint at most this often while parsing",
+    )
+    parser.add_argument(
+        "--no-checkpoint",
+        action="store_true",
+        help="Do not save checkpoints or resume from a checkpoint",
+    )
+    parser.add_argument(
+        "--min-games-prefilter",
+        action="store_true",
+        help="Count the games of each player first, and only keep the games of players who can reach MIN_GAMES",
+    )
+    parser.add_argument(
+        "--tee-file-path",
+        type=str,
+        default=None,
+        help="Save the file downloaded from an http(s) URL to this path while it is parsed",
+    )
+    parser.add_argument(
+        "--metrics-file-path",
+        type=str,
+        default=None,
+        help="Path to the json file of pipeline metrics, by default a new file in pipeline_metrics",
+    )
+    parser.add_argument(
+        "--metrics-interval-seconds",
+        type=float,
+        default=60,
+        help="Write the pipeline metrics at most this often while parsing",
+    )
     args = parser.parse_args()
 
     ## parse PGN file
-    parse_pgn(args.PGN_FILE_PATH)
+    BASE_FILE_NAME = Path(args.PGN_FILE_PATH).stem.split(".")[0]
+    parse_pgn(
+        args.PGN_FILE_PATH,
+        headers_only=args.headers_only,
+        n_jobs=args.n_jobs or None,
+        output_format=args.output_format,
+        metrics=PipelineMetrics(
+            args.metrics_file_path
+            or get_default_metrics_file_path(f"parse_pgn_{BASE_FILE_NAME}"),
+            emit_interval_seconds=args.metrics_interval_seconds,
+        ),
+        checkpoint_file_path=None
+        if args.no_checkpoint or is_url(args.PGN_FILE_PATH)
+        else args.checkpoint_file_path or get_checkpoint_file_path(args.PGN_FILE_PATH),
+        checkpoint_interval_seconds=args.checkpoint_interval_seconds,
+        tee_file_path=args.tee_file_path,
+        min_games_prefilter=args.min_games_prefilter,
+    )
@@ -0,0 +1,224 @@
+"""
+Runs the preprocessing stages of a pgn file in one process: parse_pgn, make_player_features and
+make_exploratory_plots are called as functions, and the raw features and player features are passed between
+them as DataFrames instead of being written to disk and read back by the next script.
+"""
+
+import argparse
+import os
+from pathlib import Path
+import pandas as pd
+
+from enums import Folders
+from http_stream import is_url
+from make_player_features import make_player_features
+from parse_pgn import get_checkpoint_file_path, parse_pgn
+from pipeline_metrics import PipelineMetrics, get_default_metrics_file_path
+from player_data_io import FILE_FORMATS, read_player_features, read_raw_games
+
+
+def get_output_file_paths(PGN_FILE_PATH, output_format="csv") -> tuple:
+    """Returns the paths of the raw features and player features files of a pgn file,
+    in the lichess_player_data directory like parse_pgn.py and make_player_features.py.
+    """
+    BASE_FILE_NAME = Path(PGN_FILE_PATH).stem.split(".")[0]
+    return (
+        f"{Folders.LICHESS_PLAYER_DATA.value}/{BASE_FILE_NAME}.{output_format}",
+        f"{Folders.LICHESS_PLAYER_DATA.value}/{BASE_FILE_NAME}_player_features.{output_format}",
+    )
+
+
+def is_up_to_date(output_file_path, *input_file_paths) -> bool:
+    """Returns True if the output file exists and was modified after every input file.
+    An input that is missing or is an http(s) URL may have changed, so the output is never up to date.
+    Outputs are written to a temporary file and then renamed, so an output that exists is complete.
+    """
+    if not os.path.exists(output_file_path):
+        return False
+    output_modified_time = os.path.getmtime(output_file_path)
+    return all(
+        not is_url(input_file_path)
+        and os.path.exists(input_file_path)
+        and output_modified_time >= os.path.getmtime(input_file_path)
+        for input_file_path in input_file_paths
+    )
+
+
+def preprocess_pgn(
+    PGN_FILE_PATH,
+    headers_only=True,
+    n_jobs=1,
+    output_format="csv",
+    save_raw_games=False,
+    save_player_features=False,
+    generate_exploratory_plots=False,
+    force=False,
+    metrics: PipelineMetrics = None,
+    checkpoint_file_path=None,
+    tee_file_path=None,
+    expected_sha256: str = None,
+    min_games_prefilter=False,
+) -> pd.DataFrame:
+    """Parses a .pgn (or .pgn.zst) file and returns its player features indexed by (player, time_control).
+    Each stage gets the DataFrame returned by the previous stage, and the raw features and player features are only
+    written to lichess_player_data if save_raw_games or save_player_features is True. Unless force=True, a stage
+    whose saved output is up to date (newer than its inputs) is skipped and its output is read from disk instead.
+    With a checkpoint_file_path, parse_pgn saves checkpoints to it and resumes from it (see parse_pgn).
+    PGN_FILE_PATH can also be an http(s) URL, which is parsed as it is downloaded (see parse_pgn).
+    With min_games_prefilter=True, parse_pgn only keeps the games of players who can reach MIN_GAMES games.
+    Any failing stage raises its exception, and each stage is recorded in metrics.
+    """
+    if metrics is None:
+        metrics = PipelineMetrics()
+    raw_games_file_path, player_features_file_path = get_output_file_paths(
+        PGN_FILE_PATH, output_format
+    )
+    if (save_raw_games or save_player_features) and not os.path.exists(
+        Folders.LICHESS_PLAYER_DATA.value
+    ):
+        os.mkdir(Folders.LICHESS_PLAYER_DATA.value)
+
+    ## the raw features are only an input of the player features if they were saved
+    player_features_input_file_paths = [PGN_FILE_PATH]
+    if os.path.exists(raw_games_file_path):
+        player_features_input_file_paths.append(raw_games_file_path)
+
+    if not force and is_up_to_date(
+        player_features_file_path, *player_features_input_file_paths
+    ):
+        print(f"{player_features_file_path} is up to date")
+        with metrics.stage("make_player_features"):
+            all_player_features = read_player_features(
+                player_features_file_path
+            ).set_index(["player", "time_control"])
+            metrics.set_counts(rows=len(all_player_features))
+            metrics.set_values(cached_file_path=player_features_file_path)
+    else:
+        if not force and is_up_to_date(raw_games_file_path, PGN_FILE_PATH):
+            print(f"{raw_games_file_path} is up to date")
+            with metrics.stage("parse_pgn"):
+                all_player_games_df = read_raw_games(raw_games_file_path)
+                metrics.set_counts(rows=len(all_player_games_df))
+                metrics.set_values(cached_file_path=raw_games_file_path)
+        else:
+            all_player_games_df = parse_pgn(
+                PGN_FILE_PATH,
+                headers_only=headers_only,
+                n_jobs=n_jobs,
+                output_format=output_format,
+                metrics=metrics,
+                write_output=save_raw_games,
+                checkpoint_file_path=checkpoint_file_path,
+                tee_file_path=tee_file_path,
+                expected_sha256=expected_sha256,
+                min_games_prefilter=min_games_prefilter,
+            )
+
+        all_player_features = make_player_features(
+            raw_games_file_path,
+            output_format=output_format,
+            metrics=metrics,
+            all_player_games_df=all_player_games_df,
+            write_output=save_player_features,
+        )
+        del all_player_games_df
+
+    if generate_exploratory_plots:
+        ## plotly is only imported when plots are generated
+        from make_exploratory_plots import make_exploratory_plots
+
+        with metrics.stage("make_exploratory_plots"):
+            make_exploratory_plots(
+                player_features_file_path, all_player_features=all_player_features
+            )
+
+    return all_player_features
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create player features from a PGN file in a single process"
+    )
+    parser.add_argument(
+        "PGN_FILE_PATH",
+        type=str,
+        help="Path to the PGN (or .pgn.zst) file, or an http(s) URL which is parsed as it is downloaded",
+    )
+    parser.add_argument(
+        "--read-moves",
+        action="store_true",
+        help="Parse the moves of each game instead of only reading the headers",
+    )
+    parser.add_argument(
+        "--n-jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse the file, 0 uses all cores",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        default="csv",
+        choices=FILE_FORMATS,
+        help="Format of the raw features and player features files",
+    )
+    parser.add_argument(
+        "--save-raw-games",
+        action="store_true",
+        help="Save the raw features file, so that later runs can skip parsing",
+    )
+    parser.add_argument(
+        "--generate-exploratory-plots",
+        action="store_true",
+        help="Generate exploratory plots",
+    )
+    parser.add_argument(
+        "--no-checkpoint",
+        action="store_true",
+        help="Do not save checkpoints while parsing or resume from a checkpoint",
+    )
+    parser.add_argument(
+        "--min-games-prefilter",
+        action="store_true",
+        help="Count the games of each player first, and only keep the games of players who can reach MIN_GAMES",
+    )
+    parser.add_argument(
+        "--tee-file-path",
+        type=str,
+        default=None,
+        help="Save the file downloaded from an http(s) URL to this path while it is parsed",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run every stage even if its saved output is up to date",
+    )
+    parser.add_argument(
+        "--metrics-file-path",
+        type=str,
+        default=None,
+        help="Path to the json file of pipeline metrics, by default a new file in pipeline_metrics",
+    )
+    args = parser.parse_args()
+
+    BASE_FILE_NAME = Path(args.PGN_FILE_PATH).stem.split(".")[0]
+    preprocess_pgn(
+        args.PGN_FILE_PATH,
+        headers_only=not args.read_moves,
+        n_jobs=args.n_jobs or None,
+        output_format=args.output_format,
+        save_raw_games=args.save_raw_games,
+        save_player_features=True,
+        generate_exploratory_plots=args.generate_exploratory_plots,
+        force=args.force,
+        metrics=PipelineMetrics(
+            args.metrics_file_path
+            or get_default_metrics_file_path(f"pipeline_{BASE_FILE_NAME}"),
+            emit_interval_seconds=60,
+        ),
+        checkpoint_file_path=None
+        if args.no_checkpoint or is_url(args.PGN_FILE_PATH)
+        else get_checkpoint_file_path(args.PGN_FILE_PATH),
+        tee_file_path=args.tee_file_path,
+        min_games_prefilter=args.min_games_prefilter,
+    )
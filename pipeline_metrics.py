@@ -0,0 +1,144 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import json
+import os
+import resource
+import sys
+import time
+
+from enums import Folders
+
+## ru_maxrss is in kilobytes on linux and in bytes on macOS
+RU_MAXRSS_BYTES = 1 if sys.platform == "darwin" else 1024
+
+
+def get_peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    """Returns the peak resident memory of this process (or its largest finished child process) in MB."""
+    return resource.getrusage(who).ru_maxrss * RU_MAXRSS_BYTES / 2**20
+
+
+def get_default_metrics_file_path(run_name: str) -> str:
+    """Returns pipeline_metrics/{run_name}_{UTC timestamp}.json, a new metrics file for each run."""
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return f"{Folders.PIPELINE_METRICS.value}/{run_name}_{timestamp}.json"
+
+
+class PipelineMetrics:
+    """
+    The PipelineMetrics class records where the time and memory of one pipeline run go:
+    .stage to time a stage of the run, used as a context manager
+    .add_counts to add to the counts of the current stage, e.g. games parsed
+    .set_counts to set the counts of the current stage
+    .set_values to record other values of the current stage, e.g. skipped games by reason
+    .emit_if_due to write the metrics file during a long stage, at most once every emit_interval_seconds
+    .to_dict to return the metrics of the run
+
+    Each stage records its status, wall and cpu seconds, the peak memory of the process when it ended,
+    its counts and the rate of each count per second. The metrics file is written atomically
+    when each stage ends, so it always holds valid json. Without a metrics_file_path, the metrics
+    are only kept in memory. Recording a stage costs two calls to getrusage, and counts are
+    only updated as often as the caller chooses, so the metrics can be left on for every run.
+    """
+
+    def __init__(self, metrics_file_path=None, emit_interval_seconds=None):
+        self.metrics_file_path = metrics_file_path
+        self._emit_interval_seconds = emit_interval_seconds
+        self._last_emit_time = time.perf_counter()
+        self._stages = {}
+        self._current_stages = []
+        self._run = {
+            "argv": sys.argv,
+            "pid": os.getpid(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "stages": self._stages,
+        }
+
+    @contextmanager
+    def stage(self, name: str):
+        """Records the stage run in the with block, which may contain other stages.
+        A stage that raises an exception is recorded as failed.
+        """
+        record = {
+            "status": "running",
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "seconds": 0.0,
+            "cpu_seconds": 0.0,
+            "peak_rss_mb": get_peak_rss_mb(),
+            "counts": {},
+            "rates": {},
+            "_start_time": time.perf_counter(),
+            "_start_cpu_time": time.process_time(),
+        }
+        self._stages[name] = record
+        self._current_stages.append(record)
+        try:
+            yield record
+            record["status"] = "completed"
+        except BaseException:
+            record["status"] = "failed"
+            raise
+        finally:
+            self._update_stage(record)
+            del record["_start_time"], record["_start_cpu_time"]
+            self._current_stages.pop()
+            self.emit()
+
+    def _update_stage(self, record: dict) -> None:
+        if "_start_time" not in record:
+            return
+        record["seconds"] = time.perf_counter() - record["_start_time"]
+        record["cpu_seconds"] = time.process_time() - record["_start_cpu_time"]
+        record["peak_rss_mb"] = get_peak_rss_mb()
+        record["peak_children_rss_mb"] = get_peak_rss_mb(resource.RUSAGE_CHILDREN)
+        record["rates"] = {
+            f"{name}_per_second": count / record["seconds"]
+            for name, count in record["counts"].items()
+            if record["seconds"] > 0
+        }
+
+    def _get_current_stage(self) -> dict:
+        if not self._current_stages:
+            raise RuntimeError("Counts can only be recorded inside a stage")
+        return self._current_stages[-1]
+
+    def add_counts(self, **counts) -> None:
+        stage_counts = self._get_current_stage()["counts"]
+        for name, count in counts.items():
+            stage_counts[name] = stage_counts.get(name, 0) + count
+
+    def set_counts(self, **counts) -> None:
+        self._get_current_stage()["counts"].update(counts)
+
+    def set_values(self, **values) -> None:
+        self._get_current_stage().update(values)
+
+    def to_dict(self) -> dict:
+        for record in self._current_stages:
+            self._update_stage(record)
+        return {
+            **self._run,
+            "stages": {
+                name: {key: value for key, value in record.items() if not key.startswith("_")}
+                for name, record in self._stages.items()
+            },
+        }
+
+    def emit(self) -> None:
+        """Writes the metrics to the metrics file, if there is one, by replacing it atomically."""
+        self._last_emit_time = time.perf_counter()
+        if self.metrics_file_path is None:
+            return
+        metrics_folder = os.path.dirname(self.metrics_file_path)
+        if metrics_folder:
+            os.makedirs(metrics_folder, exist_ok=True)
+        temporary_file_path = f"{self.metrics_file_path}.tmp"
+        with open(temporary_file_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(temporary_file_path, self.metrics_file_path)
+
+    def emit_if_due(self) -> None:
+        if (
+            self._emit_interval_seconds is not None
+            and time.perf_counter() - self._last_emit_time >= self._emit_interval_seconds
+        ):
+            self.emit()
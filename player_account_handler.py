@@ -1,11 +1,45 @@
 import time
-import lichess.api
-from lichess.api import ApiHttpError
+
+LICHESS_BASE_URL = "https://lichess.org/"
+
+## the bulk users endpoint accepts up to 300 user ids per request
+USERS_BATCH_SIZE = 300
 
 
 class PlayerAccountHandler:
-    def __init__(self):
+    """
+    The PlayerAccountHandler class gets the account statuses of players from the lichess api with methods:
+    .update_player_account_status to get the account status of a single player
+    .update_player_account_statuses to get the account statuses of many players with the bulk users endpoint
+
+    If an AccountStatusCache is passed, account statuses that have not expired are read from it
+    instead of the lichess api, and newly fetched account statuses are stored in it.
+
+    Requests are made by a lichess api client for api_base_url, which can point to a local stand-in server.
+    The client makes one request at a time with a short delay between requests,
+    and waits a full minute before retrying a request that received an HTTP 429 response.
+    """
+
+    def __init__(
+        self,
+        api_base_url: str = LICHESS_BASE_URL,
+        batch_size: int = USERS_BATCH_SIZE,
+        account_status_cache=None,
+    ):
         self._account_statuses = {}
+        self._account_status_cache = account_status_cache
+        self._api_base_url = api_base_url
+        self._api_client = None
+        self._batch_size = batch_size
+
+    def _get_api_client(self):
+        ## the lichess api client is only imported when the first request is made,
+        ## so scoring with known account statuses does not import it
+        if self._api_client is None:
+            import lichess.api
+
+            self._api_client = lichess.api.DefaultApiClient(base_url=self._api_base_url)
+        return self._api_client
 
     """This function sends an API request to lichess to get the account status
     of the player passed in as an argument, and updates the account_statuses
@@ -25,15 +59,88 @@ class PlayerAccountHandler:
 
     def update_player_account_status(self, player):
         if player not in self._account_statuses:
+            if self._account_status_cache is not None:
+                self._account_statuses.update(
+                    self._account_status_cache.get_account_statuses([player])
+                )
+                if player in self._account_statuses:
+                    return
+            import lichess.api
+            from lichess.api import ApiHttpError
+
             try:
-                user = lichess.api.user(player)
-                if user.get("tosViolation"):
-                    self._account_statuses[player] = "tosViolation"
-                elif user.get("disabled"):
-                    self._account_statuses[player] = "closed"
-                else:
-                    self._account_statuses[player] = "open"
+                user = lichess.api.user(player, client=self._get_api_client())
+                self._account_statuses[player] = self._get_account_status(user)
             except ApiHttpError:
                 self._account_statuses[player] = "not found"
+            if self._account_status_cache is not None:
+                self._account_status_cache.set_account_statuses(
+                    {player: self._account_statuses[player]}
+                )
         else:
             pass
+
+    def update_player_account_statuses(self, players, print_progress=True):
+        """Gets the account statuses of the players without a known account status,
+        in batches of up to batch_size players per request to the bulk users endpoint.
+        Players missing from the response do not exist and are set to 'not found'.
+        """
+        players = [
+            player
+            for player in dict.fromkeys(players)
+            if player not in self._account_statuses
+        ]
+        if self._account_status_cache is not None and players:
+            self._account_statuses.update(
+                self._account_status_cache.get_account_statuses(players)
+            )
+            players = [
+                player for player in players if player not in self._account_statuses
+            ]
+
+        if not players:
+            return
+
+        ## imported on first use, like the lichess api client
+        import lichess.api
+        from tqdm import tqdm
+
+        start_time = time.perf_counter()
+        with tqdm(
+            total=len(players), unit="players", disable=not print_progress
+        ) as progress_bar:
+            for batch_start in range(0, len(players), self._batch_size):
+                batch_players = players[batch_start : batch_start + self._batch_size]
+
+                ## user ids are lowercase usernames
+                users = lichess.api.users_by_ids_page(
+                    [player.lower() for player in batch_players],
+                    client=self._get_api_client(),
+                )
+                account_statuses = {
+                    user["id"]: self._get_account_status(user) for user in users
+                }
+                batch_account_statuses = {
+                    player: account_statuses.get(player.lower(), "not found")
+                    for player in batch_players
+                }
+                self._account_statuses.update(batch_account_statuses)
+
+                ## store each batch as soon as it is fetched, so an interrupted run is not lost
+                if self._account_status_cache is not None:
+                    self._account_status_cache.set_account_statuses(
+                        batch_account_statuses
+                    )
+                progress_bar.update(len(batch_players))
+
+        elapsed_minutes = (time.perf_counter() - start_time) / 60
+        if print_progress and elapsed_minutes > 0:
+            print(f"Resolved {len(players) / elapsed_minutes:.0f} players per minute")
+
+    @staticmethod
+    def _get_account_status(user: dict) -> str:
+        if user.get("tosViolation"):
+            return "tosViolation"
+        elif user.get("disabled"):
+            return "closed"
+        return "open"
@@ -0,0 +1,178 @@
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+## files are written as csv, or as zstd compressed parquet files with explicit dtypes
+FILE_FORMATS = ["csv", "parquet"]
+PARQUET_COMPRESSION = "zstd"
+
+## raw features parquet files are written in row groups, so they can be read in chunks
+PARQUET_ROW_GROUP_SIZE = 2**20
+
+## one row per game, indexed by (player, time_control)
+RAW_GAMES_DTYPES = {
+    "ratings": np.float32,
+    "opponent_ratings": np.float32,
+    "actual_scores": np.float32,
+    "rating_gains": np.float32,
+    "increments": np.int8,
+}
+
+## one row per (player, time control)
+PLAYER_FEATURES_DTYPES = {
+    "player": "category",
+    "time_control": "category",
+    "number_of_games": np.int32,
+    "mean_perf_diff": np.float32,
+    "std_perf_diff": np.float32,
+    "mean_rating": np.float32,
+    "median_rating": np.float32,
+    "std_rating": np.float32,
+    "mean_opponent_rating": np.float32,
+    "std_opponent_rating": np.float32,
+    "mean_rating_gain": np.float32,
+    "std_rating_gain": np.float32,
+    "proportion_increment_games": np.float32,
+    "rating_bin": np.int16,
+}
+
+## one row per threshold of each (rating bin, time control) evaluated when fitting the model,
+## in a file named {base_file_name}{THRESHOLD_CURVES_FILE_SUFFIX}
+THRESHOLD_CURVES_FILE_SUFFIX = "_threshold_curves.parquet"
+THRESHOLD_CURVES_DTYPES = {
+    "time_control": "category",
+    "rating_bin": np.int16,
+    "best_threshold": np.float64,
+    "threshold": np.float64,
+    "accuracy": np.float64,
+    "metric": np.float64,
+    "number_of_flagged_players": np.int32,
+}
+
+
+def get_file_format(file_path) -> str:
+    """Returns the file format of a player data file from its extension."""
+    file_format = Path(file_path).suffix.lstrip(".")
+    if file_format not in FILE_FORMATS:
+        raise ValueError(
+            f"Unsupported file format {file_format}, must be one of {FILE_FORMATS}"
+        )
+    return file_format
+
+
+@contextmanager
+def replace_when_written(file_path):
+    """Yields a temporary path with the same extension as file_path, which replaces file_path once the
+    with block completes, so a file that exists is never partially written.
+    """
+    file_path = Path(file_path)
+    temporary_file_path = file_path.with_name(f".{file_path.stem}.tmp{file_path.suffix}")
+    try:
+        yield temporary_file_path
+        os.replace(temporary_file_path, file_path)
+    finally:
+        if temporary_file_path.exists():
+            os.remove(temporary_file_path)
+
+
+def get_dtypes(df: pd.DataFrame, dtypes: dict) -> dict:
+    """Returns the explicit dtypes of the columns present in df."""
+    return {column: dtype for column, dtype in dtypes.items() if column in df.columns}
+
+
+def write_raw_games(all_player_games_df: pd.DataFrame, file_path) -> None:
+    """Writes the per-game table indexed by (player, time_control) to a csv or parquet file."""
+    file_format = get_file_format(file_path)
+    with replace_when_written(file_path) as temporary_file_path:
+        if file_format == "parquet":
+            all_player_games_df.astype(
+                get_dtypes(all_player_games_df, RAW_GAMES_DTYPES)
+            ).to_parquet(
+                temporary_file_path,
+                compression=PARQUET_COMPRESSION,
+                row_group_size=PARQUET_ROW_GROUP_SIZE,
+            )
+        else:
+            all_player_games_df.to_csv(temporary_file_path)
+
+
+def read_raw_games(file_path, columns: list = None) -> pd.DataFrame:
+    """Reads the per-game table from a csv or parquet file, indexed by (player, time_control).
+    Only the columns passed are read.
+    """
+    if get_file_format(file_path) == "parquet":
+        all_player_games_df = pd.read_parquet(file_path, columns=columns)
+    else:
+        ## the first two columns are the (player, time_control) index
+        all_player_games_df = pd.read_csv(
+            file_path,
+            index_col=[0, 1],
+            usecols=None
+            if columns is None
+            else lambda column: column not in RAW_GAMES_DTYPES or column in columns,
+            dtype=RAW_GAMES_DTYPES,
+        )
+    all_player_games_df.index = all_player_games_df.index.set_names(
+        ["player", "time_control"]
+    )
+    return all_player_games_df
+
+
+def iter_raw_games(file_path, chunk_rows: int):
+    """Yields the per-game table of a csv or parquet file in chunks of at most chunk_rows rows,
+    each indexed by (player, time_control), so tables larger than memory can be processed.
+    """
+    if get_file_format(file_path) == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        with pd.read_csv(
+            file_path, index_col=[0, 1], dtype=RAW_GAMES_DTYPES, chunksize=chunk_rows
+        ) as reader:
+            for all_player_games_df in reader:
+                all_player_games_df.index = all_player_games_df.index.set_names(
+                    ["player", "time_control"]
+                )
+                yield all_player_games_df
+
+
+def write_player_features(all_player_features: pd.DataFrame, file_path) -> None:
+    """Writes the player features indexed by (player, time_control) to a csv or parquet file."""
+    file_format = get_file_format(file_path)
+    with replace_when_written(file_path) as temporary_file_path:
+        if file_format == "parquet":
+            all_player_features = all_player_features.reset_index()
+            all_player_features.astype(
+                get_dtypes(all_player_features, PLAYER_FEATURES_DTYPES)
+            ).to_parquet(
+                temporary_file_path, compression=PARQUET_COMPRESSION, index=False
+            )
+        else:
+            all_player_features.to_csv(temporary_file_path)
+
+
+def read_player_features(file_path, columns: list = None) -> pd.DataFrame:
+    """Reads the player features from a csv or parquet file, with player and time_control as columns.
+    Only the columns passed are read.
+    """
+    if get_file_format(file_path) == "parquet":
+        return pd.read_parquet(file_path, columns=columns)
+    return pd.read_csv(file_path, usecols=columns)
+
+
+def write_threshold_curves(threshold_curves: pd.DataFrame, file_path) -> None:
+    """Writes the threshold curves of every (rating bin, time control) to a parquet file."""
+    threshold_curves.astype(
+        get_dtypes(threshold_curves, THRESHOLD_CURVES_DTYPES)
+    ).to_parquet(file_path, compression=PARQUET_COMPRESSION, index=False)
+
+
+def read_threshold_curves(file_path, columns: list = None, filters: list = None) -> pd.DataFrame:
+    """Reads the threshold curves from a parquet file. Only the columns passed are read,
+    and only the rows matching the filters, e.g. [("time_control", "==", "blitz")].
+    """
+    return pd.read_parquet(file_path, columns=columns, filters=filters)
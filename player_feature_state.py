@@ -0,0 +1,307 @@
+import argparse
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from enums import Folders
+from make_player_features import (
+    MIN_GAMES,
+    add_rating_bins,
+    get_player_expected_score,
+)
+from player_data_io import (
+    FILE_FORMATS,
+    PARQUET_COMPRESSION,
+    read_raw_games,
+    write_player_features,
+)
+
+## per-game values whose sum and sum of squares are stored for each (player, time control)
+STATISTIC_NAMES = ["perf_diff", "rating", "opponent_rating", "rating_gain"]
+
+## median_rating is found from the number of games in each RATING_HISTOGRAM_BIN_WIDTH point bin of ratings,
+## clipped to [MIN_HISTOGRAM_RATING, MAX_HISTOGRAM_RATING), so each (player, time control) has at most
+## (MAX_HISTOGRAM_RATING - MIN_HISTOGRAM_RATING) / RATING_HISTOGRAM_BIN_WIDTH = 400 histogram rows,
+## and the median is within RATING_HISTOGRAM_BIN_WIDTH / 2 of the exact median of the ratings in that range
+RATING_HISTOGRAM_BIN_WIDTH = 10
+MIN_HISTOGRAM_RATING = 0
+MAX_HISTOGRAM_RATING = 4000
+
+
+def get_rating_histogram_bins(ratings) -> np.ndarray:
+    """Returns the lowest rating of the histogram bin of each rating."""
+    ratings = np.clip(
+        np.asarray(ratings, dtype=np.float64),
+        MIN_HISTOGRAM_RATING,
+        MAX_HISTOGRAM_RATING - 1,
+    )
+    return (ratings // RATING_HISTOGRAM_BIN_WIDTH * RATING_HISTOGRAM_BIN_WIDTH).astype(
+        np.int64
+    )
+
+
+class PlayerFeatureState:
+    """
+    The PlayerFeatureState class stores mergeable sufficient statistics of the games of each (player, time control),
+    from which the player features can be calculated without the raw per-game data:
+    .from_games to create the state of one month from the raw features with one row per game
+    .merge to combine the states of several months
+    .to_player_features to calculate the same features as make_player_features.aggregate_player_features
+    .memory_usage to return the number of bytes used by the state
+    .save and .load to persist the state as parquet files
+
+    The statistics are the number of games, the sum and sum of squares of each value in STATISTIC_NAMES,
+    and the number of increment games. The number of games in each rating histogram bin is stored to find median_rating,
+    which bounds the size of the state by the number of bins per (player, time control) and can be merged by adding counts.
+    Every feature is exact except median_rating, which is within RATING_HISTOGRAM_BIN_WIDTH / 2 of the exact median.
+    """
+
+    def __init__(self, statistics: pd.DataFrame, rating_counts: pd.Series):
+        self.statistics = statistics
+        self.rating_counts = rating_counts
+
+    @classmethod
+    def from_games(cls, all_player_games_df: pd.DataFrame) -> "PlayerFeatureState":
+        """Creates the state from raw features indexed by (player, time_control) with one row per game."""
+        ratings = all_player_games_df["ratings"].to_numpy(dtype=np.float64)
+        opponent_ratings = all_player_games_df["opponent_ratings"].to_numpy(
+            dtype=np.float64
+        )
+        performance_difference = all_player_games_df["actual_scores"].to_numpy(
+            dtype=np.float64
+        ) - get_player_expected_score(
+            player_rating=ratings, opponent_rating=opponent_ratings
+        )
+        values = pd.DataFrame(
+            {
+                "perf_diff": performance_difference,
+                "rating": ratings,
+                "opponent_rating": opponent_ratings,
+                "rating_gain": all_player_games_df["rating_gains"].to_numpy(
+                    dtype=np.float64
+                ),
+            },
+            index=all_player_games_df.index,
+        )
+        grouped = pd.concat(
+            [
+                values.add_prefix("sum_"),
+                (values**2).add_prefix("sum_squares_"),
+                all_player_games_df["increments"]
+                .astype(np.int64)
+                .rename("number_of_increment_games"),
+            ],
+            axis=1,
+        ).groupby(level=["player", "time_control"], observed=True)
+        statistics = grouped.sum()
+        statistics.insert(0, "number_of_games", grouped.size())
+
+        rating_counts = all_player_games_df.groupby(
+            [
+                all_player_games_df.index.get_level_values("player"),
+                all_player_games_df.index.get_level_values("time_control"),
+                pd.Series(
+                    get_rating_histogram_bins(all_player_games_df["ratings"]),
+                    index=all_player_games_df.index,
+                    name="rating",
+                ),
+            ],
+            observed=True,
+        ).size()
+        return cls(statistics, rating_counts.rename("number_of_games"))
+
+    @classmethod
+    def merge(cls, states: list) -> "PlayerFeatureState":
+        """Combines the states of several months into one state, as if their games were in one raw features table."""
+        statistics = (
+            pd.concat([state.statistics for state in states])
+            .groupby(level=["player", "time_control"], observed=True)
+            .sum()
+        )
+        rating_counts = (
+            pd.concat([state.rating_counts for state in states])
+            .groupby(level=["player", "time_control", "rating"], observed=True)
+            .sum()
+        )
+        return cls(statistics, rating_counts)
+
+    def memory_usage(self) -> int:
+        return int(
+            self.statistics.memory_usage(index=True, deep=True).sum()
+            + self.rating_counts.memory_usage(index=True, deep=True)
+        )
+
+    def _get_median_ratings(self, keys: pd.MultiIndex) -> pd.Series:
+        """Returns the median rating of each (player, time control) in keys from the counts of games in each rating bin,
+        taking the middle of the bin of each of the middle two ratings.
+        """
+        rating_counts = self.rating_counts[
+            self.rating_counts.index.droplevel("rating").isin(keys)
+        ].sort_index()
+        grouped = rating_counts.groupby(level=["player", "time_control"], observed=True)
+        last_positions = grouped.cumsum()
+        first_positions = last_positions - rating_counts
+        number_of_games = grouped.transform("sum")
+
+        ## the median is the mean of the middle two ratings, which are the same rating if the number of games is odd
+        ratings = rating_counts.index.get_level_values("rating").to_numpy(
+            dtype=np.float64
+        ) + RATING_HISTOGRAM_BIN_WIDTH / 2
+        rating_keys = rating_counts.index.droplevel("rating")
+        middle_ratings = []
+        for middle_position in [(number_of_games - 1) // 2, number_of_games // 2]:
+            is_middle = (first_positions <= middle_position) & (
+                middle_position < last_positions
+            )
+            middle_ratings.append(
+                pd.Series(
+                    ratings[is_middle.to_numpy()],
+                    index=rating_keys[is_middle.to_numpy()],
+                )
+            )
+        return ((middle_ratings[0] + middle_ratings[1]) / 2).reindex(keys)
+
+    def to_player_features(self, min_games: int = MIN_GAMES) -> pd.DataFrame:
+        """Returns the player features of every (player, time control) with at least min_games games."""
+        statistics = self.statistics[self.statistics["number_of_games"] >= min_games]
+        number_of_games = statistics["number_of_games"]
+
+        all_player_features = pd.DataFrame({"number_of_games": number_of_games})
+        for statistic_name in STATISTIC_NAMES:
+            statistic_sum = statistics[f"sum_{statistic_name}"]
+            mean = statistic_sum / number_of_games
+            variance = (
+                statistics[f"sum_squares_{statistic_name}"] - statistic_sum * mean
+            ) / (number_of_games - 1)
+            all_player_features[f"mean_{statistic_name}"] = mean
+            all_player_features[f"std_{statistic_name}"] = np.sqrt(
+                variance.clip(lower=0)
+            )
+        all_player_features["median_rating"] = self._get_median_ratings(
+            statistics.index
+        )
+        all_player_features["proportion_increment_games"] = (
+            statistics["number_of_increment_games"] / number_of_games
+        )
+
+        ## same column order as make_player_features
+        all_player_features = all_player_features[
+            [
+                "number_of_games",
+                "mean_perf_diff",
+                "std_perf_diff",
+                "mean_rating",
+                "median_rating",
+                "std_rating",
+                "mean_opponent_rating",
+                "std_opponent_rating",
+                "mean_rating_gain",
+                "std_rating_gain",
+                "proportion_increment_games",
+            ]
+        ].copy()
+        add_rating_bins(all_player_features)
+        return all_player_features
+
+    def save(self, state_folder: str) -> None:
+        """Saves the state to a folder containing statistics.parquet and rating_counts.parquet."""
+        if not os.path.exists(state_folder):
+            os.makedirs(state_folder)
+        self.statistics.to_parquet(
+            f"{state_folder}/statistics.parquet", compression=PARQUET_COMPRESSION
+        )
+        self.rating_counts.to_frame().astype({"number_of_games": np.int32}).to_parquet(
+            f"{state_folder}/rating_counts.parquet", compression=PARQUET_COMPRESSION
+        )
+
+    @classmethod
+    def load(cls, state_folder: str) -> "PlayerFeatureState":
+        """Loads a state saved with .save. The rating counts of states saved with the number of games at each rating
+        are added up into rating histogram bins.
+        """
+        statistics = pd.read_parquet(f"{state_folder}/statistics.parquet")
+        rating_counts = pd.read_parquet(f"{state_folder}/rating_counts.parquet")[
+            "number_of_games"
+        ].astype(np.int64)
+        ratings = rating_counts.index.get_level_values("rating")
+        rating_bins = get_rating_histogram_bins(ratings)
+        if not np.array_equal(ratings, rating_bins):
+            rating_counts = rating_counts.groupby(
+                [
+                    rating_counts.index.get_level_values("player"),
+                    rating_counts.index.get_level_values("time_control"),
+                    pd.Index(rating_bins, name="rating"),
+                ],
+                observed=True,
+            ).sum()
+        return cls(statistics, rating_counts)
+
+
+def make_player_feature_state(RAW_FEATURES_FILE_PATH):
+    """Creates the player feature state of one month from the CSV (or parquet) file containing raw features,
+    and saves it to the lichess_player_data directory. Returns the folder of the state.
+    """
+    all_player_games_df = read_raw_games(RAW_FEATURES_FILE_PATH)
+    BASE_FILE_NAME = Path(RAW_FEATURES_FILE_PATH).stem.split(".")[0]
+    state_folder = (
+        f"{Folders.LICHESS_PLAYER_DATA.value}/{BASE_FILE_NAME}_player_feature_state"
+    )
+    PlayerFeatureState.from_games(all_player_games_df).save(state_folder)
+    return state_folder
+
+
+def make_player_features_from_states(state_folders, output_name, output_format="csv"):
+    """Merges the player feature states of several months, e.g. a rolling 12 month window,
+    and saves their player features to the lichess_player_data directory.
+    """
+    state = PlayerFeatureState.merge(
+        [PlayerFeatureState.load(state_folder) for state_folder in state_folders]
+    )
+    write_player_features(
+        state.to_player_features(),
+        f"{Folders.LICHESS_PLAYER_DATA.value}/{output_name}_player_features.{output_format}",
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create and merge player feature states of one or more months"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    make_state_parser = subparsers.add_parser(
+        "make-state", help="Create the player feature state of one month"
+    )
+    make_state_parser.add_argument(
+        "RAW_FEATURES_FILE_PATH",
+        type=str,
+        help="Path to the CSV (or parquet) file containing raw features",
+    )
+    make_features_parser = subparsers.add_parser(
+        "make-features",
+        help="Create player features from the merged states of one or more months",
+    )
+    make_features_parser.add_argument(
+        "STATE_FOLDERS", type=str, nargs="+", help="Folders of the states to merge"
+    )
+    make_features_parser.add_argument(
+        "--output-name",
+        type=str,
+        required=True,
+        help="Base file name of the player features file",
+    )
+    make_features_parser.add_argument(
+        "--output-format",
+        type=str,
+        default="csv",
+        choices=FILE_FORMATS,
+        help="Format of the player features file",
+    )
+    args = parser.parse_args()
+
+    if args.command == "make-state":
+        make_player_feature_state(args.RAW_FEATURES_FILE_PATH)
+    else:
+        make_player_features_from_states(
+            args.STATE_FOLDERS, args.output_name, args.output_format
+        )
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+from pathlib import Path
+import shutil
+import numpy as np
+import pandas as pd
+
+from enums import Folders
+from player_data_io import PLAYER_FEATURES_DTYPES, read_player_features
+from player_info_accumulator import TIME_CONTROLS, TIME_CONTROL_CODES
+
+DEFAULT_STORE_FOLDER = f"{Folders.LICHESS_PLAYER_DATA.value}/player_feature_store"
+
+## the feature columns stored for each (player, time control), with the dtypes of the player features files
+FEATURE_COLUMNS = [
+    column
+    for column in PLAYER_FEATURES_DTYPES
+    if column not in ["player", "time_control"]
+]
+
+
+def get_partition_name(PLAYER_FEATURES_FILE_PATH) -> str:
+    """Returns the partition name of a player features file, e.g. lichess_db_standard_rated_2015-01."""
+    return Path(PLAYER_FEATURES_FILE_PATH).stem.removesuffix("_player_features")
+
+
+def get_old_partition_folder(store_folder, partition_name) -> str:
+    """Returns the folder a partition is moved to while it is replaced by add_player_features_partition."""
+    return f"{store_folder}/.{partition_name}.old"
+
+
+def add_player_features_partition(
+    PLAYER_FEATURES_FILE_PATH, store_folder=DEFAULT_STORE_FOLDER, partition_name=None
+) -> str:
+    """Adds the player features of one month to the store as a partition, replacing a partition with the same name,
+    and returns the folder of the partition. The partition holds players.npy, the lowercase player names sorted
+    with one entry per (player, time control), and one .npy file per column in the same order.
+    """
+    if partition_name is None:
+        partition_name = get_partition_name(PLAYER_FEATURES_FILE_PATH)
+    all_player_features = read_player_features(PLAYER_FEATURES_FILE_PATH)
+    players = all_player_features["player"].astype(str)
+    time_control_codes = (
+        all_player_features["time_control"].astype(str).map(TIME_CONTROL_CODES)
+    )
+
+    ## lichess usernames are case insensitive, so players are looked up by their lowercase name
+    player_keys = players.str.lower().str.encode("utf-8").to_numpy(dtype=bytes)
+    order = np.lexsort((time_control_codes.to_numpy(), player_keys))
+    columns = {
+        "players": player_keys[order],
+        "player_names": players.str.encode("utf-8").to_numpy(dtype=bytes)[order],
+        "time_controls": time_control_codes.to_numpy(dtype=np.int8)[order],
+    }
+    for column in FEATURE_COLUMNS:
+        if column in all_player_features.columns:
+            columns[column] = all_player_features[column].to_numpy(
+                dtype=PLAYER_FEATURES_DTYPES[column]
+            )[order]
+
+    ## the partition is written to a temporary folder first, so readers never see a partially written partition
+    partition_folder = f"{store_folder}/{partition_name}"
+    temporary_folder = f"{store_folder}/.{partition_name}.tmp"
+    shutil.rmtree(temporary_folder, ignore_errors=True)
+    os.makedirs(temporary_folder)
+    for column, values in columns.items():
+        np.save(f"{temporary_folder}/{column}.npy", values)
+    with open(f"{temporary_folder}/metadata.json", "w") as f:
+        json.dump(
+            {
+                "source": str(PLAYER_FEATURES_FILE_PATH),
+                "number_of_rows": len(order),
+                "columns": list(columns),
+            },
+            f,
+        )
+
+    ## the old partition is renamed aside before the new one is renamed into place, and only removed afterwards,
+    ## so a crash never loses both, and the partition folder is missing for as short a time as possible
+    old_folder = get_old_partition_folder(store_folder, partition_name)
+    if os.path.exists(old_folder):
+        ## a replacement was interrupted, and the old partition may be the only one left
+        if os.path.exists(partition_folder):
+            shutil.rmtree(old_folder)
+        else:
+            os.replace(old_folder, partition_folder)
+    if os.path.exists(partition_folder):
+        os.replace(partition_folder, old_folder)
+    os.replace(temporary_folder, partition_folder)
+    shutil.rmtree(old_folder, ignore_errors=True)
+    return partition_folder
+
+
+class PlayerFeatureStore:
+    """
+    The PlayerFeatureStore class looks up the features of single players in monthly partitions
+    created by add_player_features_partition, without loading whole player features tables:
+    .get_player_features to get the features of one player in each time control, in one or more months
+    .get_players_with_prefix to get the features of every player whose name starts with a prefix in one month
+
+    Each partition is memory mapped on first use, and players are found by binary search
+    of the sorted player names, so a lookup only reads the pages it needs.
+    """
+
+    def __init__(self, store_folder=DEFAULT_STORE_FOLDER):
+        self._store_folder = store_folder
+        self._partitions = {}
+
+    @property
+    def partition_names(self) -> list:
+        """Returns the names of the partitions in the store in sorted order, i.e. oldest month first."""
+        if not os.path.exists(self._store_folder):
+            return []
+        folder_names = os.listdir(self._store_folder)
+        ## a partition that is being replaced is only in its .old folder for a moment
+        return sorted(
+            {
+                folder_name.removeprefix(".").removesuffix(".old")
+                for folder_name in folder_names
+                if not folder_name.startswith(".") or folder_name.endswith(".old")
+            }
+        )
+
+    def _get_partition(self, partition_name) -> dict:
+        partition = self._partitions.get(partition_name)
+        if partition is None:
+            partition_folder = f"{self._store_folder}/{partition_name}"
+            ## while a partition is replaced, the old one is read
+            if not os.path.exists(partition_folder):
+                old_folder = get_old_partition_folder(self._store_folder, partition_name)
+                if os.path.exists(old_folder):
+                    partition_folder = old_folder
+            with open(f"{partition_folder}/metadata.json") as f:
+                columns = json.load(f)["columns"]
+            partition = self._partitions[partition_name] = {
+                column: np.load(f"{partition_folder}/{column}.npy", mmap_mode="r")
+                for column in columns
+            }
+        return partition
+
+    def _get_player_rows(self, partition_name, start_key: bytes, stop_key: bytes):
+        partition = self._get_partition(partition_name)
+        start = np.searchsorted(partition["players"], start_key, side="left")
+        stop = np.searchsorted(partition["players"], stop_key, side="right")
+        return partition, start, stop
+
+    def _get_frame(self, partition_slices: list) -> pd.DataFrame:
+        ## one DataFrame is created from the rows of every partition
+        columns = {
+            "partition": np.concatenate(
+                [
+                    np.full(stop - start, partition_name, dtype=object)
+                    for partition_name, _, start, stop in partition_slices
+                ]
+            ),
+            "player": np.concatenate(
+                [
+                    np.char.decode(partition["player_names"][start:stop], "utf-8")
+                    for _, partition, start, stop in partition_slices
+                ]
+            ),
+            "time_control": np.array(TIME_CONTROLS, dtype=object)[
+                np.concatenate(
+                    [
+                        partition["time_controls"][start:stop]
+                        for _, partition, start, stop in partition_slices
+                    ]
+                )
+            ],
+        }
+        for column in FEATURE_COLUMNS:
+            if all(column in partition for _, partition, _, _ in partition_slices):
+                columns[column] = np.concatenate(
+                    [
+                        partition[column][start:stop]
+                        for _, partition, start, stop in partition_slices
+                    ]
+                )
+        return pd.DataFrame(columns)
+
+    def get_player_features(self, player: str, partition_names=None) -> pd.DataFrame:
+        """Returns the features of a player in each time control, with one row per (partition, time control),
+        from the partitions passed or from every partition, oldest month first.
+        """
+        if partition_names is None:
+            partition_names = self.partition_names
+        if not partition_names:
+            return pd.DataFrame(
+                columns=["partition", "player", "time_control"] + FEATURE_COLUMNS
+            )
+        player_key = player.lower().encode()
+        partition_slices = [
+            (partition_name,)
+            + self._get_player_rows(partition_name, player_key, player_key)
+            for partition_name in partition_names
+        ]
+        return self._get_frame(partition_slices)
+
+    def get_players_with_prefix(
+        self, prefix: str, partition_name: str, max_rows: int = 1000
+    ) -> pd.DataFrame:
+        """Returns the features of up to max_rows (player, time control) of the players whose name starts with prefix."""
+        prefix_key = prefix.lower().encode()
+        partition, start, stop = self._get_player_rows(
+            partition_name, prefix_key, prefix_key + b"\xff"
+        )
+        return self._get_frame(
+            [(partition_name, partition, start, min(stop, start + max_rows))]
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create and query an indexed store of player features by month"
+    )
+    parser.add_argument(
+        "--store-folder",
+        type=str,
+        default=DEFAULT_STORE_FOLDER,
+        help="Folder of the player feature store",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_parser = subparsers.add_parser(
+        "add", help="Add player features files to the store, one partition per file"
+    )
+    add_parser.add_argument(
+        "PLAYER_FEATURES_FILE_PATHS",
+        type=str,
+        nargs="+",
+        help="Paths to the CSV (or parquet) files containing player features",
+    )
+    get_parser = subparsers.add_parser(
+        "get", help="Print the features of a player in every partition"
+    )
+    get_parser.add_argument("PLAYER", type=str, help="Name of the player")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        for PLAYER_FEATURES_FILE_PATH in args.PLAYER_FEATURES_FILE_PATHS:
+            add_player_features_partition(PLAYER_FEATURES_FILE_PATH, args.store_folder)
+    else:
+        print(
+            PlayerFeatureStore(args.store_folder)
+            .get_player_features(args.PLAYER)
+            .to_string()
+        )
@@ -0,0 +1,278 @@
+from array import array
+from typing import Callable
+import numpy as np
+import pandas as pd
+
+from enums import TimeControl
+
+## every time control is stored as a small integer code, in this order
+TIME_CONTROLS = [
+    TimeControl.BULLET.value,
+    TimeControl.BLITZ.value,
+    TimeControl.RAPID.value,
+    TimeControl.CLASSICAL.value,
+    TimeControl.OTHER.value,
+]
+TIME_CONTROL_CODES = {
+    time_control: code for code, time_control in enumerate(TIME_CONTROLS)
+}
+
+PLAYER_INFO_FIELDS = [
+    "ratings",
+    "opponent_ratings",
+    "actual_scores",
+    "rating_gains",
+    "increments",
+]
+
+
+class PlayerInfoAccumulator:
+    """
+    The PlayerInfoAccumulator class stores the information from every game of each (player, time control)
+    in typed growable arrays with one entry per game, instead of one dictionary of lists per player:
+    .add_game to add a single game for one player
+    .merge to add the games of an accumulator that was filled from a later chunk of the same pgn file
+    .to_frame to return a DataFrame with one row per game, grouped by (player, time control) in game order
+
+    Accumulators can be pickled, e.g. to checkpoint a long parse: the lookup dictionaries are not pickled
+    and are rebuilt from the player names and key codes when the accumulator is unpickled.
+
+    Player names are interned to integer ids, and each (player, time control) is identified by a
+    key code = player_id * len(TIME_CONTROLS) + time_control_code, which is assigned a key index when it is created.
+    Ratings and rating gains are stored as float32, scores as int8 half points, and increments as int8.
+
+    With keep_skipped_games=True, games excluded by the 1500.0 rating rule are kept and flagged,
+    because the player may already have games in an earlier chunk (see .merge).
+
+    With a key_filter, e.g. GameCountSketch.may_reach_min_games, a (player, time control) is only created
+    if key_filter(player, time_control) is True, and the games of the other keys are never stored.
+    """
+
+    def __init__(
+        self,
+        keep_skipped_games: bool = False,
+        key_filter: Callable[[str, str], bool] = None,
+    ):
+        self._keep_skipped_games = keep_skipped_games
+        self._key_filter = key_filter
+        self._players = []
+        self._player_ids = {}
+
+        ## one entry per (player, time control) key
+        self._key_indices = {}
+        self._key_codes = array("q")
+        self._key_created = bytearray()
+        self._created_keys = array("i")
+
+        ## one entry per game
+        self._game_keys = array("i")
+        self._ratings = array("f")
+        self._opponent_ratings = array("f")
+        self._half_point_scores = array("b")
+        self._rating_gains = array("f")
+        self._increments = array("b")
+        self._skipped_games = array("b")
+
+    def __len__(self):
+        return len(self._game_keys)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_player_ids"], state["_key_indices"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._player_ids = {player: player_id for player_id, player in enumerate(self._players)}
+        self._key_indices = {
+            key_code: key_index for key_index, key_code in enumerate(self._key_codes)
+        }
+
+    def _add_player(self, player: str) -> int:
+        player_id = self._player_ids[player] = len(self._players)
+        self._players.append(player)
+        return player_id
+
+    def _add_key(self, key_code: int) -> int:
+        key_index = self._key_indices[key_code] = len(self._key_codes)
+        self._key_codes.append(key_code)
+        self._key_created.append(0)
+        return key_index
+
+    def add_game(
+        self,
+        player: str,
+        time_control: str,
+        current_rating: float,
+        opponent_rating: float,
+        score: float,
+        rating_gain: float,
+        is_increment: int,
+    ) -> None:
+        """Adds the information from a single game for one player."""
+
+        # exclude a rating of 1500.0 exactly as this could be a first game
+        # refine analysis by excluding the first N_0 = 10 games if the first rating is 1500.0
+        is_first_game_rating = current_rating == 1500.0
+        skip_new_key = is_first_game_rating and not self._keep_skipped_games
+
+        player_id = self._player_ids.get(player)
+        key_index = None
+        if player_id is not None:
+            key_index = self._key_indices.get(
+                player_id * len(TIME_CONTROLS) + TIME_CONTROL_CODES[time_control]
+            )
+        if key_index is None:
+            if skip_new_key or (
+                self._key_filter is not None
+                and not self._key_filter(player, time_control)
+            ):
+                return
+            if player_id is None:
+                player_id = self._add_player(player)
+            key_index = self._add_key(
+                player_id * len(TIME_CONTROLS) + TIME_CONTROL_CODES[time_control]
+            )
+
+        ## this particular (player, time control) is created by its first game not at a rating of 1500.0
+        is_skipped = 0
+        if not self._key_created[key_index]:
+            if is_first_game_rating:
+                is_skipped = 1
+            else:
+                self._key_created[key_index] = 1
+                self._created_keys.append(key_index)
+
+        self._game_keys.append(key_index)
+        self._ratings.append(current_rating)
+        self._opponent_ratings.append(opponent_rating)
+        self._half_point_scores.append(int(2 * score))
+        self._rating_gains.append(rating_gain)
+        self._increments.append(is_increment)
+        if self._keep_skipped_games:
+            self._skipped_games.append(is_skipped)
+
+    def merge(self, chunk: "PlayerInfoAccumulator") -> None:
+        """Merges an accumulator filled with keep_skipped_games=True from a later chunk of the same pgn file,
+        as if its games were added right after all games already stored. New (player, time control) keys are
+        created in the order the chunk created them (if they pass the key_filter), and skipped games at a rating
+        of 1500.0 are kept for players who already have earlier games, which keeps every player's games in game order.
+        """
+        if not chunk._keep_skipped_games:
+            raise ValueError("Only accumulators with keep_skipped_games=True can be merged")
+
+        number_of_time_controls = len(TIME_CONTROLS)
+        key_map = np.full(len(chunk._key_codes), -1, dtype=np.int32)
+        is_existing_key = np.zeros(len(chunk._key_codes), dtype=bool)
+
+        ## map the keys of the chunk that are already stored
+        for chunk_key_index, chunk_key_code in enumerate(chunk._key_codes):
+            chunk_player_id, time_control_code = divmod(
+                chunk_key_code, number_of_time_controls
+            )
+            player_id = self._player_ids.get(chunk._players[chunk_player_id])
+            if player_id is None:
+                continue
+            key_index = self._key_indices.get(
+                player_id * number_of_time_controls + time_control_code
+            )
+            if key_index is not None:
+                key_map[chunk_key_index] = key_index
+                is_existing_key[chunk_key_index] = True
+
+        ## create the new keys in the order they were created in the chunk
+        for chunk_key_index in chunk._created_keys:
+            if is_existing_key[chunk_key_index]:
+                continue
+            chunk_player_id, time_control_code = divmod(
+                chunk._key_codes[chunk_key_index], number_of_time_controls
+            )
+            player = chunk._players[chunk_player_id]
+            if self._key_filter is not None and not self._key_filter(
+                player, TIME_CONTROLS[time_control_code]
+            ):
+                continue
+            player_id = self._player_ids.get(player)
+            if player_id is None:
+                player_id = self._add_player(player)
+            key_index = self._add_key(
+                player_id * number_of_time_controls + time_control_code
+            )
+            self._key_created[key_index] = 1
+            self._created_keys.append(key_index)
+            key_map[chunk_key_index] = key_index
+
+        chunk_game_keys = np.frombuffer(chunk._game_keys, dtype=np.int32)
+        is_kept_game = (
+            (np.frombuffer(chunk._skipped_games, dtype=np.int8) == 0)
+            | is_existing_key[chunk_game_keys]
+        ) & (key_map[chunk_game_keys] >= 0)
+        for field, chunk_values in [
+            ("_game_keys", key_map[chunk_game_keys]),
+            ("_ratings", chunk._ratings),
+            ("_opponent_ratings", chunk._opponent_ratings),
+            ("_half_point_scores", chunk._half_point_scores),
+            ("_rating_gains", chunk._rating_gains),
+            ("_increments", chunk._increments),
+        ]:
+            values = getattr(self, field)
+            chunk_values = np.asarray(chunk_values, dtype=values.typecode)
+            values.frombytes(chunk_values[is_kept_game].tobytes())
+        if self._keep_skipped_games:
+            self._skipped_games.frombytes(
+                np.zeros(int(is_kept_game.sum()), dtype=np.int8).tobytes()
+            )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Returns a DataFrame indexed by (player, time_control) with one row per game,
+        where the (player, time control) keys are in the order they were created and each player's games are in game order.
+        """
+        game_keys = np.frombuffer(self._game_keys, dtype=np.int32)
+        order = np.argsort(game_keys, kind="stable")
+        if self._keep_skipped_games:
+            is_skipped = np.frombuffer(self._skipped_games, dtype=np.int8)[order] == 1
+            order = order[~is_skipped]
+
+        key_codes = np.frombuffer(self._key_codes, dtype=np.int64)[game_keys[order]]
+        player_ids, time_control_codes = np.divmod(key_codes, len(TIME_CONTROLS))
+
+        ## categories are sorted so that grouping by them gives the same order as grouping by strings
+        ## an object array only holds references to the player names, where a fixed-width str array
+        ## would take 4 bytes per character of the longest name for every player
+        players = np.array(self._players, dtype=object)
+        player_order = np.argsort(players, kind="stable")
+        player_ranks = np.empty_like(player_order)
+        player_ranks[player_order] = np.arange(len(player_order))
+        time_control_order = np.argsort(TIME_CONTROLS)
+        time_control_ranks = np.empty_like(time_control_order)
+        time_control_ranks[time_control_order] = np.arange(len(TIME_CONTROLS))
+        index = pd.MultiIndex.from_arrays(
+            [
+                pd.Categorical.from_codes(
+                    player_ranks[player_ids], categories=players[player_order]
+                ),
+                pd.Categorical.from_codes(
+                    time_control_ranks[time_control_codes],
+                    categories=np.array(TIME_CONTROLS)[time_control_order],
+                ),
+            ],
+            names=["player", "time_control"],
+        )
+        return pd.DataFrame(
+            {
+                "ratings": np.frombuffer(self._ratings, dtype=np.float32)[order],
+                "opponent_ratings": np.frombuffer(
+                    self._opponent_ratings, dtype=np.float32
+                )[order],
+                "actual_scores": np.frombuffer(self._half_point_scores, dtype=np.int8)[
+                    order
+                ].astype(np.float32)
+                / 2,
+                "rating_gains": np.frombuffer(self._rating_gains, dtype=np.float32)[
+                    order
+                ],
+                "increments": np.frombuffer(self._increments, dtype=np.int8)[order],
+            },
+            index=index,
+            columns=PLAYER_INFO_FIELDS,
+        )
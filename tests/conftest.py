@@ -0,0 +1,81 @@
+import hashlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+from benchmarks.synthetic_pgn import write_synthetic_pgn
+
+
+class DatabaseRequestHandler(BaseHTTPRequestHandler):
+    """Stand-in for the lichess open database, which serves byte ranges of its files."""
+
+    def do_GET(self):
+        file_name = self.path.rsplit("/", 1)[-1]
+        self.server.requests.append((file_name, self.headers.get("Range")))
+        body = self.server.files.get(file_name)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"].removeprefix("bytes=").rstrip("-"))
+            if start >= len(body):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        ## drop the connection halfway through the file
+        if self.server.truncated_responses > 0:
+            self.server.truncated_responses -= 1
+            self.wfile.write(body[start : start + (len(body) - start) // 2])
+            self.close_connection = True
+            return
+        if self.server.block_delay_seconds:
+            ## send the file slowly, in blocks, until the client stops reading
+            try:
+                for block_start in range(start, len(body), 2**12):
+                    self.wfile.write(body[block_start : block_start + 2**12])
+                    time.sleep(self.server.block_delay_seconds)
+            except ConnectionError:
+                self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def database_server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    files = {}
+    for month, seed in [("2024-01", 1), ("2024-02", 2)]:
+        file_name = f"lichess_db_standard_rated_{month}.pgn.zst"
+        write_synthetic_pgn(file_name, 3000, number_of_players=60, seed=seed)
+        with open(file_name, "rb") as f:
+            files[file_name] = f.read()
+        os.remove(file_name)
+    files["sha256sums.txt"] = "".join(
+        f"{hashlib.sha256(body).hexdigest()}  {file_name}\n"
+        for file_name, body in files.items()
+    ).encode()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DatabaseRequestHandler)
+    server.files, server.requests, server.truncated_responses = files, [], 0
+    server.block_delay_seconds = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/standard"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,115 @@
+import multiprocessing
+import sqlite3
+from unittest import mock
+
+from account_status_cache import AccountStatusCache
+
+
+def test_get_account_statuses(tmp_path):
+    account_status_cache = AccountStatusCache(str(tmp_path / "cache.sqlite3"))
+    account_status_cache.set_account_statuses(
+        {"Alice": "open", "bob": "tosViolation"}
+    )
+
+    ## players are matched case-insensitively and keyed by the names passed
+    assert account_status_cache.get_account_statuses(["alice", "BOB", "carol"]) == {
+        "alice": "open",
+        "BOB": "tosViolation",
+    }
+    account_status_cache.close()
+
+    ## the cache persists between runs
+    account_status_cache = AccountStatusCache(str(tmp_path / "cache.sqlite3"))
+    assert account_status_cache.get_account_statuses(["Alice"]) == {"Alice": "open"}
+
+
+def test_account_statuses_expire(tmp_path):
+    account_status_cache = AccountStatusCache(
+        str(tmp_path / "cache.sqlite3"), ttl_seconds={"open": 10, "tosViolation": 100}
+    )
+    with mock.patch("account_status_cache.time.time", return_value=1000.0):
+        account_status_cache.set_account_statuses(
+            {"alice": "open", "bob": "tosViolation"}
+        )
+    with mock.patch("account_status_cache.time.time", return_value=1050.0):
+        assert account_status_cache.get_account_statuses(["alice", "bob"]) == {
+            "bob": "tosViolation"
+        }
+
+
+def test_least_recently_used_players_are_evicted(tmp_path):
+    account_status_cache = AccountStatusCache(
+        str(tmp_path / "cache.sqlite3"), max_size=2
+    )
+    with mock.patch("account_status_cache.time.time", return_value=1000.0):
+        account_status_cache.set_account_statuses({"alice": "open", "bob": "open"})
+    with mock.patch("account_status_cache.time.time", return_value=1001.0):
+        account_status_cache.get_account_statuses(["alice"])
+    with mock.patch("account_status_cache.time.time", return_value=1002.0):
+        account_status_cache.set_account_statuses({"carol": "closed"})
+
+    assert len(account_status_cache) == 2
+    with mock.patch("account_status_cache.time.time", return_value=1003.0):
+        assert account_status_cache.get_account_statuses(
+            ["alice", "bob", "carol"]
+        ) == {"alice": "open", "carol": "closed"}
+
+
+def test_cache_size_is_kept_in_the_database(tmp_path):
+    cache_path = str(tmp_path / "cache.sqlite3")
+    ## a cache file written before its size was kept is counted when it is opened
+    AccountStatusCache(cache_path).set_account_statuses({"alice": "open", "bob": "open"})
+    connection = sqlite3.connect(cache_path)
+    connection.execute("DROP TABLE account_statuses_size")
+    connection.commit()
+    connection.close()
+
+    ## two caches on the same file stand for two processes, which never hold more than max_size players together
+    account_status_caches = [
+        AccountStatusCache(cache_path, max_size=5) for _ in range(2)
+    ]
+    statements = []
+    for account_status_cache in account_status_caches:
+        account_status_cache._connection.set_trace_callback(statements.append)
+    for first_player in range(0, 12, 2):
+        for i, account_status_cache in enumerate(account_status_caches):
+            account_status_cache.set_account_statuses(
+                {f"player{first_player + i}": "open", "alice": "closed"}
+            )
+            assert len(account_status_caches[1 - i]) <= 5
+
+    ## updated players are not counted twice, and the players are never counted again
+    assert len(account_status_caches[0]) == 5
+    assert (
+        sqlite3.connect(cache_path)
+        .execute("SELECT COUNT(*) FROM account_statuses")
+        .fetchone()[0]
+        == 5
+    )
+    assert not any(statement.startswith("SELECT COUNT") for statement in statements)
+    assert account_status_caches[0].get_account_statuses(["alice", "player11"]) == {
+        "alice": "closed",
+        "player11": "open",
+    }
+
+
+def set_account_statuses(cache_path, first_player):
+    account_status_cache = AccountStatusCache(cache_path)
+    for player in range(first_player, first_player + 200):
+        account_status_cache.set_account_statuses({f"player{player}": "open"})
+
+
+def test_cache_is_shared_between_processes(tmp_path):
+    cache_path = str(tmp_path / "cache.sqlite3")
+    AccountStatusCache(cache_path).close()
+    processes = [
+        multiprocessing.Process(target=set_account_statuses, args=(cache_path, first))
+        for first in [0, 200]
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert [process.exitcode for process in processes] == [0, 0]
+    assert len(AccountStatusCache(cache_path)) == 400
@@ -0,0 +1,137 @@
+import pandas as pd
+import pytest
+
+from app import create_app
+from model import PlayerAnomalyDetectionModel
+from player_account_handler import PlayerAccountHandler
+from player_data_io import write_player_features
+
+
+@pytest.fixture
+def client(tmp_path):
+    model = PlayerAnomalyDetectionModel(PlayerAccountHandler())
+    model._threshold_table[1, 15] = 0.20
+    model.is_fitted = True
+    model_file_path = model.save_model("model", str(tmp_path))
+
+    player_features = pd.DataFrame(
+        {
+            "player": ["alice", "bob", "carol"],
+            "time_control": ["blitz", "blitz", "bullet"],
+            "number_of_games": [100, 100, 100],
+            "mean_perf_diff": [0.25, 0.05, 0.16],
+            "mean_rating": [1550.0, 1520.0, 1580.0],
+            "rating_bin": [1500, 1500, 1500],
+        }
+    ).set_index(["player", "time_control"])
+    player_features_file_path = str(tmp_path / "player_features.parquet")
+    write_player_features(player_features, player_features_file_path)
+
+    app = create_app(model_file_path, player_features_file_path)
+    return app.test_client()
+
+
+def test_score_players(client):
+    response = client.post(
+        "/score",
+        json={
+            "players": [
+                {"player": "carol", "time_control": "bullet"},
+                {"player": "alice", "time_control": "blitz"},
+                {"player": "bob", "time_control": "blitz"},
+                {"player": "dave", "time_control": "blitz"},
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    predictions = response.get_json()["predictions"]
+    assert predictions["player"] == ["carol", "alice", "bob", "dave"]
+    assert predictions["is_anomaly"] == [True, True, False, None]
+    assert predictions["threshold"] == [0.15, 0.20, 0.20, None]
+    assert predictions["margin"][1] == pytest.approx(0.05)
+    assert predictions["margin"][3] is None
+
+
+def test_score_features(client):
+    response = client.post(
+        "/score",
+        json={
+            "features": [
+                {
+                    "player": "erin",
+                    "time_control": "blitz",
+                    "mean_perf_diff": 0.19,
+                    "rating_bin": 1500,
+                },
+                {
+                    "player": "erin",
+                    "time_control": "other",
+                    "mean_perf_diff": 0.50,
+                    "rating_bin": 1500,
+                },
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    predictions = response.get_json()["predictions"]
+    assert predictions["is_anomaly"] == [False, None]
+    assert predictions["margin"][0] == pytest.approx(-0.01)
+
+
+def test_bad_requests(client):
+    assert client.post("/score", json={}).status_code == 400
+
+
+def test_bad_rating_bins_are_not_scored(client):
+    response = client.post(
+        "/score",
+        json={
+            "features": [
+                {
+                    "player": "erin",
+                    "time_control": "blitz",
+                    "mean_perf_diff": 0.19,
+                    "rating_bin": 1500,
+                },
+                {
+                    "player": "frank",
+                    "time_control": "blitz",
+                    "mean_perf_diff": 0.30,
+                    "rating_bin": 9000,
+                },
+                {
+                    "player": "grace",
+                    "time_control": "blitz",
+                    "mean_perf_diff": 0.30,
+                    "rating_bin": None,
+                },
+                {
+                    "player": "heidi",
+                    "time_control": "blitz",
+                    "mean_perf_diff": 0.30,
+                    "rating_bin": -100,
+                },
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    predictions = response.get_json()["predictions"]
+    assert predictions["is_anomaly"] == [False, None, None, None]
+    assert predictions["threshold"] == [0.20, None, None, None]
+    assert predictions["margin"][0] == pytest.approx(-0.01)
+    assert predictions["margin"][1:] == [None, None, None]
+
+
+def test_metrics(client):
+    for _ in range(3):
+        client.post(
+            "/score", json={"players": [{"player": "alice", "time_control": "blitz"}]}
+        )
+
+    metrics = client.get("/metrics").get_json()
+    assert metrics["number_of_requests"] == 3
+    assert metrics["number_of_rows"] == 3
+    assert 0 < metrics["p50_latency_ms"] <= metrics["p99_latency_ms"]
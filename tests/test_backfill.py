@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+import time
+import pytest
+import requests
+
+import download_and_preprocess
+from backfill import backfill, get_months
+from download_and_preprocess import download_data, download_file
+from player_data_io import read_player_features
+
+
+def test_download_file_resumes_with_range_requests(database_server, monkeypatch):
+    ## the blocks read before the connection dropped are kept
+    monkeypatch.setattr(download_and_preprocess, "DOWNLOAD_BLOCK_SIZE", 2**12)
+    file_name = "lichess_db_standard_rated_2024-01.pgn.zst"
+    body = database_server.files[file_name]
+    database_server.truncated_responses = 2
+
+    number_of_bytes = download_file(
+        f"{database_server.url}/{file_name}",
+        file_name,
+        hashlib.sha256(body).hexdigest(),
+    )
+
+    assert number_of_bytes == len(body)
+    with open(file_name, "rb") as f:
+        assert f.read() == body
+    assert not os.path.exists(f"{file_name}.part")
+    ranges = [file_range for _, file_range in database_server.requests]
+    assert ranges[0] is None
+    assert ranges[1] == f"bytes={len(body) // 2 // 2**12 * 2**12}-"
+    assert len(ranges) == 3
+
+
+def test_download_data_rejects_a_bad_checksum(database_server):
+    file_name = "lichess_db_standard_rated_2024-01.pgn.zst"
+    with pytest.raises(ValueError, match="sha256"):
+        download_data(
+            2024,
+            1,
+            "lichess-open-database",
+            database_url=database_server.url,
+            sha256sums={file_name: "0" * 64},
+        )
+    assert os.listdir("lichess_downloaded_games") == []
+
+
+def test_backfill_downloads_and_preprocesses_each_month(database_server, monkeypatch):
+    ## no month may ask for confirmation
+    monkeypatch.setattr("builtins.input", pytest.fail)
+    assert get_months("2023-12", "2024-02") == [(2023, 12), (2024, 1), (2024, 2)]
+
+    filenames = backfill(
+        "2024-01",
+        "2024-02",
+        max_concurrent_downloads=2,
+        remove_raw_files=True,
+        database_url=database_server.url,
+        write_metrics=False,
+    )
+
+    assert filenames == [
+        "lichess_db_standard_rated_2024-01.pgn.zst",
+        "lichess_db_standard_rated_2024-02.pgn.zst",
+    ]
+    for month in ["2024-01", "2024-02"]:
+        player_features = read_player_features(
+            f"lichess_player_data/lichess_db_standard_rated_{month}_player_features.csv"
+        )
+        assert len(player_features) > 0
+    assert os.listdir("lichess_downloaded_games") == []
+
+    ## months that were backfilled are not downloaded again
+    database_server.requests.clear()
+    assert backfill(
+        "2024-01", "2024-02", database_url=database_server.url, write_metrics=False
+    ) == []
+    assert database_server.requests == []
+
+
+def test_backfill_stops_running_downloads_when_a_month_fails(database_server, monkeypatch):
+    monkeypatch.setattr(download_and_preprocess, "DOWNLOAD_BLOCK_SIZE", 2**12)
+    ## the first month fails while the second one is still being downloaded
+    del database_server.files["lichess_db_standard_rated_2024-01.pgn.zst"]
+    file_name = "lichess_db_standard_rated_2024-02.pgn.zst"
+    body = database_server.files[file_name]
+    database_server.block_delay_seconds = 0.1
+
+    start_time = time.perf_counter()
+    with pytest.raises(requests.HTTPError):
+        backfill(
+            "2024-01",
+            "2024-02",
+            max_concurrent_downloads=2,
+            database_url=database_server.url,
+            write_metrics=False,
+        )
+    assert time.perf_counter() - start_time < len(body) / 2**12 * 0.1 / 2
+
+    ## the download of the second month stops after its current block, and can be resumed
+    deadline = time.perf_counter() + 5
+    while any(
+        thread.name.startswith("ThreadPoolExecutor") for thread in threading.enumerate()
+    ):
+        assert time.perf_counter() < deadline
+        time.sleep(0.05)
+    file_path = f"lichess_downloaded_games/{file_name}"
+    assert not os.path.exists(file_path)
+    if os.path.exists(f"{file_path}.part"):
+        assert os.path.getsize(f"{file_path}.part") < len(body)
@@ -0,0 +1,76 @@
+from array import array
+from collections import Counter
+import pytest
+from pandas.testing import assert_frame_equal
+from benchmarks.synthetic_pgn import write_synthetic_pgn
+from game_count_sketch import GameCountSketch, get_key_hash
+from make_player_features import MIN_GAMES, make_player_features
+from parse_pgn import parse_pgn
+from pipeline_metrics import PipelineMetrics
+
+
+@pytest.mark.parametrize("width", [2**4, 2**16])
+def test_estimates_are_never_below_the_game_counts(width):
+    game_counts = Counter({f"player{i}": i for i in range(1, 300)})
+    sketch = GameCountSketch(width=width)
+    sketch.add_hashes(
+        array(
+            "Q",
+            [
+                get_key_hash(player, "blitz")
+                for player, count in game_counts.items()
+                for _ in range(count)
+            ],
+        )
+    )
+    for player, count in game_counts.items():
+        assert sketch.estimate(player, "blitz") >= min(count, 255)
+        assert sketch.may_reach_min_games(player, "blitz") or count < MIN_GAMES
+    ## with enough counters, there are no collisions
+    if width == 2**16:
+        assert all(
+            sketch.estimate(player, "blitz") == min(count, 255)
+            for player, count in game_counts.items()
+        )
+    assert sketch.estimate("player1", "bullet") <= sketch.estimate("player1", "blitz")
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_min_games_prefilter_gives_the_same_player_features(tmp_path, monkeypatch, n_jobs):
+    monkeypatch.chdir(tmp_path)
+    ## about 48 games per player over several time controls, so most (player, time control) have fewer than MIN_GAMES games
+    write_synthetic_pgn("synthetic.pgn.zst", 6000, number_of_players=250)
+
+    all_player_games_df = parse_pgn(
+        "synthetic.pgn.zst", headers_only=True, n_jobs=n_jobs, write_output=False
+    )
+    metrics = PipelineMetrics()
+    prefiltered_player_games_df = parse_pgn(
+        "synthetic.pgn.zst",
+        headers_only=True,
+        n_jobs=n_jobs,
+        write_output=False,
+        metrics=metrics,
+        min_games_prefilter=True,
+    )
+
+    stages = metrics.to_dict()["stages"]
+    assert (
+        stages["count_player_games"]["counts"]["games"]
+        == stages["parse_pgn"]["counts"]["games_parsed"]
+    )
+    assert len(prefiltered_player_games_df) < len(all_player_games_df) / 2
+    all_player_features = make_player_features(
+        "synthetic.csv", all_player_games_df=all_player_games_df, write_output=False
+    )
+    assert len(all_player_features) > 0
+    assert_frame_equal(
+        make_player_features(
+            "synthetic.csv",
+            all_player_games_df=prefiltered_player_games_df,
+            write_output=False,
+        ),
+        all_player_features,
+        ## only the unused player categories differ
+        check_categorical=False,
+    )
@@ -0,0 +1,69 @@
+import os
+import pytest
+from pandas.testing import assert_frame_equal
+
+import http_stream
+from download_and_preprocess import stream_and_preprocess_data
+from parse_pgn import parse_pgn
+from pipeline_metrics import PipelineMetrics
+from player_data_io import read_player_features
+
+FILE_NAME = "lichess_db_standard_rated_2024-01.pgn.zst"
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_parse_pgn_streams_a_url(database_server, monkeypatch, n_jobs):
+    ## small blocks, so the stream is resumed after the connection drops
+    monkeypatch.setattr(http_stream, "STREAM_BLOCK_SIZE", 2**12)
+    monkeypatch.setattr(http_stream, "STREAM_QUEUE_SIZE", 2)
+    database_server.truncated_responses = 1
+    body = database_server.files[FILE_NAME]
+
+    metrics = PipelineMetrics()
+    all_player_games_df = parse_pgn(
+        f"{database_server.url}/{FILE_NAME}",
+        headers_only=True,
+        n_jobs=n_jobs,
+        metrics=metrics,
+        write_output=False,
+        tee_file_path=FILE_NAME,
+    )
+
+    ## the teed file is the downloaded file, and parsing it gives the same games
+    with open(FILE_NAME, "rb") as f:
+        assert f.read() == body
+    assert database_server.requests[1][1] is not None
+    assert metrics.to_dict()["stages"]["parse_pgn"]["counts"]["input_bytes"] == len(body)
+    assert_frame_equal(
+        all_player_games_df,
+        parse_pgn(FILE_NAME, headers_only=True, write_output=False),
+    )
+
+
+def test_parse_pgn_stream_rejects_a_bad_checksum(database_server):
+    with pytest.raises(ValueError, match="sha256"):
+        parse_pgn(
+            f"{database_server.url}/{FILE_NAME}",
+            headers_only=True,
+            write_output=False,
+            tee_file_path=FILE_NAME,
+            expected_sha256="0" * 64,
+        )
+    assert not os.path.exists(FILE_NAME)
+    assert not os.path.exists(f"{FILE_NAME}.part")
+
+
+def test_stream_and_preprocess_data_writes_no_raw_files(database_server):
+    stream_and_preprocess_data(
+        2024,
+        1,
+        "lichess-open-database",
+        remove_raw_files=True,
+        database_url=database_server.url,
+    )
+    assert not os.path.exists("lichess_downloaded_games")
+    assert len(
+        read_player_features(
+            "lichess_player_data/lichess_db_standard_rated_2024-01_player_features.csv"
+        )
+    ) > 0
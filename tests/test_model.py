@@ -1,13 +1,22 @@
 import copy
+import os
+import tempfile
 import unittest
+import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
 import pytest
 from unittest import mock
-from model import PlayerAnomalyDetectionModel
+from model import PlayerAnomalyDetectionModel, search_thresholds
 from player_account_handler import PlayerAccountHandler
 
 
+## every fit saves its threshold curves to the model_plots directory
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
 # fixture for sample training data
 @pytest.fixture(scope="class")
 def get_sample_train_data():
@@ -151,7 +160,226 @@ class TestPlayerAnomalyDetectionModel(unittest.TestCase):
         assert_frame_equal(expected_predictions, test_predictions)
 
     def test_save_model(self):
-        pass
+        self.model._player_account_handler._account_statuses = {
+            f"test_player{i}": "open" for i in range(1, 6 + 1)
+        }
+        self.model.fit(self.sample_train_data, generate_plots=False)
+        with tempfile.TemporaryDirectory() as saved_models_folder:
+            model_file_path = self.model.save_model("model", saved_models_folder)
+            assert model_file_path == f"{saved_models_folder}/model.model"
+
+            ## an existing model is not overwritten
+            assert (
+                self.model.save_model("model", saved_models_folder)
+                == f"{saved_models_folder}/model_.model"
+            )
 
     def test_load_model(self):
-        pass
+        self.model._player_account_handler._account_statuses = {
+            f"test_player{i}": "open" for i in range(1, 12 + 1)
+        }
+        self.model._player_account_handler._account_statuses["test_player3"] = (
+            "tosViolation"
+        )
+        self.model.fit(self.sample_train_data, generate_plots=False)
+        with tempfile.TemporaryDirectory() as saved_models_folder:
+            model_file_path = self.model.save_model("model", saved_models_folder)
+            loaded_model = PlayerAnomalyDetectionModel(PlayerAccountHandler())
+            loaded_model.load_model(model_file_path)
+
+            assert loaded_model.is_fitted
+            assert loaded_model._thresholds == self.model._thresholds
+            assert loaded_model._threshold_metrics == self.model._threshold_metrics
+            assert not loaded_model._threshold_table.flags.writeable
+            loaded_model._player_account_handler._account_statuses = (
+                self.model._player_account_handler._account_statuses
+            )
+            assert_frame_equal(
+                loaded_model.predict(self.sample_test_data),
+                self.model.predict(self.sample_test_data),
+            )
+
+            ## a corrupted model file fails the checksum
+            with open(model_file_path, "r+b") as f:
+                f.seek(-1, os.SEEK_END)
+                f.write(b"\1")
+            del loaded_model
+            with pytest.raises(ValueError):
+                PlayerAnomalyDetectionModel(PlayerAccountHandler()).load_model(
+                    model_file_path
+                )
+
+
+def test_search_thresholds_matches_brute_force():
+    random_generator = np.random.default_rng(0)
+    mean_perf_diffs = np.round(random_generator.normal(0.1, 0.1, 500), 2)
+    scores = random_generator.choice([0, 0.75, 1], 500, p=[0.8, 0.1, 0.1])
+    min_threshold = 0.05
+
+    threshold_curve = search_thresholds(mean_perf_diffs, scores, min_threshold)
+
+    candidate_thresholds = [min_threshold] + sorted(
+        set(mean_perf_diffs[mean_perf_diffs > min_threshold])
+    )
+    expected_curve = []
+    for threshold in candidate_thresholds:
+        is_flagged = mean_perf_diffs > threshold
+        if is_flagged.sum() == 0:
+            continue
+        accuracy = scores[is_flagged].mean()
+        expected_curve.append(
+            (threshold, accuracy, np.log(is_flagged.sum() + 1) * accuracy, is_flagged.sum())
+        )
+
+    expected_curve = np.array(expected_curve)
+    assert np.allclose(threshold_curve.to_numpy(dtype=float), expected_curve)
+
+
+def test_predict_uses_threshold_table():
+    model = PlayerAnomalyDetectionModel(PlayerAccountHandler())
+    model._threshold_table[1, 15] = 0.20
+    model._player_account_handler._account_statuses = {"test_player1": "open"}
+    test_data = pd.DataFrame(
+        {
+            "player": ["test_player1", "test_player2", "test_player3", "test_player4"],
+            "time_control": ["blitz", "blitz", "bullet", "other"],
+            "mean_perf_diff": [0.19, 0.21, 0.19, 0.50],
+            "rating_bin": [1500, 1500, 1500, 1500],
+        }
+    )
+
+    predictions = model.predict(test_data)
+
+    ## time controls outside TimeControl.ALL are not predicted
+    assert predictions["is_anomaly"].tolist() == [False, True, True]
+    assert predictions["account_status"].tolist() == ["open", None, None]
+    assert model._thresholds[("blitz", "perf_delta_thresholds")]["1500-1600"] == 0.20
+
+    with pytest.raises(ValueError):
+        model.get_thresholds(test_data.assign(rating_bin=4000).iloc[:1])
+
+
+def test_fit_fetches_account_statuses_once(get_sample_train_data):
+    player_account_handler = mock.Mock(_account_statuses={"test_player6": "closed"})
+    model = PlayerAnomalyDetectionModel(player_account_handler, min_threshold=0.18)
+    model.fit(get_sample_train_data, generate_plots=False)
+
+    ## every player above min_threshold in any rating bin is fetched in a single call
+    player_account_handler.update_player_account_statuses.assert_called_once_with(
+        ["test_player5", "test_player6", "test_player4"]
+    )
+    assert model.fit_timings["number_of_candidate_players"] == 3
+    assert model._thresholds[("blitz", "perf_delta_thresholds")]["1500-1600"] == 0.19
+
+
+def test_parallel_fit_matches_serial_fit():
+    random_generator = np.random.default_rng(0)
+    number_of_players = 2000
+    train_data = pd.DataFrame(
+        {
+            "player": [f"test_player{i}" for i in range(number_of_players)],
+            "time_control": random_generator.choice(
+                ["bullet", "blitz", "rapid", "classical"], number_of_players
+            ),
+            "mean_perf_diff": np.round(
+                random_generator.normal(0.1, 0.1, number_of_players), 3
+            ),
+            "rating_bin": random_generator.integers(8, 25, number_of_players) * 100,
+        }
+    )
+    account_statuses = dict(
+        zip(
+            train_data["player"],
+            random_generator.choice(
+                ["open", "closed", "tosViolation"], number_of_players, p=[0.8, 0.1, 0.1]
+            ),
+        )
+    )
+
+    models = []
+    for n_jobs in [1, 2]:
+        player_account_handler = mock.Mock(_account_statuses=account_statuses)
+        model = PlayerAnomalyDetectionModel(player_account_handler)
+        model.fit(train_data, generate_plots=False, n_jobs=n_jobs)
+        models.append(model)
+
+    assert np.array_equal(models[0]._threshold_table, models[1]._threshold_table)
+    assert models[0]._threshold_metrics == models[1]._threshold_metrics
+
+
+def test_fit_saves_threshold_curves(get_sample_train_data, tmp_path, monkeypatch):
+    import plotly.io as pio
+    from model_plots import get_model_threshold_figure
+    from player_data_io import read_threshold_curves
+
+    monkeypatch.chdir(tmp_path)
+    player_account_handler = mock.Mock(
+        _account_statuses={"test_player3": "tosViolation", "test_player6": "closed"}
+    )
+    model = PlayerAnomalyDetectionModel(player_account_handler)
+    model.fit(get_sample_train_data, base_file_name="sample")
+    assert model.wait_for_plots(timeout=120) == 0
+
+    threshold_curves = read_threshold_curves(
+        "model_plots/sample_threshold_curves.parquet"
+    )
+    blitz_curve = model._threshold_curves[("blitz", "perf_delta_thresholds")][
+        "1500-1600"
+    ]
+    assert np.allclose(
+        threshold_curves.loc[
+            threshold_curves["time_control"] == "blitz", "metric"
+        ].to_numpy(),
+        blitz_curve["metric"].to_numpy(),
+    )
+
+    ## plots are rendered from the threshold curves, and are written as plotly json
+    fig = pio.read_json("model_plots/sample_model_thresholds_blitz_1500-1600.json")
+    assert list(fig.data[0].x) == blitz_curve["threshold"].tolist()
+    fig = get_model_threshold_figure(
+        "model_plots/sample_threshold_curves.parquet", "bullet", 1600
+    )
+    assert "bullet: Rating Bin 1600-1700" in fig.layout.title.text
+
+
+def test_plots_are_only_rendered_when_wanted(get_sample_train_data, monkeypatch, capsys):
+    import subprocess
+    import sys
+
+    player_account_handler = mock.Mock(_account_statuses={"test_player6": "closed"})
+    model = PlayerAnomalyDetectionModel(player_account_handler)
+    model.fit(get_sample_train_data, generate_plots=False, base_file_name="sample")
+    assert os.path.exists("model_plots/sample_threshold_curves.parquet")
+    assert model.wait_for_plots() is None
+
+    ## a plot process that fails is reported when it is waited for
+    popen = subprocess.Popen
+    monkeypatch.setattr(
+        "model.subprocess.Popen",
+        lambda args: popen([sys.executable, "-c", "raise SystemExit(3)"]),
+    )
+    model = PlayerAnomalyDetectionModel(player_account_handler)
+    model.fit(get_sample_train_data, base_file_name="sample")
+    assert model.wait_for_plots(timeout=120) == 3
+    assert "exit status 3" in capsys.readouterr().out
+
+
+def test_scoring_does_not_import_plotting_modules():
+    import subprocess
+    import sys
+
+    ## run in a fresh process, since other tests import these modules
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, model, player_account_handler; "
+            "model.PlayerAnomalyDetectionModel(player_account_handler.PlayerAccountHandler()); "
+            "print([m for m in ['plotly', 'tqdm', 'lichess'] if m in sys.modules])",
+        ],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output.strip() == "[]"
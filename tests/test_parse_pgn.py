@@ -0,0 +1,256 @@
+import io
+import os
+import chess.pgn
+import pytest
+import pyzstd
+from pandas.testing import assert_frame_equal
+from benchmarks.synthetic_pgn import write_synthetic_pgn
+import parse_pgn
+from parse_pgn import (
+    get_skip_reason,
+    iter_game_chunks,
+    open_pgn,
+    parse_games,
+    parse_games_parallel,
+    read_game_headers,
+)
+from player_info_accumulator import PlayerInfoAccumulator
+
+
+SAMPLE_PGN = """[Event "Rated Bullet game"]
+[Site "https://lichess.org/aaaaaaaa"]
+[White "player1"]
+[Black "player2"]
+[Result "1-0"]
+[WhiteElo "1500"]
+[BlackElo "1620"]
+[WhiteRatingDiff "+12"]
+[BlackRatingDiff "-12"]
+[TimeControl "60+0"]
+
+1. e4 { [%clk 0:01:00] } 1... e5 { [%clk 0:01:00] } 2. Qh5?! Nc6 3. Bc4 Nf6?? 4. Qxf7# 1-0
+
+[Event "Rated Bullet game"]
+[Site "https://lichess.org/bbbbbbbb"]
+[White "player2"]
+[Black "player1"]
+[Result "1/2-1/2"]
+[WhiteElo "1608"]
+[BlackElo "1512"]
+[WhiteRatingDiff "-3"]
+[BlackRatingDiff "+3"]
+[TimeControl "0+1"]
+
+1. d4 { a comment
+
+spanning an empty line } 1... d5 1/2-1/2
+
+% an escaped line between games
+[Event "Rated Blitz game"]
+[Site "https://lichess.org/cccccccc"]
+[White "player3"]
+[Black "?"]
+[Result "0-1"]
+[WhiteElo "1700"]
+[BlackElo "?"]
+[TimeControl "180+0"]
+
+1. e4 ; a rest of line comment {
+1... c5 0-1
+
+[Event "Rated Rapid game"]
+[Site "https://lichess.org/dddddddd"]
+[White "player3"]
+[Black "player4"]
+[Result "0-1"]
+[WhiteElo "1700"]
+[BlackElo "1500"]
+[WhiteRatingDiff "-8"]
+[BlackRatingDiff "+8"]
+[TimeControl "600+5"]
+
+1. e4 c5 ( 1... e5 2. Nf3 ) 2. Nf3 0-1
+
+[Event "Rated Classical game"]
+[White "player4"]
+[Black "player3"]
+[Result "*"]
+[WhiteElo "1510"]
+[BlackElo "1690"]
+[WhiteRatingDiff "+0"]
+[BlackRatingDiff "+0"]
+[TimeControl "1800+0"]
+
+*
+
+"""
+
+
+def test_read_game_headers_matches_read_game():
+    pgn = io.BytesIO(SAMPLE_PGN.encode())
+    pgn_text = io.StringIO(SAMPLE_PGN)
+    while True:
+        game = chess.pgn.read_game(pgn_text)
+        headers = read_game_headers(pgn)
+        if game is None:
+            assert headers is None
+            break
+        assert dict(game.headers) == headers
+
+
+@pytest.mark.parametrize("pgn_text", [SAMPLE_PGN, SAMPLE_PGN.replace("\n", "\r\n")])
+def test_parse_games_headers_only_matches_read_game(pgn_text):
+    all_player_info = PlayerInfoAccumulator()
+    all_player_info_headers_only = PlayerInfoAccumulator()
+    number_of_games = parse_games(
+        io.BytesIO(pgn_text.encode()), all_player_info, headers_only=False
+    )
+    number_of_games_headers_only = parse_games(
+        io.BytesIO(pgn_text.encode()), all_player_info_headers_only, headers_only=True
+    )
+    assert number_of_games == number_of_games_headers_only == 3
+    all_player_games_df = all_player_info.to_frame()
+    assert_frame_equal(all_player_games_df, all_player_info_headers_only.to_frame())
+
+    ## the first game of player1 in bullet is at a rating of exactly 1500 and is excluded
+    assert all_player_games_df.loc[("player1", "bullet"), "ratings"].tolist() == [1512.0]
+    assert ("player4", "rapid") not in all_player_games_df.index
+
+
+def test_parse_games_from_zst_matches_pgn(tmp_path):
+    pgn_file_path = tmp_path / "sample.pgn"
+    zst_file_path = tmp_path / "sample.pgn.zst"
+    pgn_file_path.write_bytes(SAMPLE_PGN.encode())
+    zst_file_path.write_bytes(pyzstd.compress(SAMPLE_PGN.encode()))
+
+    all_player_info, all_player_info_zst = PlayerInfoAccumulator(), PlayerInfoAccumulator()
+    with open_pgn(pgn_file_path) as pgn:
+        parse_games(pgn, all_player_info, headers_only=True)
+    with open_pgn(zst_file_path) as pgn:
+        parse_games(pgn, all_player_info_zst, headers_only=True)
+    assert_frame_equal(all_player_info.to_frame(), all_player_info_zst.to_frame())
+
+
+def test_iter_game_chunks_only_splits_between_games():
+    pgn_bytes = (SAMPLE_PGN * 3).encode()
+    chunks = list(iter_game_chunks(io.BytesIO(pgn_bytes), chunk_size=100))
+    assert len(chunks) > 1
+    assert b"".join(chunks) == pgn_bytes
+    assert all(chunk.startswith(b"[Event ") for chunk in chunks)
+
+
+@pytest.mark.parametrize("headers_only", [False, True])
+def test_parse_games_parallel_matches_parse_games(headers_only):
+    ## small chunks so that players have games at a rating of 1500 at the start of later chunks
+    pgn_bytes = (SAMPLE_PGN * 5).encode()
+    all_player_info, all_player_info_parallel = (
+        PlayerInfoAccumulator(),
+        PlayerInfoAccumulator(),
+    )
+    skipped_games, skipped_games_parallel = {}, {}
+    number_of_games = parse_games(
+        io.BytesIO(pgn_bytes), all_player_info, skipped_games=skipped_games
+    )
+    number_of_games_parallel = parse_games_parallel(
+        io.BytesIO(pgn_bytes),
+        all_player_info_parallel,
+        headers_only,
+        n_jobs=2,
+        chunk_size=500,
+        skipped_games=skipped_games_parallel,
+    )
+    assert number_of_games == number_of_games_parallel
+    assert skipped_games == skipped_games_parallel
+    assert_frame_equal(all_player_info.to_frame(), all_player_info_parallel.to_frame())
+
+
+def test_skipped_games_are_counted_by_reason():
+    skipped_games = {}
+    number_of_games = parse_games(
+        io.BytesIO(SAMPLE_PGN.encode()),
+        PlayerInfoAccumulator(),
+        headers_only=True,
+        skipped_games=skipped_games,
+    )
+    assert number_of_games == 3
+    assert skipped_games == {"unknown_player": 1, "unfinished_game": 1}
+    assert get_skip_reason({"White": "a", "Black": "b", "WhiteElo": "?"}) == "unknown_rating"
+    assert (
+        get_skip_reason({"White": "a", "Black": "b", "WhiteElo": "1500", "BlackElo": "1500"})
+        == "missing_rating_diff"
+    )
+
+
+@pytest.mark.parametrize("headers_only", [False, True])
+@pytest.mark.parametrize("file_name", ["synthetic.pgn", "synthetic.pgn.zst"])
+def test_parse_pgn_records_input_bytes(tmp_path, monkeypatch, file_name, headers_only):
+    monkeypatch.chdir(tmp_path)
+    write_synthetic_pgn(file_name, 200, number_of_players=20)
+    metrics = parse_pgn.PipelineMetrics()
+    all_player_games_df = parse_pgn.parse_pgn(
+        file_name,
+        headers_only=headers_only,
+        n_jobs=1,
+        metrics=metrics,
+        write_output=False,
+        checkpoint_file_path=None,
+    )
+    assert len(all_player_games_df) > 0
+    assert (
+        metrics.to_dict()["stages"]["parse_pgn"]["counts"]["input_bytes"]
+        == os.path.getsize(file_name)
+    )
+
+
+@pytest.mark.parametrize("min_games_prefilter", [False, True])
+@pytest.mark.parametrize("file_name", ["synthetic.pgn", "synthetic.pgn.zst"])
+def test_parse_pgn_resumes_from_checkpoint(
+    tmp_path, monkeypatch, file_name, min_games_prefilter
+):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(parse_pgn, "CHUNK_SIZE", 2**16)
+    write_synthetic_pgn(file_name, 3000, number_of_players=50)
+    expected_all_player_games_df = parse_pgn.parse_pgn(
+        file_name,
+        headers_only=True,
+        write_output=False,
+        min_games_prefilter=min_games_prefilter,
+    )
+
+    ## crash right after the third checkpoint is written
+    checkpoint_file_path = parse_pgn.get_checkpoint_file_path(file_name)
+    write_checkpoint = parse_pgn.write_checkpoint
+    checkpoints = []
+
+    def write_checkpoint_then_crash(checkpoint_file_path, checkpoint):
+        write_checkpoint(checkpoint_file_path, checkpoint)
+        checkpoints.append(checkpoint["number_of_games_parsed"])
+        if len(checkpoints) == 3:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(parse_pgn, "write_checkpoint", write_checkpoint_then_crash)
+    with pytest.raises(KeyboardInterrupt):
+        parse_pgn.parse_pgn(
+            file_name,
+            headers_only=True,
+            write_output=False,
+            checkpoint_file_path=checkpoint_file_path,
+            checkpoint_interval_seconds=0,
+            min_games_prefilter=min_games_prefilter,
+        )
+    monkeypatch.setattr(parse_pgn, "write_checkpoint", write_checkpoint)
+
+    metrics = parse_pgn.PipelineMetrics()
+    all_player_games_df = parse_pgn.parse_pgn(
+        file_name,
+        headers_only=True,
+        write_output=False,
+        metrics=metrics,
+        checkpoint_file_path=checkpoint_file_path,
+        min_games_prefilter=min_games_prefilter,
+    )
+    parse_pgn_stage = metrics.to_dict()["stages"]["parse_pgn"]
+    assert parse_pgn_stage["resumed_from_checkpoint"] == checkpoints[-1] > 0
+    assert parse_pgn_stage["counts"]["games"] == 3000
+    assert_frame_equal(all_player_games_df, expected_all_player_games_df)
+    assert not os.path.exists(checkpoint_file_path)
@@ -0,0 +1,101 @@
+import os
+import pytest
+from pandas.testing import assert_frame_equal
+from benchmarks.synthetic_pgn import write_synthetic_pgn
+from make_player_features import make_player_features
+from parse_pgn import parse_pgn
+from pipeline import get_output_file_paths, is_up_to_date, preprocess_pgn
+from pipeline_metrics import PipelineMetrics
+from player_data_io import read_player_features
+
+
+@pytest.fixture
+def pgn_file_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_synthetic_pgn("synthetic.pgn.zst", 6000, number_of_players=100)
+    return "synthetic.pgn.zst"
+
+
+@pytest.mark.parametrize("output_format", ["csv", "parquet"])
+def test_preprocess_pgn_matches_scripts(pgn_file_path, output_format):
+    all_player_features = preprocess_pgn(pgn_file_path, output_format=output_format)
+    assert not os.path.exists("lichess_player_data")
+
+    ## the scripts write the raw features and read them back
+    parse_pgn(pgn_file_path, headers_only=True, output_format=output_format)
+    raw_games_file_path, player_features_file_path = get_output_file_paths(
+        pgn_file_path, output_format
+    )
+    make_player_features(raw_games_file_path, output_format=output_format)
+
+    assert len(all_player_features) > 0
+    assert_frame_equal(
+        all_player_features.reset_index().astype(
+            {"player": str, "time_control": str}
+        ),
+        read_player_features(player_features_file_path).astype(
+            {"player": str, "time_control": str}
+        ),
+        check_dtype=False,
+        rtol=1e-5,
+    )
+
+
+def test_preprocess_pgn_skips_stages_that_are_up_to_date(pgn_file_path):
+    all_player_features = preprocess_pgn(
+        pgn_file_path, save_raw_games=True, save_player_features=True
+    )
+
+    metrics = PipelineMetrics()
+    cached_player_features = preprocess_pgn(
+        pgn_file_path, save_raw_games=True, save_player_features=True, metrics=metrics
+    )
+    stages = metrics.to_dict()["stages"]
+    assert list(stages) == ["make_player_features"]
+    assert "cached_file_path" in stages["make_player_features"]
+    assert_frame_equal(
+        all_player_features.reset_index().astype({"player": str, "time_control": str}),
+        cached_player_features.reset_index().astype({"player": str, "time_control": str}),
+        check_dtype=False,
+        rtol=1e-5,
+    )
+
+    ## the player features are remade from the saved raw features when they are older
+    _, player_features_file_path = get_output_file_paths(pgn_file_path)
+    os.utime(player_features_file_path, (0, 0))
+    metrics = PipelineMetrics()
+    preprocess_pgn(
+        pgn_file_path, save_raw_games=True, save_player_features=True, metrics=metrics
+    )
+    stages = metrics.to_dict()["stages"]
+    assert "cached_file_path" in stages["parse_pgn"]
+    assert "cached_file_path" not in stages["make_player_features"]
+
+    ## every stage runs again with force=True
+    metrics = PipelineMetrics()
+    preprocess_pgn(pgn_file_path, force=True, metrics=metrics)
+    assert metrics.to_dict()["stages"]["parse_pgn"]["counts"]["games"] == 6000
+
+
+def test_missing_and_url_inputs_are_never_up_to_date(pgn_file_path):
+    preprocess_pgn(pgn_file_path, save_player_features=True)
+    _, player_features_file_path = get_output_file_paths(pgn_file_path)
+    assert is_up_to_date(player_features_file_path, pgn_file_path)
+    assert not is_up_to_date(
+        player_features_file_path, "https://database.lichess.org/standard/synthetic.pgn.zst"
+    )
+
+    ## the player features are not read back once the pgn file they were made from is removed
+    os.remove(pgn_file_path)
+    assert not is_up_to_date(player_features_file_path, pgn_file_path)
+    metrics = PipelineMetrics()
+    with pytest.raises(FileNotFoundError):
+        preprocess_pgn(pgn_file_path, save_player_features=True, metrics=metrics)
+    assert "make_player_features" not in metrics.to_dict()["stages"]
+
+
+def test_preprocess_pgn_raises_when_a_stage_fails(tmp_path):
+    metrics = PipelineMetrics()
+    with pytest.raises(FileNotFoundError):
+        preprocess_pgn(str(tmp_path / "missing.pgn"), metrics=metrics)
+    assert metrics.to_dict()["stages"]["parse_pgn"]["status"] == "failed"
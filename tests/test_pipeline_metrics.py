@@ -0,0 +1,67 @@
+import json
+import pytest
+from benchmarks.synthetic_pgn import write_synthetic_pgn
+from parse_pgn import SKIP_REASONS, parse_pgn
+from pipeline_metrics import PipelineMetrics
+
+
+def test_stages_record_counts_rates_and_status(tmp_path):
+    metrics_file_path = tmp_path / "metrics" / "run.json"
+    metrics = PipelineMetrics(str(metrics_file_path))
+    with metrics.stage("outer"):
+        with metrics.stage("inner"):
+            metrics.add_counts(rows=10)
+            metrics.add_counts(rows=5)
+            metrics.set_values(skipped={"reason": 1})
+        metrics.set_counts(games=3)
+    with pytest.raises(ValueError):
+        with metrics.stage("failing"):
+            raise ValueError
+
+    stages = json.loads(metrics_file_path.read_text())["stages"]
+    assert [stages[name]["status"] for name in ["outer", "inner", "failing"]] == [
+        "completed",
+        "completed",
+        "failed",
+    ]
+    assert stages["inner"]["counts"] == {"rows": 15}
+    assert stages["inner"]["skipped"] == {"reason": 1}
+    assert stages["inner"]["rates"]["rows_per_second"] > 0
+    assert stages["outer"]["counts"] == {"games": 3}
+    assert stages["outer"]["seconds"] >= stages["inner"]["seconds"]
+    assert stages["outer"]["peak_rss_mb"] > 0
+
+    with pytest.raises(RuntimeError):
+        metrics.add_counts(rows=1)
+
+
+def test_parse_pgn_records_games_and_skipped_games(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_synthetic_pgn("synthetic.pgn", 30000, number_of_players=100)
+    metrics_file_path = tmp_path / "metrics.json"
+    metrics = PipelineMetrics(str(metrics_file_path), emit_interval_seconds=0)
+
+    ## the metrics file is written while parsing, every PROGRESS_INTERVAL games
+    emitted_counts = []
+    emit = metrics.emit
+
+    def record_emit():
+        emit()
+        emitted_counts.append(
+            json.loads(metrics_file_path.read_text())["stages"]["parse_pgn"]["counts"]
+        )
+
+    monkeypatch.setattr(metrics, "emit", record_emit)
+    parse_pgn("synthetic.pgn", headers_only=True, metrics=metrics)
+
+    parse_pgn_stage = metrics.to_dict()["stages"]["parse_pgn"]
+    counts = parse_pgn_stage["counts"]
+    assert counts["games"] == 30000
+    assert counts["games"] == counts["games_parsed"] + sum(
+        parse_pgn_stage["skipped_games"].values()
+    )
+    assert list(parse_pgn_stage["skipped_games"]) == SKIP_REASONS
+    assert all(count > 0 for count in parse_pgn_stage["skipped_games"].values())
+    assert {"games_parsed": 10000} in emitted_counts
+    assert counts["rows"] > 0
+    assert metrics.to_dict()["stages"]["write_raw_games"]["status"] == "completed"
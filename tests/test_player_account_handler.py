@@ -0,0 +1,131 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import pytest
+
+from account_status_cache import AccountStatusCache
+from player_account_handler import PlayerAccountHandler
+
+## stand-in for the lichess users, keyed by user id
+USERS = {
+    "alice": {"id": "alice", "username": "Alice"},
+    "bob": {"id": "bob", "username": "bob", "tosViolation": True},
+    "carol": {"id": "carol", "username": "Carol", "disabled": True},
+}
+
+
+class UsersRequestHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.server.requests.append(self.path)
+        if self.server.rate_limited_responses > 0:
+            self.server.rate_limited_responses -= 1
+            self.send_response(429)
+            self.end_headers()
+            return
+
+        user_ids = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        self.server.batches.append(user_ids.split(","))
+        self.send_json(
+            [USERS[user_id] for user_id in user_ids.split(",") if user_id in USERS]
+        )
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        user = USERS.get(self.path.rsplit("/", 1)[-1].lower())
+        if user is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_json(user)
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def users_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UsersRequestHandler)
+    server.requests, server.batches, server.rate_limited_responses = [], [], 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_api_base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+@mock.patch("lichess.api.time.sleep")
+def test_update_player_account_statuses(mock_sleep, users_server):
+    player_account_handler = PlayerAccountHandler(
+        api_base_url=get_api_base_url(users_server), batch_size=2
+    )
+    player_account_handler.update_player_account_statuses(
+        ["Alice", "BOB", "carol", "dave", "Alice"], print_progress=False
+    )
+
+    assert player_account_handler._account_statuses == {
+        "Alice": "open",
+        "BOB": "tosViolation",
+        "carol": "closed",
+        "dave": "not found",
+    }
+    assert users_server.requests == ["/api/users", "/api/users"]
+    assert users_server.batches == [["alice", "bob"], ["carol", "dave"]]
+
+    ## known account statuses are not requested again
+    player_account_handler.update_player_account_statuses(
+        ["alice", "Alice"], print_progress=False
+    )
+    assert users_server.batches[2:] == [["alice"]]
+
+
+@mock.patch("lichess.api.time.sleep")
+def test_update_player_account_statuses_waits_after_rate_limit(
+    mock_sleep, users_server
+):
+    users_server.rate_limited_responses = 1
+    player_account_handler = PlayerAccountHandler(
+        api_base_url=get_api_base_url(users_server)
+    )
+    player_account_handler.update_player_account_statuses(
+        ["alice"], print_progress=False
+    )
+
+    assert player_account_handler._account_statuses == {"alice": "open"}
+    assert len(users_server.requests) == 2
+    mock_sleep.assert_any_call(60)
+
+
+@mock.patch("lichess.api.time.sleep")
+def test_warm_account_status_cache_makes_no_requests(
+    mock_sleep, users_server, tmp_path
+):
+    for _ in range(2):
+        player_account_handler = PlayerAccountHandler(
+            api_base_url=get_api_base_url(users_server),
+            account_status_cache=AccountStatusCache(str(tmp_path / "cache.sqlite3")),
+        )
+        player_account_handler.update_player_account_statuses(
+            ["Alice", "bob", "dave"], print_progress=False
+        )
+        player_account_handler.update_player_account_status("carol")
+
+        assert player_account_handler._account_statuses == {
+            "Alice": "open",
+            "bob": "tosViolation",
+            "dave": "not found",
+            "carol": "closed",
+        }
+    assert users_server.requests == ["/api/users", "/api/user/carol"]
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+import pytest
+from player_data_io import (
+    read_player_features,
+    read_raw_games,
+    write_player_features,
+    write_raw_games,
+)
+
+
+@pytest.fixture
+def get_sample_raw_games():
+    return pd.DataFrame(
+        {
+            "ratings": [1510.0, 1520.0, 1700.0],
+            "opponent_ratings": [1500.0, 1480.0, 1650.0],
+            "actual_scores": [1.0, 0.5, 0.0],
+            "rating_gains": [6.0, 0.0, -7.0],
+            "increments": [1, 0, 1],
+        },
+        index=pd.MultiIndex.from_tuples(
+            [("player1", "blitz"), ("player1", "blitz"), ("player2", "bullet")],
+            names=["player", "time_control"],
+        ),
+    )
+
+
+@pytest.mark.parametrize("file_format", ["csv", "parquet"])
+def test_raw_games_round_trip(tmp_path, get_sample_raw_games, file_format):
+    file_path = tmp_path / f"sample.{file_format}"
+    write_raw_games(get_sample_raw_games, file_path)
+
+    all_player_games_df = read_raw_games(file_path)
+    assert all_player_games_df["ratings"].dtype == np.float32
+    assert all_player_games_df["increments"].dtype == np.int8
+    assert all_player_games_df.index.tolist() == get_sample_raw_games.index.tolist()
+    assert_frame_equal(
+        all_player_games_df.astype(np.float64).reset_index(drop=True),
+        get_sample_raw_games.astype(np.float64).reset_index(drop=True),
+    )
+
+    ## only the columns passed are read
+    all_player_games_df = read_raw_games(file_path, columns=["rating_gains"])
+    assert list(all_player_games_df.columns) == ["rating_gains"]
+    assert list(all_player_games_df.index.names) == ["player", "time_control"]
+
+
+def test_player_features_parquet_dtypes(tmp_path):
+    all_player_features = pd.DataFrame(
+        {
+            "number_of_games": [30, 40],
+            "mean_perf_diff": [0.1, -0.2],
+            "rating_bin": [1500, 1600],
+        },
+        index=pd.MultiIndex.from_tuples(
+            [("player1", "blitz"), ("player2", "bullet")],
+            names=["player", "time_control"],
+        ),
+    )
+    file_path = tmp_path / "sample_player_features.parquet"
+    write_player_features(all_player_features, file_path)
+
+    player_features = read_player_features(
+        file_path, columns=["player", "time_control", "mean_perf_diff"]
+    )
+    assert list(player_features.columns) == ["player", "time_control", "mean_perf_diff"]
+    assert player_features["player"].dtype == "category"
+    assert player_features["mean_perf_diff"].dtype == np.float32
@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal, assert_series_equal
+import pytest
+from unittest import mock
+from make_player_features import (
+    BYTES_PER_RAW_GAMES_ROW,
+    CHUNK_MEMORY_SHARE,
+    aggregate_player_features,
+    aggregate_player_features_in_chunks,
+)
+from player_data_io import read_raw_games, write_raw_games
+from player_feature_state import (
+    MAX_HISTOGRAM_RATING,
+    MIN_HISTOGRAM_RATING,
+    RATING_HISTOGRAM_BIN_WIDTH,
+    PlayerFeatureState,
+)
+
+
+def make_random_raw_games(number_of_games, seed):
+    random_generator = np.random.default_rng(seed)
+    ratings = random_generator.integers(1400, 1700, number_of_games).astype(float)
+    return pd.DataFrame(
+        {
+            "ratings": ratings,
+            "opponent_ratings": ratings
+            + random_generator.integers(-100, 100, number_of_games),
+            "actual_scores": random_generator.choice([0.0, 0.5, 1.0], number_of_games),
+            "rating_gains": random_generator.integers(-8, 8, number_of_games).astype(
+                float
+            ),
+            "increments": random_generator.integers(0, 2, number_of_games).astype(
+                float
+            ),
+        },
+        index=pd.MultiIndex.from_arrays(
+            [
+                random_generator.choice(
+                    [f"player{i}" for i in range(10)], number_of_games
+                ),
+                random_generator.choice(["bullet", "blitz"], number_of_games),
+            ],
+            names=["player", "time_control"],
+        ),
+    )
+
+
+def assert_player_features_match(player_features, expected_player_features, **kwargs):
+    """Every feature is exact except median_rating, which is found from a rating histogram."""
+    assert_frame_equal(
+        player_features.drop(columns="median_rating"),
+        expected_player_features.drop(columns="median_rating"),
+        **kwargs,
+    )
+    assert np.allclose(
+        player_features["median_rating"],
+        expected_player_features["median_rating"],
+        rtol=0,
+        atol=RATING_HISTOGRAM_BIN_WIDTH / 2,
+    )
+
+
+def test_merged_state_matches_aggregate_player_features(tmp_path):
+    months = [make_random_raw_games(400, seed) for seed in range(3)]
+    expected_player_features = aggregate_player_features(pd.concat(months))
+
+    for month_number, month in enumerate(months):
+        PlayerFeatureState.from_games(month).save(f"{tmp_path}/state_{month_number}")
+    state = PlayerFeatureState.merge(
+        [
+            PlayerFeatureState.load(f"{tmp_path}/state_{month_number}")
+            for month_number in range(len(months))
+        ]
+    )
+    player_features = state.to_player_features()
+
+    ## every (player, time control) only reaches the minimum number of games across months
+    assert (months[0].groupby(level=[0, 1]).size() < 30).all()
+    assert len(player_features) > 0
+    assert_player_features_match(player_features, expected_player_features)
+
+    ## the ratings span 300 points, so each (player, time control) has at most 30 histogram rows
+    number_of_keys = len(state.statistics)
+    assert len(state.rating_counts) <= number_of_keys * 300 // RATING_HISTOGRAM_BIN_WIDTH
+    assert len(state.rating_counts) < sum(len(month) for month in months) / 2
+    assert (
+        state.rating_counts.groupby(level=["player", "time_control"]).size()
+        <= (MAX_HISTOGRAM_RATING - MIN_HISTOGRAM_RATING) // RATING_HISTOGRAM_BIN_WIDTH
+    ).all()
+
+
+def test_states_with_exact_rating_counts_are_loaded_as_histograms(tmp_path):
+    month = make_random_raw_games(400, seed=4)
+    state = PlayerFeatureState.from_games(month)
+    ## the rating counts of older states have the number of games at each rating
+    state.rating_counts = month.groupby(
+        [
+            month.index.get_level_values("player"),
+            month.index.get_level_values("time_control"),
+            month["ratings"].rename("rating"),
+        ]
+    ).size().rename("number_of_games")
+    state.save(f"{tmp_path}/state")
+
+    loaded_state = PlayerFeatureState.load(f"{tmp_path}/state")
+    assert_series_equal(
+        loaded_state.rating_counts,
+        PlayerFeatureState.from_games(month).rating_counts,
+        check_index_type=False,
+    )
+
+
+@pytest.mark.parametrize("file_format", ["csv", "parquet"])
+def test_aggregate_player_features_in_chunks_matches_in_memory(tmp_path, file_format):
+    all_player_games_df = make_random_raw_games(2000, seed=3).sort_index()
+    file_path = tmp_path / f"sample.{file_format}"
+    write_raw_games(all_player_games_df, file_path)
+
+    ## about 100 rows per chunk
+    max_memory_mb = 100 * BYTES_PER_RAW_GAMES_ROW / CHUNK_MEMORY_SHARE / 2**20
+    with mock.patch.object(
+        PlayerFeatureState, "merge", wraps=PlayerFeatureState.merge
+    ) as merge:
+        player_features = aggregate_player_features_in_chunks(file_path, max_memory_mb)
+    ## the 20 (player, time control) appear in every chunk, so the chunk states are only folded
+    ## once they have as many rows as the partial aggregates, rather than after every chunk
+    assert merge.call_count <= 20 // 4
+    expected_player_features = aggregate_player_features(
+        read_raw_games(file_path).astype(np.float64)
+    )
+    assert_player_features_match(
+        player_features, expected_player_features, check_index_type=False
+    )
+
+
+def test_aggregate_player_features_in_chunks_enforces_max_memory_mb(tmp_path):
+    file_path = tmp_path / "sample.parquet"
+    write_raw_games(make_random_raw_games(2000, seed=3).sort_index(), file_path)
+
+    ## the partial aggregates of the 20 (player, time control) do not fit in this much memory
+    with pytest.raises(MemoryError, match="partial aggregates"):
+        aggregate_player_features_in_chunks(file_path, 20 * BYTES_PER_RAW_GAMES_ROW / 2**20)
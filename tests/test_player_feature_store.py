@@ -0,0 +1,112 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from player_data_io import read_player_features, write_player_features
+import player_feature_store
+from player_feature_store import PlayerFeatureStore, add_player_features_partition
+
+
+def make_player_features(players, time_controls, mean_perf_diffs):
+    return pd.DataFrame(
+        {
+            "player": players,
+            "time_control": time_controls,
+            "number_of_games": [100] * len(players),
+            "mean_perf_diff": mean_perf_diffs,
+            "mean_rating": [1500.0] * len(players),
+            "rating_bin": [1500] * len(players),
+        }
+    ).set_index(["player", "time_control"])
+
+
+def test_player_feature_store(tmp_path):
+    store_folder = str(tmp_path / "store")
+    months = {
+        "lichess_db_standard_rated_2015-01": make_player_features(
+            ["Carol", "alice", "Alicia", "bob", "alice"],
+            ["blitz", "blitz", "bullet", "rapid", "bullet"],
+            [0.1, 0.2, 0.3, 0.4, 0.5],
+        ),
+        "lichess_db_standard_rated_2015-02": make_player_features(
+            ["bob", "Alice"], ["rapid", "classical"], [0.6, 0.7]
+        ),
+    }
+    for month, player_features in months.items():
+        file_path = str(tmp_path / f"{month}_player_features.csv")
+        write_player_features(player_features, file_path)
+        add_player_features_partition(file_path, store_folder)
+    player_feature_store = PlayerFeatureStore(store_folder)
+    assert player_feature_store.partition_names == list(months)
+
+    ## players are matched case-insensitively, with every month oldest first
+    alice_features = player_feature_store.get_player_features("ALICE")
+    assert alice_features["partition"].tolist() == [
+        "lichess_db_standard_rated_2015-01",
+        "lichess_db_standard_rated_2015-01",
+        "lichess_db_standard_rated_2015-02",
+    ]
+    assert alice_features["player"].tolist() == ["alice", "alice", "Alice"]
+    assert alice_features["time_control"].tolist() == ["bullet", "blitz", "classical"]
+    assert np.allclose(alice_features["mean_perf_diff"], [0.5, 0.2, 0.7])
+
+    ## the features are the same as in the player features files
+    expected_features = read_player_features(
+        str(tmp_path / "lichess_db_standard_rated_2015-01_player_features.csv")
+    )
+    expected_features = expected_features[expected_features["player"] == "bob"]
+    bob_features = player_feature_store.get_player_features(
+        "bob", ["lichess_db_standard_rated_2015-01"]
+    )
+    for column in ["number_of_games", "mean_perf_diff", "mean_rating", "rating_bin"]:
+        assert np.allclose(bob_features[column], expected_features[column])
+
+    assert len(player_feature_store.get_player_features("dave")) == 0
+    prefix_features = player_feature_store.get_players_with_prefix(
+        "ali", "lichess_db_standard_rated_2015-01"
+    )
+    assert prefix_features["player"].tolist() == ["alice", "alice", "Alicia"]
+
+
+def test_empty_player_feature_store(tmp_path):
+    player_feature_store = PlayerFeatureStore(str(tmp_path / "store"))
+    assert player_feature_store.partition_names == []
+    assert len(player_feature_store.get_player_features("alice")) == 0
+
+
+def test_replacing_a_partition_keeps_the_old_one_until_the_new_one_is_in_place(
+    tmp_path, monkeypatch
+):
+    store_folder = str(tmp_path / "store")
+    file_path = str(tmp_path / "lichess_db_standard_rated_2015-01_player_features.csv")
+    write_player_features(make_player_features(["alice"], ["blitz"], [0.1]), file_path)
+    add_player_features_partition(file_path, store_folder)
+    write_player_features(make_player_features(["alice"], ["blitz"], [0.2]), file_path)
+
+    ## crash before the new partition is renamed into place
+    replace = os.replace
+
+    def replace_then_crash(source, destination):
+        if ".tmp" in source:
+            raise KeyboardInterrupt
+        replace(source, destination)
+
+    monkeypatch.setattr(player_feature_store.os, "replace", replace_then_crash)
+    with pytest.raises(KeyboardInterrupt):
+        add_player_features_partition(file_path, store_folder)
+    ## the old partition is kept aside, and is still read
+    assert not os.path.exists(f"{store_folder}/lichess_db_standard_rated_2015-01")
+    assert PlayerFeatureStore(store_folder).partition_names == [
+        "lichess_db_standard_rated_2015-01"
+    ]
+    assert PlayerFeatureStore(store_folder).get_player_features(
+        "alice", ["lichess_db_standard_rated_2015-01"]
+    )["mean_perf_diff"].tolist() == pytest.approx([0.1])
+
+    monkeypatch.setattr(player_feature_store.os, "replace", replace)
+    add_player_features_partition(file_path, store_folder)
+    assert os.listdir(store_folder) == ["lichess_db_standard_rated_2015-01"]
+    assert PlayerFeatureStore(store_folder).get_player_features("alice")[
+        "mean_perf_diff"
+    ].tolist() == pytest.approx([0.2])
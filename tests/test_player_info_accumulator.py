@@ -0,0 +1,91 @@
+import random
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from player_info_accumulator import PLAYER_INFO_FIELDS, PlayerInfoAccumulator
+
+
+def make_random_games(number_of_games, seed=0):
+    random_generator = random.Random(seed)
+    return [
+        (
+            f"player{random_generator.randrange(20)}",
+            random_generator.choice(["bullet", "blitz", "rapid"]),
+            random_generator.choice([1500.0, 1490.0, 1510.0, 1620.0]),
+            random_generator.choice([1500.0, 1580.0]),
+            random_generator.choice([0, 0.5, 1]),
+            float(random_generator.randrange(-10, 10)),
+            random_generator.choice([0, 1]),
+        )
+        for _ in range(number_of_games)
+    ]
+
+
+def make_expected_frame(games):
+    """Builds the expected DataFrame with the dict of lists that parse_pgn used before PlayerInfoAccumulator."""
+    all_player_info = {}
+    for player, time_control, *values in games:
+        key = (player, time_control)
+        if key not in all_player_info:
+            if values[0] == 1500.0:
+                continue
+            all_player_info[key] = {field: [] for field in PLAYER_INFO_FIELDS}
+        for field, value in zip(PLAYER_INFO_FIELDS, values):
+            all_player_info[key][field].append(value)
+    expected_df = pd.DataFrame.from_dict(
+        all_player_info, orient="index", columns=PLAYER_INFO_FIELDS
+    ).explode(column=PLAYER_INFO_FIELDS)
+    expected_df.index = expected_df.index.set_names(["player", "time_control"])
+    return expected_df
+
+
+def test_to_frame_matches_dict_of_lists():
+    games = make_random_games(500)
+    all_player_info = PlayerInfoAccumulator()
+    for game in games:
+        all_player_info.add_game(*game)
+
+    all_player_games_df = all_player_info.to_frame()
+    assert len(all_player_info) == len(all_player_games_df)
+    expected_df = make_expected_frame(games)
+    assert all_player_games_df.index.tolist() == expected_df.index.tolist()
+    assert_frame_equal(
+        all_player_games_df.reset_index(drop=True),
+        expected_df.reset_index(drop=True).astype(all_player_games_df.dtypes),
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100])
+def test_merge_chunks_matches_single_accumulator(chunk_size):
+    games = make_random_games(500, seed=1)
+    all_player_info = PlayerInfoAccumulator()
+    for game in games:
+        all_player_info.add_game(*game)
+
+    merged_player_info = PlayerInfoAccumulator()
+    for start in range(0, len(games), chunk_size):
+        chunk_player_info = PlayerInfoAccumulator(keep_skipped_games=True)
+        for game in games[start : start + chunk_size]:
+            chunk_player_info.add_game(*game)
+        merged_player_info.merge(chunk_player_info)
+
+    assert_frame_equal(all_player_info.to_frame(), merged_player_info.to_frame())
+
+
+def test_empty_accumulator():
+    all_player_games_df = PlayerInfoAccumulator().to_frame()
+    assert all_player_games_df.empty
+    assert list(all_player_games_df.columns) == PLAYER_INFO_FIELDS
+
+
+def test_pickled_accumulator_continues_like_the_original():
+    import pickle
+
+    all_player_info = PlayerInfoAccumulator()
+    all_player_info.add_game("player1", "blitz", 1510.0, 1500.0, 1, 8.0, 0)
+    all_player_info.add_game("player2", "blitz", 1500.0, 1510.0, 0, -8.0, 0)
+    unpickled_player_info = pickle.loads(pickle.dumps(all_player_info))
+    for accumulator in [all_player_info, unpickled_player_info]:
+        accumulator.add_game("player2", "blitz", 1492.0, 1518.0, 1, 9.0, 1)
+        accumulator.add_game("player1", "bullet", 1600.0, 1400.0, 0.5, -2.0, 1)
+    assert_frame_equal(all_player_info.to_frame(), unpickled_player_info.to_frame())
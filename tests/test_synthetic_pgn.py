@@ -0,0 +1,36 @@
+from pandas.testing import assert_frame_equal
+from benchmarks.synthetic_pgn import generate_games, write_synthetic_pgn
+from parse_pgn import iter_game_headers, open_pgn, parse_games
+from player_info_accumulator import PlayerInfoAccumulator
+
+
+def test_generate_games_is_deterministic():
+    assert list(generate_games(200, seed=1)) == list(generate_games(200, seed=1))
+    assert list(generate_games(200, seed=1)) != list(generate_games(200, seed=2))
+
+
+def test_synthetic_games_are_parsed_like_lichess_games(tmp_path):
+    pgn_file_path = tmp_path / "synthetic.pgn.zst"
+    write_synthetic_pgn(pgn_file_path, 2000, number_of_players=40)
+
+    with open_pgn(pgn_file_path) as pgn:
+        headers = list(iter_game_headers(pgn, headers_only=True))
+    assert len(headers) == 2000
+    assert any(h["Black"] == "?" for h in headers)
+    assert any(h["WhiteElo"] == "?" for h in headers)
+    assert any("WhiteRatingDiff" not in h for h in headers)
+    assert any(h["Result"] == "*" for h in headers)
+    assert any(h["WhiteElo"] == "1500" for h in headers)
+
+    ## both parsers read the same games, and the skipped games are not counted
+    all_player_info = {}
+    for headers_only in [True, False]:
+        all_player_info[headers_only] = PlayerInfoAccumulator()
+        with open_pgn(pgn_file_path) as pgn:
+            number_of_games_parsed = parse_games(
+                pgn, all_player_info[headers_only], headers_only, print_progress=False
+            )
+        assert 1900 < number_of_games_parsed < 2000
+    assert_frame_equal(
+        all_player_info[True].to_frame(), all_player_info[False].to_frame()
+    )